@@ -0,0 +1,27 @@
+import frappe
+
+from frappe_sharepoint.controllers.file_controller import INTERNAL_DOCTYPES
+
+SETTINGS = "SharePoint Settings"
+
+
+def after_rename(doc, method, old, new, merge=False):
+	"""
+	Hook called after any document is renamed
+	Moves the document's SharePoint folder to its new name in the background
+	"""
+	if merge or doc.doctype in INTERNAL_DOCTYPES or doc.doctype == "File":
+		return
+
+	settings = frappe.get_cached_doc(SETTINGS)
+	if not settings.enable_file_sync:
+		return
+
+	frappe.enqueue(
+		"frappe_sharepoint.utils.folder_rename.move_document_folder",
+		queue="short",
+		enqueue_after_commit=True,
+		doctype=doc.doctype,
+		old=old,
+		new=new
+	)
@@ -2,7 +2,13 @@ import frappe
 from frappe import _
 import os
 
+from frappe_sharepoint.utils.job_routing import enqueue_file_upload
+from frappe_sharepoint.utils.sync_state import delete_sync_states
+from frappe_sharepoint.utils.upload_backlog import hold_upload, should_hold_upload
+
 SETTINGS = "SharePoint Settings"
+# The app's own reports are not synced to SharePoint
+INTERNAL_DOCTYPES = ("SharePoint Sync Audit", "SharePoint Profile")
 
 
 def file_upload(doc, method):
@@ -16,7 +22,7 @@ def file_upload(doc, method):
 	filepath = None
 
 	# Check if SharePoint sync is enabled and file hasn't been uploaded yet
-	if (doctype and docname and method == "after_insert" and 
+	if (doctype and docname and method == "after_insert" and doctype not in INTERNAL_DOCTYPES and
 		frappe.db.exists("DocType", SETTINGS) and is_file_uploaded == 0):
 		
 		settings = frappe.get_single(SETTINGS)
@@ -25,19 +31,28 @@ def file_upload(doc, method):
 		if settings.enable_file_sync:
 			filepath = get_file_path(doc)
 			
-			if filepath:
-				# Enqueue upload to background
-				frappe.enqueue(
-					"frappe_sharepoint.utils.sharepoint.trigger_sharepoint_upload",
-					queue="long",
+			if filepath and should_hold_upload(settings):
+				# The upload queues are full, a batch drainer queues it later
+				hold_upload(doc)
+			elif filepath:
+				# Enqueue upload on the queue and with the timeout that fit the file size
+				enqueue_file_upload(
 					doctype=doctype,
 					docname=docname,
 					filepath=filepath,
 					filedoc=doc.name,
-					timeout=-1
+					settings=settings
 				)
 
 
+def delete_sync_state(doc, method):
+	"""
+	Hook called before file deletion
+	Removes the File's Sync State, which links to it
+	"""
+	delete_sync_states([doc.name])
+
+
 def get_file_path(doc):
 	"""
 	Construct complete file path from File doc
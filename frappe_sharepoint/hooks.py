@@ -107,29 +107,35 @@ doctype_js = {
 doc_events = {
     "File":{
 		"after_insert": "frappe_sharepoint.controllers.file_controller.file_upload",
+		"on_trash": "frappe_sharepoint.controllers.file_controller.delete_sync_state",
+	},
+	"*": {
+		"after_rename": "frappe_sharepoint.controllers.document_controller.after_rename",
 	}
 }
 
 # Scheduled Tasks
 # ---------------
 
-# scheduler_events = {
-#	"all": [
-#		"frappe_m365.tasks.all"
-#	],
-#	"daily": [
-#		"frappe_m365.tasks.daily"
-#	],
-#	"hourly": [
-#		"frappe_m365.tasks.hourly"
-#	],
-#	"weekly": [
-#		"frappe_m365.tasks.weekly"
-#	],
-#	"monthly": [
-#		"frappe_m365.tasks.monthly"
-#	],
-# }
+scheduler_events = {
+	"cron": {
+		"* * * * *": [
+			"frappe_sharepoint.utils.job_routing.release_parked_uploads",
+			"frappe_sharepoint.utils.job_routing.release_deferred_uploads",
+			"frappe_sharepoint.utils.bulk_upload.release_deferred_bulk_uploads",
+			"frappe_sharepoint.utils.upload_backlog.drain_pending_uploads"
+		],
+		"*/15 * * * *": [
+			"frappe_sharepoint.utils.drive_mirror.reconcile_drive_items"
+		],
+		"*/5 * * * *": [
+			"frappe_sharepoint.utils.job_routing.requeue_stalled_uploads"
+		]
+	},
+	"hourly_long": [
+		"frappe_sharepoint.utils.tiered_storage.evict_cold_files"
+	]
+}
 
 # Testing
 # -------
@@ -5,6 +5,11 @@ frappe.ui.form.on('Expense Claim', {
 			frm.add_custom_button(__('Upload to SharePoint'), function() {
 				upload_to_sharepoint(frm);
 			}, __('SharePoint'));
+
+			// Large files go from the browser straight to SharePoint
+			frm.add_custom_button(__('Upload Large File'), function() {
+				frappe_sharepoint.upload_direct(frm);
+			}, __('SharePoint'));
 		}
 	}
 });
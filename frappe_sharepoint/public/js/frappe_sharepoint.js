@@ -1,5 +1,144 @@
 frappe.provide("frappe");
+frappe.provide("frappe_sharepoint");
 
 frappe.realtime.on("sharepoint_sync", function (output) {
     frappe.show_alert(output, 15);
-});
\ No newline at end of file
+});
+
+frappe.realtime.on("sharepoint_bulk_upload", function (progress) {
+    if (progress.done >= progress.total) {
+        frappe.hide_progress();
+        return;
+    }
+    frappe.show_progress(
+        __("Uploading {0} to SharePoint", [__(progress.doctype)]),
+        progress.done,
+        progress.total,
+        __("{0} uploaded, {1} failed", [progress.uploaded, progress.failed])
+    );
+});
+
+// Offer "Upload to SharePoint" in the Actions menu of every list view
+$(document).on("app_ready", function () {
+    if (!frappe.views || !frappe.views.ListView) {
+        return;
+    }
+    let get_actions_menu_items = frappe.views.ListView.prototype.get_actions_menu_items;
+    frappe.views.ListView.prototype.get_actions_menu_items = function () {
+        let items = get_actions_menu_items.apply(this, arguments);
+        let list_view = this;
+        items.push({
+            label: __("Upload to SharePoint"),
+            action: function () {
+                frappe_sharepoint.bulk_upload(list_view.doctype, list_view.get_checked_items(true));
+            },
+            standard: true
+        });
+        return items;
+    };
+});
+
+Object.assign(frappe_sharepoint, {
+    bulk_upload: function (doctype, names) {
+        frappe.confirm(
+            __("Upload {0} document(s) (PDF) and all their attachments to SharePoint?", [names.length]),
+            function () {
+                frappe.call({
+                    method: "frappe_sharepoint.utils.bulk_upload.enqueue_bulk_upload",
+                    args: { doctype: doctype, names: names },
+                    callback: function (r) {
+                        frappe.show_alert({
+                            message: r.message.deferred
+                                ? __("{0} document(s) will be uploaded to SharePoint in the next upload window", [r.message.queued])
+                                : __("{0} document(s) queued for upload to SharePoint", [r.message.queued]),
+                            indicator: "blue"
+                        }, 5);
+                    }
+                });
+            }
+        );
+    },
+
+    // Pick a file and upload it from the browser straight to SharePoint
+    upload_direct: function (frm) {
+        let input = document.createElement("input");
+        input.type = "file";
+        input.onchange = function () {
+            if (input.files.length) {
+                frappe_sharepoint.upload_file_direct(frm, input.files[0]);
+            }
+        };
+        input.click();
+    },
+
+    upload_file_direct: function (frm, file) {
+        frappe.call({
+            method: "frappe_sharepoint.utils.direct_upload.create_upload_session",
+            args: {
+                doctype: frm.doctype,
+                docname: frm.docname,
+                filename: file.name,
+                file_size: file.size
+            },
+            freeze: true,
+            freeze_message: __("Preparing upload to SharePoint...")
+        }).then(function (r) {
+            let session = r.message;
+            return frappe_sharepoint.upload_chunks(session, file).then(function (item) {
+                return frappe.call({
+                    method: "frappe_sharepoint.utils.direct_upload.complete_direct_upload",
+                    args: {
+                        session_id: session.session_id,
+                        item_id: item.id
+                    }
+                });
+            });
+        }).then(function () {
+            frappe.hide_progress();
+            frappe.show_alert({
+                message: __("{0} uploaded to SharePoint", [file.name]),
+                indicator: "green"
+            }, 5);
+            frm.reload_doc();
+        }).catch(function (error) {
+            frappe.hide_progress();
+            frappe.msgprint({
+                title: __("Upload Failed"),
+                message: (error && error.message) || __("Failed to upload to SharePoint"),
+                indicator: "red"
+            });
+        });
+    },
+
+    // PUT the file to the upload session one chunk at a time, resolves with the driveItem
+    upload_chunks: async function (session, file) {
+        let start = 0;
+        while (start < file.size) {
+            let end = Math.min(start + session.chunk_size, file.size);
+            frappe.show_progress(__("Uploading to SharePoint"), start, file.size, file.name);
+
+            let response = await fetch(session.upload_url, {
+                method: "PUT",
+                headers: {
+                    "Content-Range": `bytes ${start}-${end - 1}/${file.size}`
+                },
+                body: file.slice(start, end)
+            });
+
+            if (response.status === 200 || response.status === 201) {
+                return response.json();
+            }
+            if (response.status !== 202) {
+                // Abandon the session so the partial upload is discarded
+                fetch(session.upload_url, { method: "DELETE" });
+                throw new Error(__("SharePoint rejected the upload ({0})", [response.status]));
+            }
+
+            // Continue from the first range SharePoint has not received yet
+            let status = await response.json();
+            let next = (status.nextExpectedRanges || [])[0];
+            start = next ? parseInt(next.split("-")[0]) : end;
+        }
+        throw new Error(__("The upload to SharePoint did not complete"));
+    }
+});
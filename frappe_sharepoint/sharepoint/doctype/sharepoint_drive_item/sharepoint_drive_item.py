@@ -0,0 +1,14 @@
+# Copyright (c) 2024, Frappe Community and contributors
+# For license information, please see license.txt
+
+import frappe
+from frappe.model.document import Document
+
+class SharePointDriveItem(Document):
+	pass
+
+
+def on_doctype_update():
+	"""Indexes for folder lookups by parent and name"""
+	frappe.db.add_index("SharePoint Drive Item", ["drive_id", "parent_id", "item_name"])
+	frappe.db.add_index("SharePoint Drive Item", ["drive_id", "is_root"])
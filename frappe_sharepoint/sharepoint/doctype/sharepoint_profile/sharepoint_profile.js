@@ -0,0 +1,59 @@
+// Copyright (c) 2024, Frappe Community and contributors
+// For license information, please see license.txt
+
+frappe.ui.form.on('SharePoint Profile', {
+	refresh: function(frm) {
+		frm.add_custom_button(__('Compare With...'), function() {
+			frappe.prompt({
+				fieldname: 'other',
+				fieldtype: 'Link',
+				label: __('SharePoint Profile'),
+				options: 'SharePoint Profile',
+				reqd: 1,
+				get_query: () => ({ filters: { name: ['!=', frm.doc.name] } })
+			}, function(values) {
+				frm.call('compare', { other: values.other }).then((r) => {
+					show_comparison(r.message);
+				});
+			}, __('Compare Profiles'), __('Compare'));
+		});
+	}
+});
+
+function show_comparison(comparison) {
+	let [first, second] = comparison.profiles;
+	let seconds = (value) => flt(value, 3).toFixed(3);
+	let difference = (values) => {
+		let delta = flt(values[1]) - flt(values[0]);
+		return `${delta > 0 ? '+' : ''}${seconds(delta)}`;
+	};
+	let table = (headers, rows) => `
+		<table class="table table-bordered table-condensed">
+			<thead><tr>${headers.map((header) => `<th>${header}</th>`).join('')}</tr></thead>
+			<tbody>${rows.map((row) => `<tr>${row.map((cell) => `<td>${cell}</td>`).join('')}</tr>`).join('')}</tbody>
+		</table>`;
+
+	let phases = [[__('Total'), seconds(comparison.duration[0]), seconds(comparison.duration[1]), difference(comparison.duration)]]
+		.concat(comparison.phases.map((row) => [
+			__(row.phase), seconds(row.seconds[0]), seconds(row.seconds[1]), difference(row.seconds)
+		]));
+	let calls = comparison.graph.map((row) => [
+		`<code>${frappe.utils.escape_html(row.call)}</code>`,
+		`${row.stats[0].count} / ${seconds(row.stats[0].seconds)}`,
+		`${row.stats[1].count} / ${seconds(row.stats[1].seconds)}`,
+		difference([row.stats[0].seconds, row.stats[1].seconds])
+	]);
+
+	let dialog = new frappe.ui.Dialog({
+		title: __('{0} and {1}', [first, second]),
+		size: 'extra-large',
+		fields: [{ fieldname: 'comparison', fieldtype: 'HTML' }]
+	});
+	dialog.fields_dict.comparison.$wrapper.html(`
+		<h5>${__('Wall-clock seconds per phase')}</h5>
+		${table([__('Phase'), first, second, __('Difference')], phases)}
+		<h5>${__('Graph calls (count / seconds)')}</h5>
+		${table([__('Call'), first, second, __('Difference (s)')], calls)}
+	`);
+	dialog.show();
+}
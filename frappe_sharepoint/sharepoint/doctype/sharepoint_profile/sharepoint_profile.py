@@ -0,0 +1,13 @@
+# Copyright (c) 2024, Frappe Community and contributors
+# For license information, please see license.txt
+
+import frappe
+from frappe.model.document import Document
+
+class SharePointProfile(Document):
+	@frappe.whitelist()
+	def compare(self, other):
+		"""This profile and another one side by side"""
+		from frappe_sharepoint.utils.profiler import compare_profiles
+
+		return compare_profiles(self.name, other)
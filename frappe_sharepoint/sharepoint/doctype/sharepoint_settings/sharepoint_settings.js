@@ -16,9 +16,12 @@ frappe.ui.form.on('SharePoint Settings', {
 								indicator: 'green'
 							});
 						}
+						frappe_sharepoint.show_circuit_states(frm);
 					}
 				});
 			});
+			
+			frappe_sharepoint.show_circuit_states(frm);
 		}
 		
 		// Add Browse SharePoint Sites button
@@ -26,179 +29,249 @@ frappe.ui.form.on('SharePoint Settings', {
 			frm.add_custom_button(__('Browse SharePoint Sites'), function() {
 				frappe_sharepoint.browse_sites(frm);
 			});
+			
+			frm.add_custom_button(__('Run Sync Audit'), function() {
+				frappe.call({
+					method: 'frappe_sharepoint.utils.sync_audit.start_sync_audit',
+					callback: function(r) {
+						frappe.set_route('Form', 'SharePoint Sync Audit', r.message);
+					}
+				});
+			});
+			
+			// Add another document library as a drive route
+			frm.add_custom_button(__('Add Drive Route'), function() {
+				frappe_sharepoint.browse_sites(frm, function(site, drive) {
+					frm.add_child('drive_routes', {
+						site_id: site.id,
+						drive_id: drive.id,
+						drive_name: drive.name
+					});
+					frm.refresh_field('drive_routes');
+					frappe.show_alert({
+						message: __('Added {0} to Drive Routes, set what should be routed to it and save', [drive.name]),
+						indicator: 'blue'
+					});
+				});
+			});
 		}
 	}
 });
 
 // SharePoint Browser functionality
-frappe_sharepoint = {
-	browse_sites: function(frm) {
+frappe.provide("frappe_sharepoint");
+
+Object.assign(frappe_sharepoint, {
+	// Show open or half open circuit breakers above the form
+	show_circuit_states: function(frm) {
+		frm.call('get_circuit_states').then(r => {
+			let states = (r.message || []).filter(s => s.state !== 'Closed');
+			if (!states.length) {
+				frm.dashboard.clear_headline();
+				return;
+			}
+			let lines = states.map(s => {
+				let detail = s.state === 'Open'
+					? __('{0} failures, next attempt in {1}s', [s.failures, s.retry_in])
+					: __('{0} failures, probing', [s.failures]);
+				return `<div><b>${frappe.utils.escape_html(s.label)}</b>: ${__(s.state)} (${detail})</div>`;
+			});
+			frm.dashboard.set_headline_alert(
+				`<div>${__('SharePoint is unavailable, uploads are parked until it recovers')}</div>${lines.join('')}`,
+				states.some(s => s.state === 'Open') ? 'red' : 'orange'
+			);
+		});
+	},
+
+	browse_sites: function(frm, on_drive_selected, refresh) {
 		let selected_site = null;
-		let selected_drive = null;
-		let selected_folder = null;
+		let list = {method: 'get_sharepoint_sites', args: {}, items: [], next_page: null};
 		
 		// Step 1: Show sites selector
-		frappe.call({
-			method: 'get_sharepoint_sites',
-			doc: frm.doc,
-			callback: function(r) {
-				if (r.message && r.message.length > 0) {
-					let sites = r.message;
-					
-					let d = new frappe.ui.Dialog({
-						title: __('Select SharePoint Site'),
-						fields: [
-							{
-								fieldtype: 'HTML',
-								fieldname: 'sites_list',
-								options: frappe_sharepoint.render_sites_list(sites)
-							}
-						],
-						primary_action_label: __('Next'),
-						primary_action: function() {
-							if (!selected_site) {
-								frappe.msgprint(__('Please select a site'));
-								return;
-							}
-							d.hide();
-							frappe_sharepoint.browse_drives(frm, selected_site);
-						}
-					});
-					
-					d.show();
-					
-					// Attach click handlers
-					setTimeout(function() {
-						d.$wrapper.find('.site-item').on('click', function() {
-							d.$wrapper.find('.site-item').removeClass('selected');
-							$(this).addClass('selected');
-							selected_site = sites[$(this).data('index')];
-						});
-					}, 100);
-				} else {
-					frappe.msgprint(__('No SharePoint sites found in your tenant'));
-				}
+		frappe_sharepoint.load_page(frm, list, refresh).then(function() {
+			if (!list.items.length) {
+				frappe.msgprint(__('No SharePoint sites found in your tenant'));
+				return;
 			}
+			
+			let d = new frappe.ui.Dialog({
+				title: __('Select SharePoint Site'),
+				fields: [
+					{
+						fieldtype: 'HTML',
+						fieldname: 'sites_list'
+					}
+				],
+				primary_action_label: __('Next'),
+				primary_action: function() {
+					if (!selected_site) {
+						frappe.msgprint(__('Please select a site'));
+						return;
+					}
+					d.hide();
+					frappe_sharepoint.browse_drives(frm, selected_site, on_drive_selected);
+				}
+			});
+			
+			d.add_custom_action(__('Refresh'), function() {
+				d.hide();
+				frappe_sharepoint.browse_sites(frm, on_drive_selected, true);
+			});
+			d.show();
+			
+			frappe_sharepoint.render_picker(frm, d, 'sites_list', list, frappe_sharepoint.render_sites_list, function($item, site) {
+				d.$wrapper.find('.site-item').removeClass('selected');
+				$item.addClass('selected');
+				selected_site = site;
+			});
 		});
 	},
 	
-	browse_drives: function(frm, site) {
+	browse_drives: function(frm, site, on_drive_selected, refresh) {
 		let selected_drive = null;
+		let list = {method: 'get_site_drives', args: {site_id: site.id}, items: [], next_page: null};
 		
-		frappe.call({
-			method: 'get_site_drives',
-			doc: frm.doc,
-			args: {
-				site_id: site.id
-			},
-			callback: function(r) {
-				if (r.message && r.message.length > 0) {
-					let drives = r.message;
-					
-					let d = new frappe.ui.Dialog({
-						title: __('Select Document Library'),
-						fields: [
-							{
-								fieldtype: 'HTML',
-								fieldname: 'drives_list',
-								options: frappe_sharepoint.render_drives_list(drives)
-							}
-						],
-						primary_action_label: __('Next'),
-						primary_action: function() {
-							if (!selected_drive) {
-								frappe.msgprint(__('Please select a document library'));
-								return;
-							}
-							d.hide();
-							frappe_sharepoint.browse_folders(frm, site, selected_drive);
-						},
-						secondary_action_label: __('Back'),
-						secondary_action: function() {
-							d.hide();
-							frappe_sharepoint.browse_sites(frm);
-						}
-					});
-					
-					d.show();
-					
-					// Attach click handlers
-					setTimeout(function() {
-						d.$wrapper.find('.drive-item').on('click', function() {
-							d.$wrapper.find('.drive-item').removeClass('selected');
-							$(this).addClass('selected');
-							selected_drive = drives[$(this).data('index')];
-						});
-					}, 100);
-				} else {
-					frappe.msgprint(__('No document libraries found for this site'));
-				}
+		frappe_sharepoint.load_page(frm, list, refresh).then(function() {
+			if (!list.items.length) {
+				frappe.msgprint(__('No document libraries found for this site'));
+				return;
 			}
+			
+			let d = new frappe.ui.Dialog({
+				title: __('Select Document Library'),
+				fields: [
+					{
+						fieldtype: 'HTML',
+						fieldname: 'drives_list'
+					}
+				],
+				primary_action_label: __('Next'),
+				primary_action: function() {
+					if (!selected_drive) {
+						frappe.msgprint(__('Please select a document library'));
+						return;
+					}
+					d.hide();
+					if (on_drive_selected) {
+						on_drive_selected(site, selected_drive);
+					} else {
+						frappe_sharepoint.browse_folders(frm, site, selected_drive);
+					}
+				},
+				secondary_action_label: __('Back'),
+				secondary_action: function() {
+					d.hide();
+					frappe_sharepoint.browse_sites(frm, on_drive_selected);
+				}
+			});
+			
+			d.add_custom_action(__('Refresh'), function() {
+				d.hide();
+				frappe_sharepoint.browse_drives(frm, site, on_drive_selected, true);
+			});
+			d.show();
+			
+			frappe_sharepoint.render_picker(frm, d, 'drives_list', list, frappe_sharepoint.render_drives_list, function($item, drive) {
+				d.$wrapper.find('.drive-item').removeClass('selected');
+				$item.addClass('selected');
+				selected_drive = drive;
+			});
 		});
 	},
 	
-	browse_folders: function(frm, site, drive, current_path = null) {
-		let selected_folder = null;
-		
-		frappe.call({
+	browse_folders: function(frm, site, drive, current_path = null, refresh = false) {
+		let list = {
 			method: 'get_drive_folders',
-			doc: frm.doc,
-			args: {
-				drive_id: drive.id,
-				folder_path: current_path
-			},
-			callback: function(r) {
-				let folders = r.message || [];
-				
-				let d = new frappe.ui.Dialog({
-					title: __('Select Root Folder'),
-					fields: [
-						{
-							fieldtype: 'HTML',
-							fieldname: 'path_info',
-							options: `<div style="padding: 10px; background: #f8f9fa; border-radius: 4px; margin-bottom: 10px;">
-								<strong>Site:</strong> ${site.displayName}<br>
-								<strong>Library:</strong> ${drive.name}<br>
-								<strong>Current Path:</strong> ${current_path || '/'}<br>
-								<small class="text-muted">Click a folder to browse inside, or click "Select This Folder" to use current location</small>
-							</div>`
-						},
-						{
-							fieldtype: 'HTML',
-							fieldname: 'folders_list',
-							options: frappe_sharepoint.render_folders_list(folders)
-						}
-					],
-					primary_action_label: __('Select This Folder'),
-					primary_action: function() {
-						d.hide();
-						frappe_sharepoint.confirm_selection(frm, site, drive, current_path || '/');
+			args: {drive_id: drive.id, folder_path: current_path},
+			items: [],
+			next_page: null
+		};
+		
+		// Each level is fetched when it is opened
+		frappe_sharepoint.load_page(frm, list, refresh).then(function() {
+			let d = new frappe.ui.Dialog({
+				title: __('Select Root Folder'),
+				fields: [
+					{
+						fieldtype: 'HTML',
+						fieldname: 'path_info',
+						options: `<div style="padding: 10px; background: #f8f9fa; border-radius: 4px; margin-bottom: 10px;">
+							<strong>Site:</strong> ${site.displayName}<br>
+							<strong>Library:</strong> ${drive.name}<br>
+							<strong>Current Path:</strong> ${current_path || '/'}<br>
+							<small class="text-muted">Click a folder to browse inside, or click "Select This Folder" to use current location</small>
+						</div>`
 					},
-					secondary_action_label: __('Back'),
-					secondary_action: function() {
-						d.hide();
-						if (current_path && current_path !== '/') {
-							// Go up one level
-							let parent_path = current_path.substring(0, current_path.lastIndexOf('/')) || '/';
-							frappe_sharepoint.browse_folders(frm, site, drive, parent_path);
-						} else {
-							// Go back to drives selection
-							frappe_sharepoint.browse_drives(frm, site);
-						}
+					{
+						fieldtype: 'HTML',
+						fieldname: 'folders_list'
 					}
-				});
-				
-				d.show();
-				
-				// Attach click handlers for folders
-				setTimeout(function() {
-					d.$wrapper.find('.folder-item').on('click', function() {
-						let folder = folders[$(this).data('index')];
-						d.hide();
-						frappe_sharepoint.browse_folders(frm, site, drive, folder.path);
-					});
-				}, 100);
-			}
+				],
+				primary_action_label: __('Select This Folder'),
+				primary_action: function() {
+					d.hide();
+					frappe_sharepoint.confirm_selection(frm, site, drive, current_path || '/');
+				},
+				secondary_action_label: __('Back'),
+				secondary_action: function() {
+					d.hide();
+					if (current_path && current_path !== '/') {
+						// Go up one level
+						let parent_path = current_path.substring(0, current_path.lastIndexOf('/')) || '/';
+						frappe_sharepoint.browse_folders(frm, site, drive, parent_path);
+					} else {
+						// Go back to drives selection
+						frappe_sharepoint.browse_drives(frm, site);
+					}
+				}
+			});
+			
+			d.add_custom_action(__('Refresh'), function() {
+				d.hide();
+				frappe_sharepoint.browse_folders(frm, site, drive, current_path, true);
+			});
+			d.show();
+			
+			frappe_sharepoint.render_picker(frm, d, 'folders_list', list, frappe_sharepoint.render_folders_list, function($item, folder) {
+				d.hide();
+				frappe_sharepoint.browse_folders(frm, site, drive, folder.path);
+			});
+		});
+	},
+	
+	// Fetch the next page of a picker list and append it to list.items
+	load_page: function(frm, list, refresh) {
+		return frappe.call({
+			method: list.method,
+			doc: frm.doc,
+			args: Object.assign({
+				page_link: list.next_page,
+				refresh: refresh ? 1 : 0
+			}, list.args)
+		}).then(function(r) {
+			let page = r.message || {};
+			list.items = list.items.concat(page.items || []);
+			list.next_page = page.next_page || null;
+		});
+	},
+	
+	// Render a picker list with a "Load More" button while Graph has further pages
+	render_picker: function(frm, d, fieldname, list, render_list, on_click) {
+		let $wrapper = d.fields_dict[fieldname].$wrapper;
+		$wrapper.html(render_list(list.items) + (list.next_page
+			? `<div style="text-align: center; margin-top: 8px;">
+				<button class="btn btn-default btn-xs load-more">${__('Load More')}</button>
+			</div>`
+			: ''));
+		
+		$wrapper.find('[data-index]').on('click', function() {
+			on_click($(this), list.items[$(this).data('index')]);
+		});
+		$wrapper.find('.load-more').on('click', function() {
+			$(this).prop('disabled', true);
+			frappe_sharepoint.load_page(frm, list).then(function() {
+				frappe_sharepoint.render_picker(frm, d, fieldname, list, render_list, on_click);
+			});
 		});
 	},
 	
@@ -337,4 +410,4 @@ frappe_sharepoint = {
 		
 		return html;
 	}
-};
+});
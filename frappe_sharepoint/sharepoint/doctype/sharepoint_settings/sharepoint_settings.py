@@ -4,11 +4,26 @@
 import frappe
 from frappe import _
 from frappe.model.document import Document
+from frappe.utils import cint
+from urllib.parse import quote
+import hashlib
+
+# Picker pages are cached briefly, the Refresh action bypasses the cache
+BROWSER_CACHE_TTL = 5 * 60
+BROWSER_PAGE_SIZE = 50
 
 class SharePointSettings(Document):
 	def validate(self):
 		"""Validate settings before saving"""
 		self.validate_root_folder_path()
+		self.validate_folder_template()
+		self.validate_drive_routes()
+		
+		if self.replace_file_link and self.enable_tiered_storage:
+			frappe.throw(
+				_("Tiered Storage keeps files locally and evicts them later, it cannot be combined with Replace File Link"),
+				title=_("Invalid Settings")
+			)
 	
 	def validate_root_folder_path(self):
 		"""Validate and sanitize root folder path"""
@@ -49,6 +64,37 @@ class SharePointSettings(Document):
 						title=_("Invalid Path")
 					)
 	
+	def validate_folder_template(self):
+		"""Parse the custom folder template so mistakes surface on save"""
+		if self.folder_structure != "Custom":
+			return
+
+		from frappe_sharepoint.utils.folder_template import validate_folder_template
+
+		self.folder_template = (self.folder_template or "").strip().strip('/')
+		validate_folder_template(self.folder_template)
+	
+	def validate_drive_routes(self):
+		"""Each DocType or Company may only be routed to one drive"""
+		seen = set()
+		for route in self.drive_routes:
+			if route.root_folder_path:
+				route.root_folder_path = route.root_folder_path.strip().strip('/')
+			
+			if route.route_by == "DocType":
+				key = ("DocType", route.document_type)
+			elif route.route_by == "Company":
+				key = ("Company", route.company)
+			else:
+				continue
+			
+			if key in seen:
+				frappe.throw(
+					_("Row {0}: {1} {2} is already routed to another drive").format(route.idx, key[0], key[1]),
+					title=_("Duplicate Drive Route")
+				)
+			seen.add(key)
+	
 	@frappe.whitelist()
 	def test_connection(self):
 		"""Test connection to Microsoft Graph API with provided credentials"""
@@ -75,107 +121,142 @@ class SharePointSettings(Document):
 			frappe.log_error("SharePoint Connection Test Error", str(e))
 			frappe.throw(_("Connection test failed: {0}").format(str(e)))
 	
+	@frappe.whitelist()
+	def get_circuit_states(self):
+		"""State of the circuit breakers for the tenant and every configured drive"""
+		from frappe_sharepoint.utils.circuit_breaker import get_circuit_states
+		from frappe_sharepoint.utils.drive_routing import get_configured_drives
+		
+		drive_names = {route.drive_id: route.drive_name for route in self.drive_routes if route.drive_name}
+		states = get_circuit_states(self, get_configured_drives(self))
+		for state in states:
+			state["label"] = drive_names.get(state["label"], state["label"])
+		return states
+	
 
+	def get_graph_page(self, url, page_link=None, refresh=False):
+		"""
+		Fetch one page of a Graph collection for the browser
+		
+		Pages are cached briefly per tenant and URL, so moving back and forth
+		in the pickers neither calls Graph nor fetches a token again.
+		
+		Returns:
+			dict: value (items of the page) and next_page (link to the next page, if any)
+		"""
+		from frappe_sharepoint.utils import get_request_header, make_request
+		
+		if page_link:
+			# Only follow nextLinks that point back to Graph
+			if not page_link.startswith(self.graph_api_url):
+				frappe.throw(_("Invalid page link"))
+			url = page_link
+		
+		key = f"sharepoint_browser:{self.tenant_id}:{hashlib.md5(url.encode()).hexdigest()}"
+		if not cint(refresh):
+			page = frappe.cache().get_value(key)
+			if page:
+				return page
+		
+		response = make_request('GET', url, get_request_header(self), None)
+		if not (response and response.ok):
+			return None
+		
+		data = response.json()
+		page = {"value": data.get('value', []), "next_page": data.get('@odata.nextLink')}
+		frappe.cache().set_value(key, page, expires_in_sec=BROWSER_CACHE_TTL)
+		return page
+	
 	@frappe.whitelist()
-	def get_sharepoint_sites(self):
-		"""Get all SharePoint sites in the tenant"""
+	def get_sharepoint_sites(self, search=None, page_link=None, refresh=0):
+		"""Get one page of SharePoint sites in the tenant"""
 		try:
-			from frappe_sharepoint.utils import get_request_header, make_request
+			sites_url = (
+				f"{self.graph_api_url}/sites?search={quote(search or '*')}"
+				f"&$select=id,name,displayName,webUrl,description&$top={BROWSER_PAGE_SIZE}"
+			)
+			page = self.get_graph_page(sites_url, page_link, refresh)
 			
-			headers = get_request_header(self)
+			if page is None:
+				frappe.throw(_("Failed to fetch SharePoint sites"))
 			
-			# Get all sites in the tenant
-			sites_url = f"{self.graph_api_url}/sites?search=*"
-			response = make_request('GET', sites_url, headers, None)
+			sites = []
+			for site in page["value"]:
+				sites.append({
+					'id': site.get('id'),
+					'name': site.get('name'),
+					'displayName': site.get('displayName'),
+					'webUrl': site.get('webUrl'),
+					'description': site.get('description', '')
+				})
 			
-			if response and response.ok:
-				data = response.json()
-				sites = []
-				
-				for site in data.get('value', []):
-					sites.append({
-						'id': site.get('id'),
-						'name': site.get('name'),
-						'displayName': site.get('displayName'),
-						'webUrl': site.get('webUrl'),
-						'description': site.get('description', '')
-					})
-				
-				return sites
-			else:
-				frappe.throw(_("Failed to fetch SharePoint sites"))
+			return {'items': sites, 'next_page': page["next_page"]}
 		except Exception as e:
 			frappe.log_error("SharePoint Sites Fetch Error", str(e))
 			frappe.throw(_("Error fetching SharePoint sites: {0}").format(str(e)))
 	
 	@frappe.whitelist()
-	def get_site_drives(self, site_id):
-		"""Get all document libraries (drives) for a specific site"""
+	def get_site_drives(self, site_id, page_link=None, refresh=0):
+		"""Get one page of document libraries (drives) for a specific site"""
 		try:
-			from frappe_sharepoint.utils import get_request_header, make_request
+			drives_url = (
+				f"{self.graph_api_url}/sites/{site_id}/drives"
+				f"?$select=id,name,description,driveType,webUrl&$top={BROWSER_PAGE_SIZE}"
+			)
+			page = self.get_graph_page(drives_url, page_link, refresh)
 			
-			headers = get_request_header(self)
+			if page is None:
+				frappe.throw(_("Failed to fetch drives for the site"))
 			
-			# Get all drives for the site
-			drives_url = f"{self.graph_api_url}/sites/{site_id}/drives"
-			response = make_request('GET', drives_url, headers, None)
+			drives = []
+			for drive in page["value"]:
+				drives.append({
+					'id': drive.get('id'),
+					'name': drive.get('name'),
+					'description': drive.get('description', ''),
+					'driveType': drive.get('driveType'),
+					'webUrl': drive.get('webUrl')
+				})
 			
-			if response and response.ok:
-				data = response.json()
-				drives = []
-				
-				for drive in data.get('value', []):
-					drives.append({
-						'id': drive.get('id'),
-						'name': drive.get('name'),
-						'description': drive.get('description', ''),
-						'driveType': drive.get('driveType'),
-						'webUrl': drive.get('webUrl')
-					})
-				
-				return drives
-			else:
-				frappe.throw(_("Failed to fetch drives for the site"))
+			return {'items': drives, 'next_page': page["next_page"]}
 		except Exception as e:
 			frappe.log_error("SharePoint Drives Fetch Error", str(e))
 			frappe.throw(_("Error fetching drives: {0}").format(str(e)))
 	
 	@frappe.whitelist()
-	def get_drive_folders(self, drive_id, folder_path=None):
-		"""Get folders in a drive at the specified path"""
+	def get_drive_folders(self, drive_id, folder_path=None, page_link=None, refresh=0):
+		"""Get one page of the folders in a drive at the specified path, each level is loaded when it is opened"""
 		try:
-			from frappe_sharepoint.utils import get_request_header, make_request
-			
-			headers = get_request_header(self)
+			folder_path = (folder_path or '').strip('/')
 			
 			# Build URL based on whether we're at root or in a subfolder
-			if folder_path and folder_path != '/':
+			if folder_path:
 				# Get children of specific folder
-				folders_url = f"{self.graph_api_url}/drives/{drive_id}/root:{folder_path}:/children"
+				folders_url = f"{self.graph_api_url}/drives/{drive_id}/root:/{quote(folder_path)}:/children"
 			else:
 				# Get root level folders
 				folders_url = f"{self.graph_api_url}/drives/{drive_id}/root/children"
+			folders_url += f"?$select=id,name,webUrl,folder&$top={BROWSER_PAGE_SIZE}"
 			
-			response = make_request('GET', folders_url, headers, None)
+			# SharePoint libraries reject $filter on folder, so files are left out below
+			page = self.get_graph_page(folders_url, page_link, refresh)
 			
-			if response and response.ok:
-				data = response.json()
-				folders = []
-				
-				for item in data.get('value', []):
-					# Only return folders, not files
-					if 'folder' in item:
-						folders.append({
-							'id': item.get('id'),
-							'name': item.get('name'),
-							'path': item.get('parentReference', {}).get('path', '') + '/' + item.get('name'),
-							'webUrl': item.get('webUrl'),
-							'childCount': item.get('folder', {}).get('childCount', 0)
-						})
-				
-				return folders
-			else:
+			if page is None:
 				frappe.throw(_("Failed to fetch folders"))
+			
+			folders = []
+			for item in page["value"]:
+				# Only return folders, not files
+				if 'folder' in item:
+					folders.append({
+						'id': item.get('id'),
+						'name': item.get('name'),
+						'path': f"/{folder_path}/{item.get('name')}" if folder_path else f"/{item.get('name')}",
+						'webUrl': item.get('webUrl'),
+						'childCount': item.get('folder', {}).get('childCount', 0)
+					})
+			
+			return {'items': folders, 'next_page': page["next_page"]}
 		except Exception as e:
 			frappe.log_error("SharePoint Folders Fetch Error", str(e))
 			frappe.throw(_("Error fetching folders: {0}").format(str(e)))
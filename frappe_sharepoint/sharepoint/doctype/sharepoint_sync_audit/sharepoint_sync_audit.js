@@ -0,0 +1,23 @@
+// Copyright (c) 2024, Frappe Community and contributors
+// For license information, please see license.txt
+
+frappe.ui.form.on('SharePoint Sync Audit', {
+	refresh: function(frm) {
+		let issues = frm.doc.missing_count + frm.doc.mismatched_count + frm.doc.not_uploaded_count + frm.doc.untracked_count;
+		if (frm.doc.status === 'Completed' && issues) {
+			frm.add_custom_button(__('Re-queue Files'), function() {
+				frappe.confirm(
+					__('Upload the {0} missing, mismatched and never uploaded files again?', [issues]),
+					function() {
+						frm.call('requeue_files').then(() => {
+							frappe.show_alert({
+								message: __('Files are being queued for upload'),
+								indicator: 'blue'
+							});
+						});
+					}
+				);
+			});
+		}
+	}
+});
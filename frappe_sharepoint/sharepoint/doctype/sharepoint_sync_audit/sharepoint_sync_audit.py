@@ -0,0 +1,15 @@
+# Copyright (c) 2024, Frappe Community and contributors
+# For license information, please see license.txt
+
+import frappe
+from frappe.model.document import Document
+
+class SharePointSyncAudit(Document):
+	@frappe.whitelist()
+	def requeue_files(self):
+		"""Queue the missing, mismatched and never uploaded Files of this audit for upload"""
+		from frappe_sharepoint.utils.sync_audit import enqueue_requeue
+
+		if self.status != "Completed":
+			frappe.throw(frappe._("Only completed audits can be re-queued"))
+		enqueue_requeue(self.name)
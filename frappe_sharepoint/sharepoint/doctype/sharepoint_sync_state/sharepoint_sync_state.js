@@ -0,0 +1,8 @@
+// Copyright (c) 2024, Frappe Community and contributors
+// For license information, please see license.txt
+
+frappe.ui.form.on('SharePoint Sync State', {
+	// refresh: function(frm) {
+
+	// }
+});
@@ -0,0 +1,17 @@
+# Copyright (c) 2024, Frappe Community and contributors
+# For license information, please see license.txt
+
+import frappe
+from frappe.model.document import Document
+
+class SharePointSyncState(Document):
+	pass
+
+
+def on_doctype_update():
+	"""Indexes for the lookups done by bundle uploads, backfill and audit jobs"""
+	frappe.db.add_index("SharePoint Sync State", ["attached_to_doctype", "attached_to_name"])
+	frappe.db.add_index("SharePoint Sync State", ["drive_id", "item_id"])
+	frappe.db.add_index("SharePoint Sync State", ["status", "is_evicted"])
+	# Lets backfill page through unsynced Files with an index range scan
+	frappe.db.add_index("File", ["uploaded_to_sharepoint", "name"])
@@ -0,0 +1,8 @@
+# Copyright (c) 2023, Frappe Community and contributors
+# For license information, please see license.txt
+
+# import frappe
+from frappe.model.document import Document
+
+class SharePointUploadRule(Document):
+	pass
@@ -2,14 +2,30 @@ from __future__ import absolute_import
 
 import frappe
 from frappe import _
+from frappe_sharepoint.utils.circuit_breaker import get_drive_from_url, is_circuit_open, record_result
+from frappe_sharepoint.utils.profiler import record_graph_call
+import hashlib
 import requests
+import time
+
+# Tokens are reused until shortly before they expire
+TOKEN_EXPIRY_MARGIN = 5 * 60
 
 # Get access token using client credentials flow
 def get_access_token(tenant_id, client_id, client_secret):
     """
     Authenticate with Azure AD using client credentials flow
     Returns access token for Microsoft Graph API
+
+    The token is cached in Redis, so every job and request on the site
+    shares it instead of authenticating for each Graph call.
     """
+    secret_hash = hashlib.sha256(client_secret.encode()).hexdigest()[:12]
+    cache_key = f"sharepoint_access_token:{tenant_id}:{client_id}:{secret_hash}"
+    token = frappe.cache().get_value(cache_key)
+    if token:
+        return token
+
     frappe.logger().info(f"[Azure Auth] Starting authentication for tenant: {tenant_id[:8]}...")
     frappe.logger().info(f"[Azure Auth] Client ID: {client_id[:8]}...")
     
@@ -25,13 +41,19 @@ def get_access_token(tenant_id, client_id, client_secret):
     
     try:
         frappe.logger().info(f"[Azure Auth] Sending authentication request...")
+        started = time.monotonic()
         response = requests.post(token_url, data=data, timeout=30)
+        record_graph_call('POST', token_url, response.status_code, started)
         frappe.logger().info(f"[Azure Auth] Response status: {response.status_code}")
+        record_result(response.status_code, tenant_id=tenant_id)
         
         if response.ok:
             token = response.json().get('access_token')
             if token:
                 frappe.logger().info(f"[Azure Auth] Successfully obtained access token (length: {len(token)})")
+                expires_in = int(response.json().get('expires_in') or 0) - TOKEN_EXPIRY_MARGIN
+                if expires_in > 0:
+                    frappe.cache().set_value(cache_key, token, expires_in_sec=expires_in)
                 return token
             else:
                 frappe.logger().error(f"[Azure Auth] No access_token in response: {response.json()}")
@@ -45,11 +67,13 @@ def get_access_token(tenant_id, client_id, client_secret):
             
     except requests.exceptions.Timeout as e:
         frappe.logger().error(f"[Azure Auth] Request timeout: {str(e)}")
-        frappe.log_error("Azure AD Authentication Timeout", str(e))
+        log_outage_error("Azure AD Authentication Timeout", str(e))
+        record_result(408, tenant_id=tenant_id)
         return None
     except requests.exceptions.ConnectionError as e:
         frappe.logger().error(f"[Azure Auth] Connection error: {str(e)}")
-        frappe.log_error("Azure AD Connection Error", str(e))
+        log_outage_error("Azure AD Connection Error", str(e))
+        record_result(503, tenant_id=tenant_id)
         return None
     except requests.exceptions.RequestException as e:
         frappe.logger().error(f"[Azure Auth] Request exception: {str(e)}")
@@ -106,6 +130,18 @@ def get_request_header(settings):
 def make_request(request, url, headers, body=None):
     """
     Make HTTP requests to Microsoft Graph API with comprehensive error handling
+
+    The call is added to the timeline of a profiled job
+    """
+    started = time.monotonic()
+    response = send_request(request, url, headers, body)
+    record_graph_call(request, url, response.status_code if response is not None else None, started)
+    return response
+
+
+def send_request(request, url, headers, body=None):
+    """
+    Send a request to Microsoft Graph API, failures are returned as error responses
     """
     frappe.logger().info(f"[API Request] Method: {request}, URL: {url[:100]}...")
     frappe.logger().info(f"[API Request] Headers present: {list(headers.keys())}")
@@ -135,6 +171,7 @@ def make_request(request, url, headers, body=None):
             return None
         
         frappe.logger().info(f"[API Request] Response status: {response.status_code}")
+        record_result(response.status_code, drive_id=get_drive_from_url(url))
         
         # Log response details for non-200 responses
         if not response.ok:
@@ -152,23 +189,27 @@ def make_request(request, url, headers, body=None):
         
     except requests.exceptions.Timeout as e:
         frappe.logger().error(f"[API Request] Timeout after {timeout}s: {str(e)}")
-        frappe.log_error("Microsoft Graph API Timeout", f"URL: {url}\nError: {str(e)}")
+        log_outage_error("Microsoft Graph API Timeout", f"URL: {url}\nError: {str(e)}", url=url)
+        record_result(408, drive_id=get_drive_from_url(url))
         # Return a mock response object with error details
         return create_error_response(f"Request timeout after {timeout} seconds", 408)
         
     except requests.exceptions.ConnectionError as e:
         frappe.logger().error(f"[API Request] Connection error: {str(e)}")
-        frappe.log_error("Microsoft Graph API Connection Error", f"URL: {url}\nError: {str(e)}")
+        log_outage_error("Microsoft Graph API Connection Error", f"URL: {url}\nError: {str(e)}", url=url)
+        record_result(503, drive_id=get_drive_from_url(url))
         return create_error_response(f"Connection error: {str(e)}", 503)
         
     except requests.exceptions.HTTPError as e:
         frappe.logger().error(f"[API Request] HTTP error: {str(e)}")
-        frappe.log_error("Microsoft Graph API HTTP Error", f"URL: {url}\nError: {str(e)}")
+        log_outage_error("Microsoft Graph API HTTP Error", f"URL: {url}\nError: {str(e)}", url=url)
+        record_result(500, drive_id=get_drive_from_url(url))
         return create_error_response(f"HTTP error: {str(e)}", 500)
         
     except requests.exceptions.RequestException as e:
         frappe.logger().error(f"[API Request] Request exception: {str(e)}")
-        frappe.log_error("Microsoft Graph API Request Error", f"URL: {url}\nError: {str(e)}")
+        log_outage_error("Microsoft Graph API Request Error", f"URL: {url}\nError: {str(e)}", url=url)
+        record_result(500, drive_id=get_drive_from_url(url))
         return create_error_response(f"Request error: {str(e)}", 500)
         
     except Exception as e:
@@ -177,6 +218,16 @@ def make_request(request, url, headers, body=None):
         return create_error_response(f"Unexpected error: {str(e)}", 500)
 
 
+# Error Log entry for a failed call, unless its circuit is already open
+def log_outage_error(title, message, url=None):
+    """
+    While a circuit is open every job would report the same outage,
+    so only the failures that lead up to it are written to the Error Log
+    """
+    if not is_circuit_open(url=url):
+        frappe.log_error(title, message)
+
+
 # Helper to create error response objects
 def create_error_response(error_message, status_code):
     """
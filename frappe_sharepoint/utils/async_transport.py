@@ -0,0 +1,297 @@
+import frappe
+from frappe_sharepoint.utils import create_error_response, get_request_header, log_outage_error
+from frappe_sharepoint.utils.bandwidth import get_throttle_wait
+from frappe_sharepoint.utils.circuit_breaker import get_drive_from_url, record_result
+from frappe_sharepoint.utils.file_hash import INTEGRITY_MISMATCH, FileHashes
+from frappe_sharepoint.utils.profiler import record_graph_call
+from concurrent.futures import ThreadPoolExecutor
+import asyncio
+import contextvars
+import functools
+import json
+import os
+import time
+from urllib.parse import quote
+
+try:
+	import aiohttp
+except ImportError:
+	aiohttp = None
+
+'''
+	Optional asyncio transport for Microsoft Graph, used by bulk jobs
+
+	Uploads and metadata lookups spend nearly all their time waiting on the
+	network. With aiohttp installed, a job keeps many of them in flight over
+	one pooled set of connections, bounded by a concurrency limit, instead of
+	sending one request at a time. The SharePoint client's methods stay
+	synchronous: each batch runs on an event loop in the calling thread.
+	The token is fetched before the loop starts, and Redis, database and
+	log calls run on one helper thread in the site context, so they do not
+	stall the requests in flight. Without aiohttp the client uploads one
+	file at a time as before.
+'''
+
+TRANSPORT_ASYNC = "Async"
+DEFAULT_CONCURRENCY = 16
+# Seconds to connect and between reads, the timeout make_request uses
+REQUEST_TIMEOUT = 30
+
+
+def is_available():
+	return aiohttp is not None
+
+
+def get_concurrency(settings):
+	return settings.get("async_concurrency") or DEFAULT_CONCURRENCY
+
+
+class GraphResponse(object):
+	'''
+		Response read in full, with the parts of requests.Response the client uses
+	'''
+	def __init__(self, status_code, content):
+		self.status_code = status_code
+		self.content = content
+		self.ok = status_code < 400
+
+	@property
+	def text(self):
+		return self.content.decode("utf-8", errors="replace")
+
+	def json(self):
+		return json.loads(self.content)
+
+
+class AsyncGraphTransport(object):
+	'''
+		Pooled aiohttp session with a limit on requests in flight
+
+		Create it before the event loop runs, it fetches the token then.
+
+		Usage:
+			transport = AsyncGraphTransport(settings)
+			async with transport:
+				response = await transport.request('GET', url, transport.headers)
+	'''
+	def __init__(self, settings, concurrency=None):
+		self.settings = settings
+		self.concurrency = concurrency or get_concurrency(settings)
+		# A batch ends well within the token's lifetime of about an hour
+		self.headers = get_request_header(settings)
+		self.session = None
+		self.semaphore = None
+		self.executor = None
+		# Target folder a request was answered 404 for
+		self.missing_folder = None
+
+	async def __aenter__(self):
+		self.semaphore = asyncio.Semaphore(self.concurrency)
+		# One thread, so the site's database connection is never used twice at once
+		self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="sharepoint-async")
+		self.session = aiohttp.ClientSession(
+			connector=aiohttp.TCPConnector(limit=self.concurrency, ttl_dns_cache=300),
+			timeout=aiohttp.ClientTimeout(total=None, sock_connect=REQUEST_TIMEOUT, sock_read=REQUEST_TIMEOUT)
+		)
+		return self
+
+	async def __aexit__(self, *args):
+		await self.session.close()
+		self.executor.shutdown(wait=True)
+
+	async def run_blocking(self, func, *args):
+		'''
+			Run a Redis, database or log call on the helper thread, in the site context
+		'''
+		context = contextvars.copy_context()
+		return await asyncio.get_running_loop().run_in_executor(self.executor, functools.partial(context.run, func, *args))
+
+	async def request(self, request, url, headers, body=None):
+		'''
+			Send a request, reporting failures like make_request does
+
+			Dict bodies are sent as JSON, anything else as raw bytes.
+		'''
+		kwargs = {"json": body} if isinstance(body, dict) else {"data": body}
+		async with self.semaphore:
+			started = time.monotonic()
+			try:
+				async with self.session.request(request, url, headers=headers, **kwargs) as response:
+					result = GraphResponse(response.status, await response.read())
+			except asyncio.TimeoutError:
+				await self.run_blocking(log_outage_error, "Microsoft Graph API Timeout", f"URL: {url}\nError: Request timeout after {REQUEST_TIMEOUT} seconds", url)
+				result = create_error_response(f"Request timeout after {REQUEST_TIMEOUT} seconds", 408)
+			except aiohttp.ClientConnectionError as e:
+				await self.run_blocking(log_outage_error, "Microsoft Graph API Connection Error", f"URL: {url}\nError: {str(e)}", url)
+				result = create_error_response(f"Connection error: {str(e)}", 503)
+			except aiohttp.ClientError as e:
+				await self.run_blocking(log_outage_error, "Microsoft Graph API Request Error", f"URL: {url}\nError: {str(e)}", url)
+				result = create_error_response(f"Request error: {str(e)}", 500)
+
+		record_graph_call(request, url, result.status_code, started)
+		await self.run_blocking(record_result, result.status_code, get_drive_from_url(url))
+		if not result.ok:
+			await self.run_blocking(frappe.logger().warning, f"[Async Graph] {request} {url}: {result.status_code} {result.text[:500]}")
+		return result
+
+	async def log_error(self, title, message):
+		await self.run_blocking(frappe.log_error, title, message)
+
+	async def throttle(self, size):
+		'''
+			Wait for a body's share of the bandwidth caps before sending it
+		'''
+		wait = await self.run_blocking(get_throttle_wait, self.settings, size)
+		if wait:
+			await asyncio.sleep(wait)
+
+	async def get_drive_item(self, base_url, item_id, select=None):
+		url = f'{base_url}/items/{item_id}'
+		if select:
+			url = f'{url}?$select={select}'
+
+		response = await self.request('GET', url, self.headers)
+		if not response.ok:
+			await self.log_error("SharePoint Item Fetch Error", f"Item: {item_id}, Status: {response.status_code}, Error: {response.text}")
+			return None
+		return response.json()
+
+	async def upload_file(self, base_url, target_folder_id, filepath, filename, large_file, chunk_size):
+		'''
+			Upload a file in one request, or in chunks through an upload session
+
+			The content is hashed in the executor thread that reads it.
+
+			Returns:
+				tuple: The uploaded driveItem, or None if the upload failed, and the local hashes
+		'''
+		loop = asyncio.get_running_loop()
+		hashes = FileHashes()
+		if not large_file:
+			content = await loop.run_in_executor(None, read_file, filepath, hashes)
+			if not content:
+				await self.log_error("SharePoint Upload Error", f"File {filename} is empty")
+				return None, hashes
+
+			headers = dict(self.headers, **{"Content-Type": "application/octet-stream"})
+			await self.throttle(len(content))
+			response = await self.request('PUT', f'{base_url}/items/{target_folder_id}:/{quote(filename)}:/content', headers, content)
+			if not response.ok:
+				if response.status_code == 404:
+					self.missing_folder = target_folder_id
+				await self.log_error("SharePoint File Upload Error", f"File: {filename}, Status: {response.status_code}, Error: {response.text}")
+				return None, hashes
+			return response.json(), hashes
+
+		headers = dict(self.headers, **{"Content-Type": "application/json"})
+		response = await self.request(
+			'POST',
+			f'{base_url}/items/{target_folder_id}:/{quote(filename)}:/createUploadSession',
+			headers,
+			{"item": {"@microsoft.graph.conflictBehavior": "replace"}}
+		)
+		if not response.ok:
+			if response.status_code == 404:
+				self.missing_folder = target_folder_id
+			await self.log_error("SharePoint Upload Session Error", f"File: {filename}, Status: {response.status_code}, Error: {response.text}")
+			return None, hashes
+
+		# The upload URL is pre-authenticated and must not receive the bearer token
+		upload_url = response.json()["uploadUrl"]
+		file_size = os.path.getsize(filepath)
+		sent = 0
+		with open(filepath, 'rb') as f:
+			while sent < file_size:
+				chunk = await loop.run_in_executor(None, read_chunk, f, chunk_size, hashes)
+				chunk_headers = {
+					"Content-Length": str(len(chunk)),
+					"Content-Range": f"bytes {sent}-{sent + len(chunk) - 1}/{file_size}"
+				}
+				await self.throttle(len(chunk))
+				response = await self.request('PUT', upload_url, chunk_headers, chunk)
+				if not response.ok:
+					await self.log_error("SharePoint Upload Session Error", f"File: {filename}, Range start: {sent}, Status: {response.status_code}, Error: {response.text}")
+					await self.request('DELETE', upload_url, {})
+					return None, hashes
+				sent += len(chunk)
+
+		# The response to the final chunk is the completed driveItem
+		return response.json(), hashes
+
+
+def read_file(filepath, hashes):
+	with open(filepath, 'rb') as f:
+		content = f.read()
+	hashes.update(content)
+	return content
+
+
+def read_chunk(f, size, hashes):
+	chunk = f.read(size)
+	hashes.update(chunk)
+	return chunk
+
+
+def upload_files(sharepoint, target_folder_id, files, concurrency=None):
+	'''
+		Upload files into one folder concurrently
+
+		Args:
+			sharepoint: SharePoint client of the drive
+			target_folder_id: SharePoint folder ID
+			files: List of (filepath, filename)
+			concurrency: Uploads in flight, defaults to the settings' limit
+
+		Returns:
+			list: The uploaded driveItem or None for each file, in order
+	'''
+	from frappe_sharepoint.utils.job_routing import is_large_file
+	from frappe_sharepoint.utils.sharepoint import UPLOAD_CHUNK_SIZE
+
+	async def upload(transport, filepath, filename):
+		try:
+			file_size = os.path.getsize(filepath)
+			started = time.monotonic()
+			item, hashes = await transport.upload_file(
+				sharepoint.base_url,
+				target_folder_id,
+				filepath,
+				filename,
+				is_large_file(sharepoint.settings, file_size),
+				UPLOAD_CHUNK_SIZE
+			)
+			if item and await transport.run_blocking(sharepoint.check_integrity, item, hashes.as_dict(), filename) == INTEGRITY_MISMATCH:
+				return None
+			if item:
+				await transport.run_blocking(sharepoint.record_uploaded_item, item, file_size, time.monotonic() - started)
+			return item
+		except Exception as e:
+			await transport.log_error("File Upload Error", f"File: {filename}, Error: {str(e)}")
+			return None
+
+	transport = AsyncGraphTransport(sharepoint.settings, concurrency)
+
+	async def upload_all():
+		async with transport:
+			items = await asyncio.gather(*[upload(transport, filepath, filename) for filepath, filename in files])
+			sharepoint.missing_folder = transport.missing_folder or sharepoint.missing_folder
+			return items
+
+	frappe.logger().info(f"[Async Graph] Uploading {len(files)} file(s) to folder {target_folder_id}")
+	return asyncio.run(upload_all())
+
+
+def get_drive_items(sharepoint, item_ids, select=None, concurrency=None):
+	'''
+		Fetch several driveItems concurrently
+
+		Returns:
+			dict: driveItem or None by item ID
+	'''
+	transport = AsyncGraphTransport(sharepoint.settings, concurrency)
+
+	async def fetch_all():
+		async with transport:
+			return await asyncio.gather(*[transport.get_drive_item(sharepoint.base_url, item_id, select) for item_id in item_ids])
+
+	return dict(zip(item_ids, asyncio.run(fetch_all())))
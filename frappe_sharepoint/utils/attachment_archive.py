@@ -0,0 +1,207 @@
+from frappe.utils import cint, now_datetime
+import json
+import os
+import zipfile
+
+'''
+	Archive mode for documents with many small attachments
+
+	Uploading a small file costs about as much as its request overhead, so
+	for document types with an archive rule the small attachments of a
+	bundle go up as one ZIP next to the document PDF. The ZIP is stored,
+	not compressed, and produced by a generator while it is sent: its size
+	is known from the entries beforehand, so it needs no temporary copy.
+	A manifest inside the ZIP lists the Files it holds, and the Sync State
+	of each archived File points to the ZIP with the File's name inside it.
+'''
+
+MANIFEST_NAME = "manifest.json"
+ARCHIVE_SUFFIX = "-attachments.zip"
+# An archive of a single attachment would only rename it
+MIN_ARCHIVE_FILES = 2
+DEFAULT_ARCHIVE_THRESHOLD_KB = 256
+READ_BLOCK_SIZE = 256 * 1024
+
+# Fixed parts of a stored ZIP entry written to an unseekable stream
+LOCAL_HEADER_SIZE = 30
+DATA_DESCRIPTOR_SIZE = 16
+CENTRAL_HEADER_SIZE = 46
+END_RECORD_SIZE = 22
+
+
+def get_archive_threshold(settings, doctype):
+	'''
+		Size in bytes below which attachments of a document type are archived, 0 if they are not
+	'''
+	for rule in settings.get("upload_rules") or []:
+		if rule.document_type == doctype and rule.get("archive_small_attachments"):
+			return cint(rule.get("archive_threshold") or DEFAULT_ARCHIVE_THRESHOLD_KB) * 1024
+	return 0
+
+
+def get_attachment_archive(settings, doctype, docname):
+	'''
+		AttachmentArchive for a document, None when its type has no archive rule
+	'''
+	threshold = get_archive_threshold(settings, doctype)
+	return AttachmentArchive(doctype, docname, threshold) if threshold else None
+
+
+class AttachmentArchive(object):
+	'''
+		Small attachments of one document bundle, uploaded as one ZIP
+
+		Usage:
+			archive = AttachmentArchive(doctype, docname, threshold)
+			for file_info in archive.collect(files):
+				... upload file_info on its own ...
+			if archive.entries:
+				... upload archive.open() as archive.filename, archive.get_size() bytes ...
+	'''
+	def __init__(self, doctype, docname, threshold):
+		self.doctype = doctype
+		self.docname = docname
+		self.threshold = threshold
+		self.filename = f"{docname}{ARCHIVE_SUFFIX}"
+		self.entries = []
+		self.manifest = None
+
+	def accepts(self, file_info):
+		# Only attachments, the document PDF stays a file of its own
+		if not file_info.get('file_doc') or file_info.get('is_temp'):
+			return False
+		try:
+			return os.path.getsize(file_info['filepath']) < self.threshold
+		except (KeyError, TypeError, OSError):
+			return False
+
+	def collect(self, files):
+		'''
+			Yield the bundle files that are not archived and keep the others
+
+			Archived attachments are only held back when there are at least
+			MIN_ARCHIVE_FILES of them, otherwise they are yielded at the end.
+		'''
+		held = []
+		for file_info in files:
+			if self.accepts(file_info):
+				held.append(file_info)
+			else:
+				yield file_info
+
+		if len(held) < MIN_ARCHIVE_FILES:
+			yield from held
+			return
+
+		self.add_entries(held)
+
+	def add_entries(self, files):
+		names = set()
+		for file_info in files:
+			zinfo = zipfile.ZipInfo.from_file(
+				file_info['filepath'],
+				get_unique_name(file_info['filename'], names),
+				strict_timestamps=False
+			)
+			self.entries.append((zinfo, file_info))
+
+		self.manifest = json.dumps({
+			"doctype": self.doctype,
+			"docname": self.docname,
+			"created": str(now_datetime()),
+			"files": [
+				{"name": zinfo.filename, "file": file_info['file_doc'], "size": zinfo.file_size}
+				for zinfo, file_info in self.entries
+			]
+		}, indent=1).encode()
+
+	def get_size(self):
+		'''
+			Size of the ZIP in bytes, computed from the entries without reading them
+		'''
+		size = END_RECORD_SIZE
+		for name, file_size in [(MANIFEST_NAME, len(self.manifest))] + [(zinfo.filename, zinfo.file_size) for zinfo, file_info in self.entries]:
+			name_size = len(name.encode("utf-8"))
+			size += LOCAL_HEADER_SIZE + name_size + file_size + DATA_DESCRIPTOR_SIZE + CENTRAL_HEADER_SIZE + name_size
+		return size
+
+	def iter_chunks(self):
+		'''
+			Generate the ZIP, one chunk per block read from the attachments
+		'''
+		sink = ZipSink()
+		with zipfile.ZipFile(sink, "w", zipfile.ZIP_STORED) as archive:
+			manifest = zipfile.ZipInfo(MANIFEST_NAME, date_time=now_datetime().timetuple()[:6])
+			manifest.file_size = len(self.manifest)
+			with archive.open(manifest, "w") as dest:
+				dest.write(self.manifest)
+			yield sink.take()
+
+			for zinfo, file_info in self.entries:
+				with archive.open(zinfo, "w") as dest, open(file_info['filepath'], 'rb') as src:
+					for block in iter(lambda: src.read(READ_BLOCK_SIZE), b""):
+						dest.write(block)
+						yield sink.take()
+				yield sink.take()
+		yield sink.take()
+
+	def open(self):
+		return ChunkReader(self.iter_chunks())
+
+
+def get_unique_name(filename, names):
+	'''
+		Name for an entry that no other entry of the archive has, e.g. receipt (1).pdf
+	'''
+	base, ext = os.path.splitext(filename)
+	name, count = filename, 0
+	while name.lower() in names or name.lower() == MANIFEST_NAME:
+		count += 1
+		name = f"{base} ({count}){ext}"
+	names.add(name.lower())
+	return name
+
+
+class ZipSink(object):
+	'''
+		Unseekable file object that holds what zipfile writes until it is taken
+
+		zipfile falls back to data descriptors on it, so entries are written
+		in a single pass.
+	'''
+	def __init__(self):
+		self.parts = []
+
+	def write(self, data):
+		self.parts.append(bytes(data))
+		return len(data)
+
+	def flush(self):
+		pass
+
+	def take(self):
+		data = b"".join(self.parts)
+		self.parts = []
+		return data
+
+
+class ChunkReader(object):
+	'''
+		File object reading from a generator of byte chunks
+	'''
+	def __init__(self, chunks):
+		self.chunks = chunks
+		self.buffer = bytearray()
+
+	def read(self, size=-1):
+		while size < 0 or len(self.buffer) < size:
+			chunk = next(self.chunks, None)
+			if chunk is None:
+				break
+			self.buffer += chunk
+
+		if size < 0:
+			size = len(self.buffer)
+		data = bytes(self.buffer[:size])
+		del self.buffer[:size]
+		return data
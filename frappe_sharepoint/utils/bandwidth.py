@@ -0,0 +1,179 @@
+import frappe
+from frappe.utils import cint, get_time, now_datetime
+import io
+import threading
+import time
+
+'''
+	Bandwidth caps for uploads and off-peak windows for bulk work
+
+	Upload bodies are streamed through a throttle that takes tokens from two
+	buckets: one in Redis shared by all workers of the site, and one per
+	worker process. A bucket fills at the configured rate and may save up a
+	couple of seconds of traffic for bursts. Senders take tokens ahead of
+	the bytes and sleep off any debt, so the rate holds across workers.
+
+	Bulk work only runs inside the configured upload windows; uploads of
+	files attached by users ignore them.
+'''
+
+SETTINGS = "SharePoint Settings"
+BUCKET_KEY = "sharepoint_bandwidth_bucket"
+
+# Bytes sent between two throttle checks
+STREAM_BLOCK_SIZE = 64 * 1024
+# Seconds of traffic a bucket may save up for a burst
+BURST_SECONDS = 2
+
+# Refill the shared bucket by the elapsed time and take the requested tokens.
+# Returns the seconds the caller has to wait for its share, as a string since
+# Redis truncates Lua numbers to integers.
+TAKE_TOKENS = """
+local rate = tonumber(ARGV[1])
+local capacity = tonumber(ARGV[2])
+local requested = tonumber(ARGV[3])
+local clock = redis.call('TIME')
+local now = tonumber(clock[1]) + tonumber(clock[2]) / 1000000
+local bucket = redis.call('HMGET', KEYS[1], 'tokens', 'updated')
+local tokens = tonumber(bucket[1]) or capacity
+local updated = tonumber(bucket[2]) or now
+tokens = math.min(capacity, tokens + (now - updated) * rate) - requested
+redis.call('HSET', KEYS[1], 'tokens', tostring(tokens), 'updated', tostring(now))
+redis.call('EXPIRE', KEYS[1], 3600)
+if tokens >= 0 then
+	return '0'
+end
+return tostring(-tokens / rate)
+"""
+
+_worker_buckets = {}
+
+
+class TokenBucket(object):
+	'''
+		Bucket of one worker process, the same algorithm as the shared one
+	'''
+	def __init__(self, rate):
+		self.rate = rate
+		self.capacity = rate * BURST_SECONDS
+		self.tokens = self.capacity
+		self.updated = time.monotonic()
+		self.lock = threading.Lock()
+
+	def take(self, requested):
+		with self.lock:
+			now = time.monotonic()
+			self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate) - requested
+			self.updated = now
+			return max(0, -self.tokens / self.rate)
+
+
+def get_bandwidth_limits(settings):
+	'''
+		Shared and per worker limits in bytes per second, 0 for none
+	'''
+	return cint(settings.get("bandwidth_limit")) * 1024, cint(settings.get("worker_bandwidth_limit")) * 1024
+
+
+def take_shared_tokens(rate, requested):
+	cache = frappe.cache()
+	return float(cache.eval(TAKE_TOKENS, 1, cache.make_key(BUCKET_KEY), rate, rate * BURST_SECONDS, requested))
+
+
+def get_worker_bucket(rate):
+	if rate not in _worker_buckets:
+		_worker_buckets[rate] = TokenBucket(rate)
+	return _worker_buckets[rate]
+
+
+def get_throttle_wait(settings, size):
+	'''
+		Take tokens for size bytes from both buckets
+
+		Returns:
+			float: Seconds to wait before sending them
+	'''
+	shared_rate, worker_rate = get_bandwidth_limits(settings)
+	wait = 0
+	if worker_rate:
+		wait = max(wait, get_worker_bucket(worker_rate).take(size))
+	if shared_rate:
+		wait = max(wait, take_shared_tokens(shared_rate, size))
+	return wait
+
+
+def throttle(settings, size):
+	wait = get_throttle_wait(settings, size)
+	if wait:
+		time.sleep(wait)
+
+
+class ThrottledStream(object):
+	'''
+		Request body that holds back between blocks to stay under the caps
+
+		It has a length, so requests still sends a Content-Length header
+		instead of switching to chunked encoding, which Graph rejects.
+	'''
+	def __init__(self, settings, data, length=None):
+		self.settings = settings
+		if isinstance(data, bytes):
+			self.data = io.BytesIO(data)
+			self.length = len(data)
+		else:
+			self.data = data
+			self.length = length
+		self.unthrottled = 0
+
+	def __len__(self):
+		return self.length
+
+	def __iter__(self):
+		while True:
+			block = self.read(STREAM_BLOCK_SIZE)
+			if not block:
+				return
+			yield block
+
+	def read(self, size=-1):
+		block = self.data.read(size)
+		# The HTTP client reads small blocks, check the caps once per STREAM_BLOCK_SIZE
+		self.unthrottled += len(block)
+		if self.unthrottled >= STREAM_BLOCK_SIZE:
+			throttle(self.settings, self.unthrottled)
+			self.unthrottled = 0
+		return block
+
+
+def throttled_body(settings, data, length=None):
+	'''
+		Wrap an upload body in a ThrottledStream when a cap is configured
+
+		Args:
+			data: bytes or a binary file object
+			length: Size of a file object's content
+	'''
+	if not any(get_bandwidth_limits(settings)):
+		return data
+	return ThrottledStream(settings, data, length)
+
+
+def is_upload_window_open(settings, at=None):
+	'''
+		Whether bulk uploads may run now, always when no windows are configured
+
+		A window whose end is before its start runs past midnight.
+	'''
+	windows = settings.get("upload_windows") or []
+	if not windows:
+		return True
+
+	now = (at or now_datetime()).time()
+	for window in windows:
+		start, end = get_time(window.from_time), get_time(window.to_time)
+		if start <= end:
+			if start <= now < end:
+				return True
+		elif now >= start or now < end:
+			return True
+	return False
@@ -0,0 +1,207 @@
+import frappe
+from frappe.utils.pdf import cleanup, prepare_options, scrub_urls
+import os
+import queue
+import shutil
+import subprocess
+import tempfile
+import threading
+
+'''
+	Batch rendering of document PDFs for bulk exports
+'''
+
+# wkhtmltopdf runs as a subprocess, so threads render PDFs in parallel
+PDF_WORKERS = 4
+# Rendered PDFs waiting for the consumer, bounds the temporary files on disk
+RESULT_QUEUE_SIZE = PDF_WORKERS * 2
+# Documents converted by one wkhtmltopdf process
+RENDER_BATCH_SIZE = 10
+# Seconds one document may take within a wkhtmltopdf run
+RENDER_TIMEOUT = 120
+
+_DONE = object()
+
+
+def get_asset_cache_dir():
+	'''
+		wkhtmltopdf's disk cache for stylesheets, fonts and images, shared by all renders of the site
+	'''
+	path = os.path.join(tempfile.gettempdir(), f"sharepoint-pdf-assets-{frappe.local.site}")
+	os.makedirs(path, exist_ok=True)
+	return path
+
+
+def render_pdfs(doctype, names, workers=PDF_WORKERS, batch_size=RENDER_BATCH_SIZE):
+	'''
+		Render the PDFs of many documents, yielding them as they are written
+
+		Each worker thread opens one site session and takes documents from a
+		shared queue, batch_size at a time, until it is empty. A batch is
+		converted by a single wkhtmltopdf process, so the process and its web
+		engine start once per batch instead of once per document. Assets are
+		fetched once into wkhtmltopdf's cache. PDFs are yielded as their
+		batch completes, so the caller can upload them while the next
+		batches render.
+
+		Args:
+			doctype: Document type
+			names: Document names
+			workers: Number of render threads
+			batch_size: Documents converted by one wkhtmltopdf process
+
+		Yields:
+			tuple: (document name, PDF path or None if rendering failed).
+				The path is removed once the batch ends, callers may remove it earlier.
+	'''
+	pending = queue.Queue()
+	for name in names:
+		pending.put(name)
+
+	results = queue.Queue(maxsize=RESULT_QUEUE_SIZE)
+	stop = threading.Event()
+	output_dir = tempfile.mkdtemp(prefix="sharepoint-pdf-")
+	pdf_options = {"cache-dir": get_asset_cache_dir()}
+
+	threads = [
+		threading.Thread(
+			target=render_worker,
+			args=(
+				frappe.local.site, frappe.local.sites_path, frappe.session.user,
+				doctype, pending, results, stop, output_dir, pdf_options, max(1, batch_size)
+			),
+			daemon=True
+		)
+		for _i in range(max(1, min(workers, len(names))))
+	]
+	for thread in threads:
+		thread.start()
+
+	running = len(threads)
+	try:
+		while running:
+			result = results.get()
+			if result is _DONE:
+				running -= 1
+				continue
+			yield result
+
+		# Documents left behind by a worker that could not start
+		while not pending.empty():
+			yield pending.get_nowait(), None
+	finally:
+		# The consumer may stop early, let the workers finish their current document
+		stop.set()
+		while running:
+			if results.get() is _DONE:
+				running -= 1
+		shutil.rmtree(output_dir, ignore_errors=True)
+
+
+def render_worker(site, sites_path, user, doctype, pending, results, stop, output_dir, pdf_options, batch_size):
+	'''
+		Render documents from the queue in one site session, batch_size per wkhtmltopdf process
+	'''
+	try:
+		frappe.init(site=site, sites_path=sites_path)
+		try:
+			frappe.connect()
+			frappe.set_user(user)
+			while not stop.is_set():
+				names = []
+				while len(names) < batch_size:
+					try:
+						names.append(pending.get_nowait())
+					except queue.Empty:
+						break
+				if not names:
+					break
+				for result in render_batch(doctype, names, output_dir, pdf_options):
+					results.put(result)
+		finally:
+			frappe.destroy()
+	except Exception as e:
+		frappe.logger().error(f"[Batch PDF] Render worker failed: {str(e)}")
+	finally:
+		results.put(_DONE)
+
+
+def render_batch(doctype, names, output_dir, pdf_options):
+	'''
+		Convert the print HTML of several documents with one wkhtmltopdf process
+
+		wkhtmltopdf reads one conversion per line with --read-args-from-stdin,
+		each with the options Frappe's get_pdf would use for that document.
+
+		Returns:
+			list: (document name, PDF path or None if rendering failed)
+	'''
+	conversions = []
+	try:
+		for name in names:
+			try:
+				html, options = prepare_options(scrub_urls(frappe.get_print(doctype, name, print_format="Standard")), dict(pdf_options))
+				options.update({"disable-javascript": "", "disable-local-file-access": ""})
+				html_path = os.path.join(output_dir, f"{frappe.generate_hash(length=12)}.html")
+				with open(html_path, "w", encoding="utf-8") as f:
+					f.write(html)
+				conversions.append((name, html_path, os.path.join(output_dir, f"{name}.pdf"), options))
+			except Exception as e:
+				frappe.log_error("PDF Generation Error", f"{doctype}: {name}, Error: {str(e)}")
+				conversions.append((name, None, None, None))
+
+		lines = [get_wkhtmltopdf_args(options, html_path, pdf_path) for name, html_path, pdf_path, options in conversions if html_path]
+		if lines:
+			run_wkhtmltopdf(lines)
+
+		return [
+			(name, pdf_path if pdf_path and is_pdf(pdf_path) else None)
+			for name, html_path, pdf_path, options in conversions
+		]
+	finally:
+		for name, html_path, pdf_path, options in conversions:
+			if options:
+				cleanup(options)
+			if html_path and os.path.exists(html_path):
+				os.remove(html_path)
+
+
+def get_wkhtmltopdf_args(options, html_path, pdf_path):
+	'''
+		One stdin line of wkhtmltopdf arguments, quoted the way wkhtmltopdf parses them
+	'''
+	args = []
+	for key, value in options.items():
+		# Repeatable options such as cookie hold a list of pairs
+		for entry in (value if isinstance(value, (list, tuple)) else [value]):
+			args.append(f"--{key}")
+			args.extend(str(part) for part in (entry if isinstance(entry, (list, tuple)) else [entry]) if part not in (None, ""))
+	args.extend([html_path, pdf_path])
+	return " ".join('"{}"'.format(arg.replace("\\", "\\\\").replace('"', '\\"')) for arg in args)
+
+
+def run_wkhtmltopdf(lines):
+	'''
+		Run the conversions in one wkhtmltopdf process
+
+		A failed conversion does not stop the others, each output is checked by the caller.
+	'''
+	try:
+		process = subprocess.run(
+			[shutil.which("wkhtmltopdf") or "wkhtmltopdf", "--read-args-from-stdin"],
+			input="\n".join(lines) + "\n",
+			capture_output=True,
+			text=True,
+			timeout=RENDER_TIMEOUT * len(lines)
+		)
+		if process.returncode:
+			frappe.logger().warning(f"[Batch PDF] wkhtmltopdf exited with {process.returncode}: {process.stderr[-1000:]}")
+	except (OSError, subprocess.TimeoutExpired) as e:
+		frappe.log_error("PDF Generation Error", f"wkhtmltopdf batch of {len(lines)} failed: {str(e)}")
+
+
+def is_pdf(path):
+	if not os.path.exists(path) or not os.path.getsize(path):
+		return False
+	with open(path, "rb") as f:
+		return f.read(5) == b"%PDF-"
@@ -0,0 +1,142 @@
+import frappe
+from frappe_sharepoint.utils import async_transport, get_request_header, make_request
+from frappe_sharepoint.utils.batch_pdf import PDF_WORKERS, RENDER_BATCH_SIZE, render_pdfs
+from frappe_sharepoint.utils.document_upload import generate_document_pdf
+from frappe_sharepoint.utils.drive_mirror import remove_items
+import os
+import shutil
+import tempfile
+import time
+
+'''
+	Benchmarks, run from the bench:
+
+		bench --site <site> execute frappe_sharepoint.utils.benchmark.benchmark_pdf_rendering --kwargs "{'doctype': 'Expense Claim'}"
+		bench --site <site> execute frappe_sharepoint.utils.benchmark.benchmark_graph_transport --kwargs "{'files': 200}"
+'''
+
+
+def benchmark_pdf_rendering(doctype, limit=20, workers=PDF_WORKERS, batch_size=RENDER_BATCH_SIZE):
+	'''
+		Compare docs/minute of per-document PDF rendering with the batch renderer
+
+		The batch renderer runs twice: with one wkhtmltopdf process per
+		document and with batch_size documents per process, so the saving
+		of the shared process shows apart from that of the threads.
+
+		Args:
+			doctype: Document type to render
+			limit: Number of recent documents to render
+			workers: Render threads of the batch renderer
+			batch_size: Documents per wkhtmltopdf process
+
+		Returns:
+			dict: docs_per_minute of the three runs and the speedups
+	'''
+	names = frappe.get_all(doctype, pluck="name", order_by="modified desc", limit_page_length=limit)
+	if not names:
+		frappe.throw(f"No {doctype} documents to render")
+
+	start = time.monotonic()
+	for name in names:
+		remove_pdf(generate_document_pdf(doctype, name))
+	per_document = time.monotonic() - start
+
+	start = time.monotonic()
+	for name, pdf_file_path in render_pdfs(doctype, names, workers=workers, batch_size=1):
+		remove_pdf(pdf_file_path)
+	process_per_document = time.monotonic() - start
+
+	start = time.monotonic()
+	for name, pdf_file_path in render_pdfs(doctype, names, workers=workers, batch_size=batch_size):
+		remove_pdf(pdf_file_path)
+	batch = time.monotonic() - start
+
+	result = {
+		"documents": len(names),
+		"workers": workers,
+		"batch_size": batch_size,
+		"per_document_docs_per_minute": round(len(names) * 60 / per_document, 1),
+		"process_per_document_docs_per_minute": round(len(names) * 60 / process_per_document, 1),
+		"batch_docs_per_minute": round(len(names) * 60 / batch, 1),
+		"speedup": round(per_document / batch, 2),
+		"shared_process_speedup": round(process_per_document / batch, 2)
+	}
+	return result
+
+
+def remove_pdf(path):
+	if path and os.path.exists(path):
+		os.remove(path)
+
+
+def benchmark_graph_transport(files=100, size_kb=64, concurrency=None):
+	'''
+		Compare files/second of one worker uploading with the sync and the async transport
+
+		Both engines upload the same generated files into a scratch folder under
+		the default drive's root folder, which is deleted afterwards. A worker
+		process runs on one core, so files/second is the throughput per worker
+		core; CPU time per file shows how much of that core each engine uses.
+
+		Args:
+			files: Number of files to upload with each engine
+			size_kb: Size of each file
+			concurrency: Uploads in flight for the async engine, defaults to the settings' limit
+
+		Returns:
+			dict: files_per_second and cpu_ms_per_file of both engines and the speedup
+	'''
+	from frappe_sharepoint.utils.sharepoint import SharePoint
+
+	if not async_transport.is_available():
+		frappe.throw("The async transport needs the aiohttp package: bench pip install aiohttp")
+
+	sharepoint = SharePoint()
+	folder_id = sharepoint.create_sharepoint_folder(
+		sharepoint.get_root_folder_id(),
+		f"Transport Benchmark {frappe.generate_hash(length=6)}"
+	)
+	if not folder_id:
+		frappe.throw("Could not create the benchmark folder")
+
+	temp_dir = tempfile.mkdtemp(prefix="sharepoint-benchmark-")
+	item_ids = [folder_id]
+	try:
+		paths = []
+		for i in range(files):
+			path = os.path.join(temp_dir, f"benchmark-{i:05d}.bin")
+			with open(path, "wb") as f:
+				f.write(os.urandom(size_kb * 1024))
+			paths.append(path)
+
+		def run(engine, prefix):
+			batch = [(path, f"{prefix}-{os.path.basename(path)}") for path in paths]
+			start, cpu_start = time.monotonic(), time.process_time()
+			items = engine(batch)
+			elapsed, cpu = time.monotonic() - start, time.process_time() - cpu_start
+			item_ids.extend(item["id"] for item in items if item)
+			uploaded = len([item for item in items if item])
+			return {
+				"uploaded": uploaded,
+				"files_per_second": round(uploaded / elapsed, 1),
+				"cpu_ms_per_file": round(cpu * 1000 / max(uploaded, 1), 1)
+			}
+
+		sync = run(lambda batch: [sharepoint.upload_file_to_folder(folder_id, path, name) for path, name in batch], "sync")
+		concurrent = run(lambda batch: async_transport.upload_files(sharepoint, folder_id, batch, concurrency), "async")
+	finally:
+		shutil.rmtree(temp_dir, ignore_errors=True)
+		make_request('DELETE', f"{sharepoint.base_url}/items/{folder_id}", get_request_header(sharepoint.settings), None)
+		remove_items(sharepoint.drive_id, item_ids)
+		frappe.db.commit()
+
+	result = {
+		"files": files,
+		"size_kb": size_kb,
+		"concurrency": concurrency or async_transport.get_concurrency(sharepoint.settings),
+		"sync": sync,
+		"async": concurrent,
+		"speedup": round(concurrent["files_per_second"] / sync["files_per_second"], 2) if sync["files_per_second"] else None
+	}
+	return result
@@ -0,0 +1,245 @@
+import frappe
+from frappe import _
+from frappe_sharepoint.utils.bandwidth import is_upload_window_open
+from frappe_sharepoint.utils.batch_pdf import render_pdfs
+from frappe_sharepoint.utils.circuit_breaker import STATE_CLOSED, allow_request, get_drive_state
+from frappe_sharepoint.utils.document_upload import get_file_path
+from frappe_sharepoint.utils.drive_routing import drive_slot, resolve_drive_route
+from frappe_sharepoint.utils.folder_tree import materialize_folders, plan_document_folders
+from frappe_sharepoint.utils.job_routing import get_hash_entries
+from frappe_sharepoint.utils.sharepoint import SharePoint, _upload_document_bundle
+import json
+import os
+
+'''
+	Upload many documents with their attachments to SharePoint in one job
+'''
+
+SETTINGS = "SharePoint Settings"
+PROGRESS_EVENT = "sharepoint_bulk_upload"
+DEFERRED_KEY = "sharepoint_bulk_upload_deferred"
+
+# Documents whose attachments are read per query
+QUERY_BATCH_SIZE = 500
+
+
+@frappe.whitelist()
+def enqueue_bulk_upload(doctype, names):
+	'''
+		Queue the upload of several documents, their PDFs and attachments
+
+		Outside the upload windows the job waits for the next one.
+
+		Returns:
+			dict: Number of queued documents and whether they wait for a window
+	'''
+	if isinstance(names, str):
+		names = json.loads(names)
+
+	settings = frappe.get_single(SETTINGS)
+	if not settings.enable_file_sync:
+		frappe.throw(_("SharePoint file sync is not enabled in SharePoint Settings"))
+
+	names = list(dict.fromkeys(names))
+	for name in names:
+		frappe.has_permission(doctype, "read", name, throw=True)
+
+	if not is_upload_window_open(settings):
+		defer_bulk_upload(doctype, names, frappe.session.user)
+		return {"queued": len(names), "deferred": True}
+
+	enqueue_run(doctype, names, frappe.session.user)
+	return {"queued": len(names)}
+
+
+def enqueue_run(doctype, names, user):
+	frappe.enqueue(
+		"frappe_sharepoint.utils.bulk_upload.run_bulk_upload",
+		queue="long",
+		timeout=max(1500, len(names) * 60),
+		doctype=doctype,
+		names=names,
+		user=user
+	)
+	frappe.logger().info(f"[Bulk Upload] Queued {len(names)} {doctype} document(s)")
+
+
+def defer_bulk_upload(doctype, names, user):
+	'''
+		Hold documents back until the next upload window opens
+	'''
+	frappe.cache().hset(DEFERRED_KEY, frappe.generate_hash(length=10), {"doctype": doctype, "names": names, "user": user})
+	frappe.logger().info(f"[Bulk Upload] Deferred {len(names)} {doctype} document(s) to the next upload window")
+
+
+def release_deferred_bulk_uploads():
+	'''
+		Scheduled job: start deferred bulk uploads once an upload window is open
+	'''
+	deferred = get_hash_entries(DEFERRED_KEY)
+	if not deferred or not is_upload_window_open(frappe.get_single(SETTINGS)):
+		return
+
+	for key, entry in deferred.items():
+		frappe.cache().hdel(DEFERRED_KEY, key)
+		enqueue_run(entry["doctype"], entry["names"], entry["user"])
+
+
+def run_bulk_upload(doctype, names, user):
+	'''
+		Upload each document's PDF and attachments into its folder
+
+		Attachments of all documents are read with a few queries, PDFs are
+		rendered in a batch while earlier documents upload, and one
+		client per drive is reused, so the token, the root folder and the
+		folder cache are shared by the whole run. The folders of all
+		documents are created before the first upload. When the upload
+		window closes, the documents not uploaded yet wait for the next one.
+	'''
+	settings = frappe.get_single(SETTINGS)
+	attachments = get_bulk_attachments(doctype, names)
+	clients = {}
+	folder_ids = prepare_folders(clients, doctype, names)
+	uploaded, failed = 0, []
+	remaining = set(names)
+	deferred = []
+
+	for done, (name, pdf_file_path) in enumerate(render_pdfs(doctype, names), 1):
+		if not is_upload_window_open(settings):
+			if pdf_file_path and os.path.exists(pdf_file_path):
+				os.remove(pdf_file_path)
+			deferred = [n for n in names if n in remaining]
+			defer_bulk_upload(doctype, deferred, user)
+			break
+
+		remaining.discard(name)
+		try:
+			result = upload_bundle(clients, doctype, name, attachments.get(name, []), pdf_file_path, folder_ids.get(name))
+		except Exception as e:
+			frappe.log_error("Bulk SharePoint Upload Error", f"{doctype}: {name}, Error: {str(e)}")
+			result = {"success": False}
+		finally:
+			if pdf_file_path and os.path.exists(pdf_file_path):
+				os.remove(pdf_file_path)
+
+		if result.get("success"):
+			uploaded += 1
+		else:
+			failed.append(name)
+
+		frappe.publish_realtime(
+			PROGRESS_EVENT,
+			{"doctype": doctype, "done": done, "total": len(names), "uploaded": uploaded, "failed": len(failed)},
+			user=user
+		)
+
+	frappe.logger().info(f"[Bulk Upload] {doctype}: {uploaded} uploaded, {len(failed)} failed {failed}, {len(deferred)} deferred")
+	message = _("{0} of {1} {2} uploaded to SharePoint").format(uploaded, len(names), _(doctype))
+	if deferred:
+		# Closes the progress bar
+		frappe.publish_realtime(PROGRESS_EVENT, {"doctype": doctype, "done": len(names), "total": len(names)}, user=user)
+		message += ", " + _("{0} wait for the next upload window").format(len(deferred))
+	frappe.publish_realtime(
+		"sharepoint_sync",
+		{
+			"message": message,
+			"indicator": "green" if not (failed or deferred) else "orange"
+		},
+		user=user
+	)
+
+
+def prepare_folders(clients, doctype, names):
+	'''
+		Create the folders of all documents, breadth-first per drive
+
+		Returns:
+			dict: document name -> target folder ID, without the documents whose folders failed
+	'''
+	documents = {}
+	for name in names:
+		documents.setdefault(get_client(clients, doctype, name), []).append(name)
+
+	folder_ids = {}
+	for sharepoint, docs in documents.items():
+		# A half open drive is probed by a single upload, not by the folder pass
+		if get_drive_state(sharepoint.drive_id) != STATE_CLOSED:
+			continue
+		try:
+			paths = plan_document_folders(sharepoint, doctype, docs)
+			with drive_slot(sharepoint.drive_id, sharepoint.max_concurrency):
+				path_ids = materialize_folders(sharepoint, paths.values())
+		except Exception as e:
+			# Each document then builds its own folders
+			frappe.log_error("Bulk SharePoint Folder Error", f"{doctype}, Drive: {sharepoint.drive_id}, Error: {str(e)}")
+			continue
+		folder_ids.update({name: path_ids[path] for name, path in paths.items() if path_ids.get(path)})
+
+	frappe.logger().info(f"[Bulk Upload] Prepared folders of {len(folder_ids)} of {len(names)} {doctype} document(s)")
+	return folder_ids
+
+
+def upload_bundle(clients, doctype, docname, attachments, pdf_file_path, target_folder_id=None):
+	'''
+		Upload one document with the client of its drive
+	'''
+	files = [{
+		'filepath': attachment['file_path'],
+		'filename': attachment['file_name'],
+		'is_temp': False,
+		'file_doc': attachment['name']
+	} for attachment in attachments]
+	if pdf_file_path:
+		files.insert(0, {'filepath': pdf_file_path, 'filename': f"{docname}.pdf", 'is_temp': True})
+
+	sharepoint = get_client(clients, doctype, docname)
+	if not allow_request(sharepoint.drive_id):
+		return {"success": False, "message": "SharePoint is currently unavailable"}
+
+	with drive_slot(sharepoint.drive_id, sharepoint.max_concurrency):
+		result = _upload_document_bundle(sharepoint, doctype, docname, files, concurrent=True, target_folder_id=target_folder_id)
+	# Commit per document, so a failure later in the run keeps earlier results
+	frappe.db.commit()
+	return result
+
+
+def get_client(clients, doctype, docname):
+	'''
+		One SharePoint client per drive and root folder for the whole run
+	'''
+	route = resolve_drive_route(frappe.get_cached_doc(SETTINGS), doctype, docname)
+	key = (route.drive_id, route.root_folder_path)
+	if key not in clients:
+		clients[key] = SharePoint(doctype=doctype, docname=docname)
+	return clients[key]
+
+
+def get_bulk_attachments(doctype, names):
+	'''
+		Attachments of many documents, one query per QUERY_BATCH_SIZE documents
+
+		Returns:
+			dict: document name -> list of attachments as in get_document_attachments
+	'''
+	attachments = {}
+	for start in range(0, len(names), QUERY_BATCH_SIZE):
+		files = frappe.get_all(
+			"File",
+			filters={
+				"attached_to_doctype": doctype,
+				"attached_to_name": ["in", names[start:start + QUERY_BATCH_SIZE]]
+			},
+			fields=["name", "file_name", "file_url", "is_private", "attached_to_name"]
+		)
+
+		for file_doc in files:
+			file_path = get_file_path(file_doc)
+			if not file_path:
+				continue
+			attachments.setdefault(file_doc.attached_to_name, []).append({
+				'name': file_doc.name,
+				'file_name': file_doc.file_name,
+				'file_path': file_path
+			})
+
+	return attachments
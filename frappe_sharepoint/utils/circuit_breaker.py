@@ -0,0 +1,201 @@
+import frappe
+import re
+import time
+
+'''
+	Circuit breaker for Microsoft Graph and Azure AD outages
+
+	Every tenant has a circuit for calls that are not tied to a drive (Azure AD,
+	sites, upload sessions) and one circuit per drive. A run of connection
+	errors, timeouts or 5xx responses opens a circuit. While it is open, upload
+	jobs are parked instead of waiting on timeouts. Once the cooldown passes,
+	the circuit is half open and lets a single probe through: success closes it,
+	failure opens it again for a longer cooldown.
+
+	Each circuit is a Redis hash that workers update atomically, with HINCRBY
+	and a Lua script for the transitions, so concurrent failures all count.
+'''
+
+SETTINGS = "SharePoint Settings"
+CIRCUIT_PREFIX = "sharepoint_circuit:"
+PROBE_PREFIX = "sharepoint_circuit_probe:"
+
+STATE_CLOSED = "Closed"
+STATE_OPEN = "Open"
+STATE_HALF_OPEN = "Half Open"
+
+FAILURE_THRESHOLD = 5
+BASE_COOLDOWN = 60
+MAX_COOLDOWN = 15 * 60
+# A probe that neither succeeds nor fails within this time lets the next one through
+PROBE_TIMEOUT = 5 * 60
+
+# Timeouts are reported as 408, connection errors as 503 by make_request
+FAILURE_STATUSES = (408,)
+DRIVE_URL = re.compile(r"/drives/([^/?:]+)")
+
+# KEYS: circuit, probe. ARGV: now, threshold, base cooldown, max cooldown.
+# Returns the transition (opened, reopened or none) and the failure count.
+RECORD_FAILURE = """
+local failures = redis.call('HINCRBY', KEYS[1], 'failures', 1)
+redis.call('HSET', KEYS[1], 'last_failure', ARGV[1])
+local opened_at = tonumber(redis.call('HGET', KEYS[1], 'opened_at'))
+local cooldown = tonumber(redis.call('HGET', KEYS[1], 'cooldown'))
+if opened_at then
+	if tonumber(ARGV[1]) >= opened_at + cooldown then
+		cooldown = math.min(cooldown * 2, tonumber(ARGV[4]))
+		redis.call('HSET', KEYS[1], 'opened_at', ARGV[1], 'cooldown', cooldown)
+		redis.call('DEL', KEYS[2])
+		return {'reopened', failures, cooldown}
+	end
+elseif failures >= tonumber(ARGV[2]) then
+	redis.call('HSET', KEYS[1], 'opened_at', ARGV[1], 'cooldown', ARGV[3])
+	return {'opened', failures, tonumber(ARGV[3])}
+end
+return {'none', failures, cooldown or 0}
+"""
+
+
+def get_drive_from_url(url):
+	match = DRIVE_URL.search(url or "")
+	return match.group(1) if match else None
+
+
+def is_failure(status_code):
+	return status_code >= 500 or status_code in FAILURE_STATUSES
+
+
+def get_circuit_key(drive_id=None, tenant_id=None):
+	tenant_id = tenant_id or frappe.get_cached_doc(SETTINGS).tenant_id
+	return f"{tenant_id}:{drive_id or '*'}"
+
+
+def get_circuit(key):
+	'''
+		failures, opened_at, cooldown and last_failure of a circuit, empty while it is closed without failures
+	'''
+	cache = frappe.cache()
+	fields = cache.execute_command("HGETALL", cache.make_key(f"{CIRCUIT_PREFIX}{key}")) or {}
+	if isinstance(fields, list):
+		fields = dict(zip(fields[::2], fields[1::2]))
+	circuit = {frappe.safe_decode(field): float(value) for field, value in fields.items()}
+	if "failures" in circuit:
+		circuit["failures"] = int(circuit["failures"])
+	return circuit
+
+
+def get_state(circuit):
+	if not circuit.get("opened_at"):
+		return STATE_CLOSED
+	if time.time() < circuit["opened_at"] + circuit["cooldown"]:
+		return STATE_OPEN
+	return STATE_HALF_OPEN
+
+
+def get_circuit_keys(drive_id=None, tenant_id=None):
+	'''
+		The tenant circuit and, for drive calls, the drive's circuit
+	'''
+	keys = [get_circuit_key(None, tenant_id)]
+	if drive_id:
+		keys.append(get_circuit_key(drive_id, tenant_id))
+	return keys
+
+
+def get_drive_state(drive_id=None):
+	'''
+		Combined state of the tenant and drive circuits, the worst one wins
+	'''
+	states = [get_state(get_circuit(key)) for key in get_circuit_keys(drive_id)]
+	for state in (STATE_OPEN, STATE_HALF_OPEN):
+		if state in states:
+			return state
+	return STATE_CLOSED
+
+
+def allow_request(drive_id=None):
+	'''
+		Whether work against the drive may start now
+
+		Closed circuits allow everything. Half open circuits allow one probe
+		at a time, open circuits nothing.
+	'''
+	cache = frappe.cache()
+	for key in get_circuit_keys(drive_id):
+		state = get_state(get_circuit(key))
+		if state == STATE_OPEN:
+			return False
+		if state == STATE_HALF_OPEN:
+			probe_key = cache.make_key(f"{PROBE_PREFIX}{key}")
+			if not cache.set(probe_key, frappe.local.site, nx=True, ex=PROBE_TIMEOUT):
+				return False
+	return True
+
+
+def record_result(status_code, drive_id=None, tenant_id=None):
+	'''
+		Feed the outcome of a Graph or Azure AD call into the circuits
+	'''
+	if is_failure(status_code):
+		record_failure(drive_id, tenant_id)
+	else:
+		record_success(drive_id, tenant_id)
+
+
+def record_success(drive_id=None, tenant_id=None):
+	# A drive answering means the tenant is reachable too
+	cache = frappe.cache()
+	for key in get_circuit_keys(drive_id, tenant_id):
+		# DEL answers whether there was a circuit to close
+		if cache.execute_command("DEL", cache.make_key(f"{CIRCUIT_PREFIX}{key}")):
+			cache.delete_value(f"{PROBE_PREFIX}{key}")
+			frappe.logger().info(f"[Circuit Breaker] {key} closed")
+
+
+def record_failure(drive_id=None, tenant_id=None):
+	cache = frappe.cache()
+	key = get_circuit_key(drive_id, tenant_id)
+	transition, failures, cooldown = cache.eval(
+		RECORD_FAILURE,
+		2,
+		cache.make_key(f"{CIRCUIT_PREFIX}{key}"),
+		cache.make_key(f"{PROBE_PREFIX}{key}"),
+		time.time(),
+		FAILURE_THRESHOLD,
+		BASE_COOLDOWN,
+		MAX_COOLDOWN
+	)
+
+	transition = frappe.safe_decode(transition)
+	if transition == "reopened":
+		# The probe failed, back off further
+		frappe.logger().warning(f"[Circuit Breaker] {key} probe failed, open for {cooldown}s")
+	elif transition == "opened":
+		frappe.logger().warning(f"[Circuit Breaker] {key} opened after {failures} failures")
+
+
+def is_circuit_open(url=None, drive_id=None):
+	'''
+		Whether a failure on this URL happens while its circuit is already open
+
+		Failures are expected then and are not written to the Error Log again.
+	'''
+	drive_id = drive_id or get_drive_from_url(url)
+	return get_drive_state(drive_id) != STATE_CLOSED
+
+
+def get_circuit_states(settings, drives):
+	'''
+		States of the tenant circuit and the given drives' circuits, for the settings form
+	'''
+	states = []
+	for label, drive_id in [("Azure AD / Graph", None)] + [(drive, drive) for drive in drives]:
+		circuit = get_circuit(get_circuit_key(drive_id, settings.tenant_id))
+		state = get_state(circuit)
+		states.append({
+			"label": label,
+			"state": state,
+			"failures": circuit.get("failures", 0),
+			"retry_in": max(0, int(circuit["opened_at"] + circuit["cooldown"] - time.time())) if state == STATE_OPEN else 0
+		})
+	return states
@@ -0,0 +1,133 @@
+import os
+import re
+import frappe
+from frappe import _
+from frappe.utils import cint
+from frappe_sharepoint.utils.drive_mirror import upsert_items
+from frappe_sharepoint.utils.download import cache_download_url, get_offloaded_file_url
+from frappe_sharepoint.utils.sharepoint import UPLOAD_CHUNK_SIZE, SharePoint
+from frappe_sharepoint.utils.sync_state import SYNC_STATE, make_sync_result, record_sync_results
+
+'''
+	Direct browser-to-SharePoint uploads through Graph upload sessions
+'''
+
+SETTINGS = "SharePoint Settings"
+
+# Browsers upload in larger chunks than workers, still a multiple of 320 KiB
+BROWSER_CHUNK_SIZE = UPLOAD_CHUNK_SIZE * 2
+# Upload sessions expire after some idle time, the handle lives a little longer
+SESSION_TTL = 24 * 60 * 60
+
+
+def get_session_key(session_id, user=None):
+	# Sessions are keyed by their user, nobody else can complete them
+	return f"sharepoint_direct_upload:{user or frappe.session.user}:{session_id}"
+
+
+def is_session_item_name(name, filename):
+	'''
+		Whether an item is named as the session's file, or as Graph renames it on a conflict ("name 1.pdf")
+	'''
+	stem, extension = os.path.splitext(filename)
+	pattern = rf"{re.escape(stem)}( \d+)?{re.escape(extension)}"
+	return bool(re.fullmatch(pattern, name or "", flags=re.IGNORECASE))
+
+
+@frappe.whitelist()
+def create_upload_session(doctype, docname, filename, file_size, is_private=1):
+	'''
+		Create an upload session in the document's SharePoint folder
+
+		The browser uploads the chunks straight to the returned URL and then
+		calls complete_direct_upload, so the bytes never pass through Frappe.
+
+		Returns:
+			dict: session_id, upload_url and chunk_size
+	'''
+	settings = frappe.get_single(SETTINGS)
+	if not settings.enable_file_sync:
+		frappe.throw(_("SharePoint file sync is not enabled in SharePoint Settings"))
+
+	frappe.has_permission(doctype, "write", docname, throw=True)
+
+	sharepoint = SharePoint(doctype=doctype, docname=docname)
+	target_folder_id = sharepoint.build_folder_structure()
+	if not target_folder_id:
+		frappe.throw(_("Could not determine target folder in SharePoint"))
+
+	session = sharepoint.create_upload_session(target_folder_id, filename, conflict_behavior="rename")
+	if not session:
+		frappe.throw(_("Could not start the upload to SharePoint"))
+
+	session_id = frappe.generate_hash(length=20)
+	frappe.cache().set_value(get_session_key(session_id), {
+		"doctype": doctype,
+		"docname": docname,
+		"drive_id": sharepoint.drive_id,
+		"folder_id": target_folder_id,
+		"filename": filename,
+		"file_size": cint(file_size),
+		"is_private": cint(is_private)
+	}, expires_in_sec=SESSION_TTL)
+
+	frappe.logger().info(f"[Direct Upload] Session {session_id} for {filename} ({file_size} bytes) on {doctype}: {docname}")
+
+	return {
+		"session_id": session_id,
+		"upload_url": session["uploadUrl"],
+		"expires": session.get("expirationDateTime"),
+		"chunk_size": BROWSER_CHUNK_SIZE
+	}
+
+
+@frappe.whitelist()
+def complete_direct_upload(session_id, item_id):
+	'''
+		Create the File record for a file the browser uploaded to SharePoint
+
+		Returns:
+			dict: The new File's name and file_url
+	'''
+	key = get_session_key(session_id)
+	session = frappe.cache().get_value(key)
+	if not session:
+		frappe.throw(_("Upload session has expired, please upload the file again"))
+
+	sharepoint = SharePoint(doctype=session["doctype"], docname=session["docname"], drive_id=session["drive_id"])
+	item = sharepoint.get_drive_item(item_id)
+
+	# Only accept the item the session was created for
+	if (
+		not item
+		or "file" not in item
+		or (item.get("parentReference") or {}).get("id") != session["folder_id"]
+		or not is_session_item_name(item.get("name"), session["filename"])
+	):
+		frappe.throw(_("Uploaded file was not found in SharePoint"))
+	if cint(item.get("size")) != session["file_size"]:
+		frappe.throw(_("Uploaded file is incomplete, please upload the file again"))
+	# An item already linked to a File belongs to an earlier upload
+	if frappe.db.exists(SYNC_STATE, {"drive_id": sharepoint.drive_id, "item_id": item["id"]}):
+		frappe.throw(_("Uploaded file is already attached"))
+
+	upsert_items(sharepoint.drive_id, [item])
+	file_doc = frappe.get_doc({
+		"doctype": "File",
+		"file_name": item["name"],
+		"file_url": item["webUrl"],
+		"file_size": item.get("size"),
+		"attached_to_doctype": session["doctype"],
+		"attached_to_name": session["docname"],
+		"is_private": session["is_private"],
+		"uploaded_to_sharepoint": 1
+	})
+	file_doc.insert()
+
+	file_url = get_offloaded_file_url(sharepoint.settings, file_doc.name, item)
+	record_sync_results([make_sync_result(file_doc.name, sharepoint.drive_id, item=item, file_url=file_url)])
+	cache_download_url(file_doc.name, item)
+	frappe.cache().delete_value(key)
+
+	frappe.logger().info(f"[Direct Upload] Created File {file_doc.name} for item {item_id}")
+	return {"name": file_doc.name, "file_url": file_url}
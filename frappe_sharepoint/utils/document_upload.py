@@ -1,6 +1,8 @@
 import frappe
 from frappe import _
 from frappe.utils.pdf import get_pdf
+from frappe_sharepoint.utils.profiler import JOB_DOCUMENT_UPLOAD, profile_job, should_profile
+from concurrent.futures import ThreadPoolExecutor
 import os
 import tempfile
 
@@ -8,17 +10,24 @@ SETTINGS = "SharePoint Settings"
 
 
 @frappe.whitelist()
-def upload_document_to_sharepoint(doctype, docname):
+def upload_document_to_sharepoint(doctype, docname, profile=0):
 	"""
 	Upload document PDF along with all attachments to SharePoint
 	
 	Args:
 		doctype: Document type (e.g., "Expense Claim")
 		docname: Document name (e.g., "HR-EXP-2025-00033")
+		profile: Run the upload under the profiler and store a SharePoint Profile
 	
 	Returns:
 		dict: Upload status and SharePoint folder URL
 	"""
+	settings = frappe.get_single(SETTINGS)
+	with profile_job(JOB_DOCUMENT_UPLOAD, doctype, docname, enabled=should_profile(settings, profile)):
+		return _upload_document_to_sharepoint(doctype, docname)
+
+
+def _upload_document_to_sharepoint(doctype, docname):
 	try:
 		frappe.logger().info(f"[SharePoint Upload] Starting upload for {doctype}: {docname}")
 		
@@ -29,67 +38,52 @@ def upload_document_to_sharepoint(doctype, docname):
 		if not settings.enable_file_sync:
 			frappe.throw(_("SharePoint file sync is not enabled in SharePoint Settings"))
 		
-		# Generate document PDF
-		frappe.logger().info(f"[SharePoint Upload] Generating PDF for {docname}")
-		pdf_file_path = generate_document_pdf(doctype, docname)
-		frappe.logger().info(f"[SharePoint Upload] PDF generated at: {pdf_file_path}")
-		
-		# Get all attachments for the document
-		frappe.logger().info(f"[SharePoint Upload] Fetching attachments for {docname}")
-		attachments = get_document_attachments(doctype, docname)
-		frappe.logger().info(f"[SharePoint Upload] Found {len(attachments)} attachments: {[a['file_name'] for a in attachments]}")
-		
-		# Prepare files list for upload
-		files_to_upload = []
-		
-		# Add PDF to upload list
-		if pdf_file_path:
-			files_to_upload.append({
-				'filepath': pdf_file_path,
-				'filename': f"{docname}.pdf",
-				'is_temp': True  # Mark for cleanup after upload
-			})
-			frappe.logger().info(f"[SharePoint Upload] Added PDF to upload list: {docname}.pdf")
-		else:
-			frappe.logger().warning(f"[SharePoint Upload] PDF generation failed, no PDF to upload")
-		
-		# Add attachments to upload list
-		for attachment in attachments:
-			files_to_upload.append({
-				'filepath': attachment['file_path'],
-				'filename': attachment['file_name'],
-				'is_temp': False,
-				'file_doc': attachment['name']
-			})
-			frappe.logger().info(f"[SharePoint Upload] Added attachment: {attachment['file_name']}")
-		
-		if not files_to_upload:
-			frappe.logger().warning(f"[SharePoint Upload] No files to upload for {docname}")
-			frappe.msgprint(_("No files to upload. Document has no attachments."))
-			return {'success': False, 'message': 'No files to upload'}
-		
-		frappe.logger().info(f"[SharePoint Upload] Total files to upload: {len(files_to_upload)}")
+		# Render the PDF in the background while folders are resolved and attachments uploaded
+		frappe.logger().info(f"[SharePoint Upload] Rendering PDF for {docname} in the background")
+		with ThreadPoolExecutor(max_workers=1) as executor:
+			pdf_render = executor.submit(
+				render_pdf_in_site_context,
+				frappe.local.site,
+				frappe.local.sites_path,
+				frappe.session.user,
+				doctype,
+				docname
+			)
+			
+			# Get all attachments for the document
+			frappe.logger().info(f"[SharePoint Upload] Fetching attachments for {docname}")
+			attachments = get_document_attachments(doctype, docname)
+			frappe.logger().info(f"[SharePoint Upload] Found {len(attachments)} attachments: {[a['file_name'] for a in attachments]}")
+			
+			# Without attachments there is nothing to overlap the render with
+			if not attachments and not get_rendered_pdf(pdf_render):
+				frappe.logger().warning(f"[SharePoint Upload] No files to upload for {docname}")
+				frappe.msgprint(_("No files to upload. Document has no attachments."))
+				return {'success': False, 'message': 'No files to upload'}
+			
+			# Upload to SharePoint
+			from frappe_sharepoint.utils.sharepoint import upload_document_bundle
+			frappe.logger().info(f"[SharePoint Upload] Calling upload_document_bundle with {len(attachments)} attachments and the PDF")
+			try:
+				result = upload_document_bundle(
+					doctype=doctype,
+					docname=docname,
+					files=iter_bundle_files(docname, attachments, pdf_render)
+				)
+			finally:
+				# Cleanup temporary PDF file
+				pdf_file_path = get_rendered_pdf(pdf_render)
+				if pdf_file_path and os.path.exists(pdf_file_path):
+					os.remove(pdf_file_path)
+					frappe.logger().info(f"[SharePoint Upload] Cleaned up temp PDF: {pdf_file_path}")
 		
-		# Upload to SharePoint
-		from frappe_sharepoint.utils.sharepoint import upload_document_bundle
-		frappe.logger().info(f"[SharePoint Upload] Calling upload_document_bundle with {len(files_to_upload)} files")
-		result = upload_document_bundle(
-			doctype=doctype,
-			docname=docname,
-			files=files_to_upload
-		)
 		frappe.logger().info(f"[SharePoint Upload] Upload result: {result}")
 		
-		# Cleanup temporary PDF file
-		if pdf_file_path and os.path.exists(pdf_file_path):
-			os.remove(pdf_file_path)
-			frappe.logger().info(f"[SharePoint Upload] Cleaned up temp PDF: {pdf_file_path}")
-		
 		if result.get('success'):
 			frappe.logger().info(f"[SharePoint Upload] Upload completed successfully for {docname}")
 			frappe.msgprint(
 				_("Document uploaded to SharePoint successfully!<br>Files uploaded: {0}").format(
-					len(files_to_upload)
+					result.get('uploaded_count')
 				),
 				indicator='green',
 				title=_('Upload Successful')
@@ -105,13 +99,72 @@ def upload_document_to_sharepoint(doctype, docname):
 		frappe.throw(_("Failed to upload document to SharePoint: {0}").format(str(e)))
 
 
-def generate_document_pdf(doctype, docname):
+def iter_bundle_files(docname, attachments, pdf_render):
+	"""
+	Yield the bundle's files as they become available
+	
+	Attachments are ready at once, the PDF is yielded when its render finishes.
+	
+	Args:
+		docname: Document name
+		attachments: Attachments from get_document_attachments
+		pdf_render: Future of render_pdf_in_site_context
+	"""
+	for attachment in attachments:
+		frappe.logger().info(f"[SharePoint Upload] Added attachment: {attachment['file_name']}")
+		yield {
+			'filepath': attachment['file_path'],
+			'filename': attachment['file_name'],
+			'is_temp': False,
+			'file_doc': attachment['name']
+		}
+	
+	pdf_file_path = get_rendered_pdf(pdf_render)
+	if pdf_file_path:
+		frappe.logger().info(f"[SharePoint Upload] Added PDF to upload list: {docname}.pdf")
+		yield {
+			'filepath': pdf_file_path,
+			'filename': f"{docname}.pdf",
+			'is_temp': True  # Mark for cleanup after upload
+		}
+	else:
+		frappe.logger().warning(f"[SharePoint Upload] PDF generation failed, no PDF to upload")
+
+
+def get_rendered_pdf(pdf_render):
+	"""Wait for the background render and return the PDF path, None if it failed"""
+	try:
+		return pdf_render.result()
+	except Exception as e:
+		frappe.logger().error(f"[SharePoint Upload] PDF render failed: {str(e)}")
+		return None
+
+
+def render_pdf_in_site_context(site, sites_path, user, doctype, docname):
+	"""
+	Generate the document PDF from a worker thread
+	
+	Frappe's database connection and locals are per thread, so the
+	thread sets up its own site context for the user who started the upload.
+	"""
+	frappe.init(site=site, sites_path=sites_path)
+	try:
+		frappe.connect()
+		frappe.set_user(user)
+		return generate_document_pdf(doctype, docname)
+	finally:
+		frappe.destroy()
+
+
+def generate_document_pdf(doctype, docname, output_dir=None, pdf_options=None):
 	"""
 	Generate PDF for a document using its print format
 	
 	Args:
 		doctype: Document type
 		docname: Document name
+		output_dir: Folder to write the PDF to, the temp folder by default
+		pdf_options: Extra wkhtmltopdf options passed to get_pdf
 	
 	Returns:
 		str: Path to temporary PDF file
@@ -130,11 +183,11 @@ def generate_document_pdf(doctype, docname):
 		frappe.logger().info(f"[PDF Generation] HTML content length: {len(html_content)} chars")
 		
 		frappe.logger().info(f"[PDF Generation] Converting HTML to PDF")
-		pdf_content = get_pdf(html_content)
+		pdf_content = get_pdf(html_content, options=pdf_options)
 		frappe.logger().info(f"[PDF Generation] PDF content size: {len(pdf_content)} bytes")
 		
 		# Create temporary file
-		temp_dir = tempfile.gettempdir()
+		temp_dir = output_dir or tempfile.gettempdir()
 		pdf_filename = f"{docname}.pdf"
 		pdf_path = os.path.join(temp_dir, pdf_filename)
 		frappe.logger().info(f"[PDF Generation] Saving to: {pdf_path}")
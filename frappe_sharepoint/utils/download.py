@@ -0,0 +1,157 @@
+import frappe
+from frappe import _
+from frappe.utils import get_url
+from urllib.parse import quote
+from werkzeug.utils import send_file
+from werkzeug.wrappers import Response
+import requests
+
+'''
+	Downloads of files that were offloaded to SharePoint
+'''
+
+SETTINGS = "SharePoint Settings"
+SYNC_STATE = "SharePoint Sync State"
+DOWNLOAD_METHOD = "frappe_sharepoint.utils.download.download_file"
+
+# Graph download URLs are pre-authenticated and valid for about an hour
+DOWNLOAD_URL_TTL = 50 * 60
+DOWNLOAD_URL_FIELD = "@microsoft.graph.downloadUrl"
+
+STREAM_CHUNK_SIZE = 64 * 1024
+PASSTHROUGH_HEADERS = ("Content-Type", "Content-Length", "Content-Range", "Accept-Ranges", "ETag", "Last-Modified")
+# Statuses the storage endpoint answers with once a download URL has expired
+EXPIRED_URL_STATUSES = (401, 403, 404, 410)
+
+LINK_DOWNLOAD = "Download Link"
+LINK_WEB_URL = "SharePoint Web URL"
+
+
+def get_download_link(file_doc):
+	'''
+		Absolute URL of the download endpoint for a File
+	'''
+	return get_url(f"/api/method/{DOWNLOAD_METHOD}?file={quote(file_doc)}")
+
+
+def get_offloaded_file_url(settings, file_doc, item):
+	'''
+		The file_url an offloaded File gets, depending on the settings
+	'''
+	if settings.get("offloaded_file_link") == LINK_WEB_URL:
+		return item.get("webUrl")
+	return get_download_link(file_doc)
+
+
+def get_download_url_key(file_doc):
+	return f"sharepoint_download_url:{file_doc}"
+
+
+def cache_download_url(file_doc, item):
+	'''
+		Remember the download URL returned with a driveItem
+	'''
+	download_url = (item or {}).get(DOWNLOAD_URL_FIELD)
+	if download_url:
+		frappe.cache().set_value(get_download_url_key(file_doc), download_url, expires_in_sec=DOWNLOAD_URL_TTL)
+	return download_url
+
+
+@frappe.whitelist(allow_guest=True)
+def download_file(file):
+	'''
+		Serve an offloaded File
+
+		Public files are redirected to their pre-authenticated download URL,
+		private files are streamed through this endpoint with Range support.
+		The download URL is cached, so repeated opens do not call Graph.
+		With tiered storage, files are served from the local download cache.
+	'''
+	file_doc = frappe.get_doc("File", file)
+
+	if file_doc.is_private and not file_doc.is_downloadable():
+		raise frappe.PermissionError(_("You don't have permission to access this file"))
+
+	from frappe_sharepoint.utils.tiered_storage import get_cached_file, is_tiered_storage_enabled
+
+	settings = frappe.get_single(SETTINGS)
+	if is_tiered_storage_enabled(settings):
+		path = get_cached_file(file_doc, settings)
+		if path:
+			return send_file(path, frappe.request.environ, download_name=file_doc.file_name, conditional=True)
+
+	download_url = get_download_url(file_doc)
+	if not download_url:
+		frappe.throw(_("File {0} is not available in SharePoint").format(file_doc.file_name), frappe.DoesNotExistError)
+
+	if file_doc.is_private:
+		response = stream_download(file_doc, download_url)
+		if response.status_code not in EXPIRED_URL_STATUSES:
+			return response
+
+		# Cached URL went stale before its TTL, fetch a fresh one once
+		response.close()
+		download_url = get_download_url(file_doc, refresh=True)
+		if not download_url:
+			frappe.throw(_("File {0} is not available in SharePoint").format(file_doc.file_name), frappe.DoesNotExistError)
+		return stream_download(file_doc, download_url)
+
+	frappe.local.response["type"] = "redirect"
+	frappe.local.response["location"] = download_url
+
+
+def get_download_url(file_doc, refresh=False):
+	'''
+		Pre-authenticated download URL of the File's driveItem, cached until shortly before it expires
+	'''
+	key = get_download_url_key(file_doc.name)
+	if not refresh:
+		download_url = frappe.cache().get_value(key)
+		if download_url:
+			return download_url
+
+	from frappe_sharepoint.utils.sharepoint import SharePoint
+
+	state = frappe.db.get_value(SYNC_STATE, file_doc.name, ["drive_id", "item_id", "archive_entry"], as_dict=True)
+	sharepoint = SharePoint(
+		doctype=file_doc.attached_to_doctype,
+		docname=file_doc.attached_to_name,
+		drive_id=state.drive_id if state else None
+	)
+
+	if state and state.archive_entry:
+		# The item is the document's attachment ZIP, not the File
+		item = None
+	elif state and state.item_id:
+		item = sharepoint.get_drive_item(state.item_id, select=f"id,{DOWNLOAD_URL_FIELD}")
+	elif (file_doc.file_url or "").startswith("http"):
+		# Files offloaded before sync state was recorded still carry their webUrl
+		item = sharepoint.get_drive_item_by_url(file_doc.file_url)
+	else:
+		item = None
+
+	return cache_download_url(file_doc.name, item)
+
+
+def stream_download(file_doc, download_url):
+	'''
+		Proxy the bytes of a driveItem, passing Range requests through
+	'''
+	headers = {}
+	if frappe.request and frappe.request.headers.get("Range"):
+		headers["Range"] = frappe.request.headers.get("Range")
+
+	remote = requests.get(download_url, headers=headers, stream=True, timeout=30)
+
+	response = Response(
+		remote.iter_content(STREAM_CHUNK_SIZE),
+		status=remote.status_code,
+		direct_passthrough=True
+	)
+	response.call_on_close(remote.close)
+	for header in PASSTHROUGH_HEADERS:
+		if header in remote.headers:
+			response.headers[header] = remote.headers[header]
+	response.headers["Content-Disposition"] = f"inline; filename*=UTF-8''{quote(file_doc.file_name or file_doc.name)}"
+
+	return response
@@ -0,0 +1,270 @@
+import frappe
+from frappe.query_builder.functions import Concat
+from frappe.utils import add_to_date, get_datetime, now_datetime
+from frappe_sharepoint.utils.sync_state import get_remote_datetime, get_remote_path, upsert_rows
+
+'''
+	Local mirror of the driveItems the app manages
+
+	Folder lookups, folder URLs and "is it already there" questions are
+	answered from the SharePoint Drive Item table first. Entries are written
+	from Graph responses the app receives anyway (uploads, folder lookups
+	and creates) and reconciled incrementally with the drive's delta feed.
+'''
+
+MIRROR = "SharePoint Drive Item"
+SETTINGS = "SharePoint Settings"
+DELTA_LINKS_KEY = "sharepoint_delta_links"
+
+# Entries older than this are treated as a miss and refreshed from Graph
+MIRROR_MAX_AGE_DAYS = 7
+# Rows written per statement
+BATCH_SIZE = 500
+DELTA_SELECT = "id,name,parentReference,eTag,size,file,folder,root,webUrl,lastModifiedDateTime,deleted"
+
+MIRROR_FIELDS = [
+	"name",
+	"drive_id",
+	"item_id",
+	"parent_id",
+	"item_name",
+	"is_folder",
+	"is_root",
+	"size",
+	"etag",
+	"remote_path",
+	"web_url",
+	"quick_xor_hash",
+	"remote_modified_on",
+	"synced_on",
+	"creation",
+	"modified",
+	"owner",
+	"modified_by",
+	"docstatus",
+	"idx"
+]
+# Columns an upsert overwrites on rows that already exist
+UPDATED_FIELDS = [
+	field for field in MIRROR_FIELDS
+	if field not in ("name", "drive_id", "item_id", "creation", "owner", "docstatus", "idx")
+]
+
+
+def get_mirror_name(drive_id, item_id):
+	return f"{drive_id}:{item_id}"
+
+
+def is_fresh(row):
+	return row and row.synced_on and get_datetime(row.synced_on) > add_to_date(now_datetime(), days=-MIRROR_MAX_AGE_DAYS)
+
+
+def get_item(drive_id, item_id):
+	'''
+		Mirrored driveItem, None on a miss or a stale entry
+	'''
+	row = frappe.db.get_value(MIRROR, get_mirror_name(drive_id, item_id), ["*"], as_dict=True)
+	return row if is_fresh(row) else None
+
+
+def find_child(drive_id, parent_id, item_name):
+	'''
+		Mirrored child of a folder by name, None on a miss or a stale entry
+	'''
+	rows = frappe.get_all(
+		MIRROR,
+		filters={"drive_id": drive_id, "parent_id": parent_id, "item_name": item_name},
+		fields=["item_id", "is_folder", "web_url", "synced_on"],
+		limit_page_length=1
+	)
+	return rows[0] if rows and is_fresh(rows[0]) else None
+
+
+def find_children(drive_id, children):
+	'''
+		Mirrored children of many folders in one query
+
+		Args:
+			children: List of (parent ID, item name)
+
+		Returns:
+			dict: (parent ID, item name) -> item ID of the fresh folders among them
+	'''
+	if not children:
+		return {}
+
+	wanted = set(children)
+	rows = frappe.get_all(
+		MIRROR,
+		filters={
+			"drive_id": drive_id,
+			"parent_id": ["in", list({parent_id for parent_id, item_name in wanted})],
+			"item_name": ["in", list({item_name for parent_id, item_name in wanted})],
+			"is_folder": 1
+		},
+		fields=["item_id", "parent_id", "item_name", "synced_on"]
+	)
+	return {
+		(row.parent_id, row.item_name): row.item_id
+		for row in rows if (row.parent_id, row.item_name) in wanted and is_fresh(row)
+	}
+
+
+def get_root(drive_id):
+	rows = frappe.get_all(
+		MIRROR,
+		filters={"drive_id": drive_id, "is_root": 1},
+		fields=["item_id", "web_url", "synced_on"],
+		limit_page_length=1
+	)
+	return rows[0] if rows and is_fresh(rows[0]) else None
+
+
+def upsert_items(drive_id, items):
+	'''
+		Write driveItems returned by Graph into the mirror, in bulk
+
+		Rows are upserted in the caller's transaction, which commits them.
+	'''
+	items = [item for item in items if item and item.get("id")]
+	now = now_datetime()
+	user = frappe.session.user
+
+	for start in range(0, len(items), BATCH_SIZE):
+		values = {}
+		for item in items[start:start + BATCH_SIZE]:
+			name = get_mirror_name(drive_id, item["id"])
+			hashes = (item.get("file") or {}).get("hashes") or {}
+			values[name] = (
+				name,
+				drive_id,
+				item["id"],
+				(item.get("parentReference") or {}).get("id"),
+				item.get("name"),
+				1 if "folder" in item or "root" in item else 0,
+				1 if "root" in item else 0,
+				item.get("size"),
+				item.get("eTag"),
+				# Delta responses carry no parent path
+				get_remote_path(item) if (item.get("parentReference") or {}).get("path") else None,
+				item.get("webUrl"),
+				hashes.get("quickXorHash"),
+				get_remote_datetime(item.get("lastModifiedDateTime")),
+				now,
+				now,
+				now,
+				user,
+				user,
+				0,
+				0
+			)
+
+		upsert_rows(MIRROR, MIRROR_FIELDS, list(values.values()), UPDATED_FIELDS)
+
+
+def remove_items(drive_id, item_ids):
+	if item_ids:
+		frappe.db.delete(MIRROR, {"name": ("in", [get_mirror_name(drive_id, item_id) for item_id in item_ids])})
+
+
+def get_ancestor_ids(drive_id, item_id):
+	'''
+		IDs of a mirrored item and of its mirrored ancestors, up to the drive root
+	'''
+	item_ids = []
+	while item_id and item_id not in item_ids:
+		row = frappe.db.get_value(MIRROR, get_mirror_name(drive_id, item_id), ["parent_id", "is_root"], as_dict=True)
+		if row and row.is_root:
+			break
+		item_ids.append(item_id)
+		item_id = row.parent_id if row else None
+	return item_ids
+
+
+def reconcile_drive_items():
+	'''
+		Scheduled job: apply remote changes to the mirrored items of every drive
+	'''
+	from frappe_sharepoint.utils.drive_routing import get_configured_drives
+
+	settings = frappe.get_single(SETTINGS)
+	if not settings.enable_file_sync:
+		return
+
+	for drive_id in get_configured_drives(settings):
+		try:
+			reconcile_drive(settings, drive_id)
+			frappe.db.commit()
+		except Exception as e:
+			frappe.db.rollback()
+			frappe.log_error("SharePoint Mirror Reconcile Error", f"Drive: {drive_id}, Error: {str(e)}")
+
+
+def reconcile_drive(settings, drive_id):
+	'''
+		Follow the drive's delta feed from the last saved position
+
+		Only items already in the mirror are updated or removed, the mirror
+		covers what the app manages rather than the whole drive. Without a
+		saved position the feed starts at the current state of the drive.
+	'''
+	from frappe_sharepoint.utils import get_request_header, make_request
+
+	headers = get_request_header(settings)
+	url = frappe.cache().hget(DELTA_LINKS_KEY, drive_id)
+	if not url:
+		url = f"{settings.graph_api_url}/drives/{drive_id}/root/delta?token=latest&$select={DELTA_SELECT}"
+
+	changed = removed = 0
+	while url:
+		response = make_request('GET', url, headers, None)
+		if response.status_code == 410:
+			# The saved position expired, start over from now
+			frappe.cache().hdel(DELTA_LINKS_KEY, drive_id)
+			frappe.logger().warning(f"[Drive Mirror] Delta position of drive {drive_id} expired, restarting")
+			return
+		if not response.ok:
+			frappe.log_error("SharePoint Mirror Reconcile Error", f"Drive: {drive_id}, Status: {response.status_code}, Error: {response.text}")
+			return
+
+		data = response.json()
+		items = data.get("value", [])
+		if items:
+			known = get_known_item_ids(drive_id, [item["id"] for item in items])
+			deleted = [item["id"] for item in items if item["id"] in known and "deleted" in item]
+			updated = [item for item in items if item["id"] in known and "deleted" not in item]
+			remove_items(drive_id, deleted)
+			upsert_items(drive_id, updated)
+			changed += len(updated)
+			removed += len(deleted)
+
+		url = data.get("@odata.nextLink")
+		if not url and data.get("@odata.deltaLink"):
+			delta_link = data["@odata.deltaLink"]
+			if "$select" not in delta_link:
+				delta_link += f"{'&' if '?' in delta_link else '?'}$select={DELTA_SELECT}"
+			frappe.cache().hset(DELTA_LINKS_KEY, drive_id, delta_link)
+
+	if changed or removed:
+		frappe.logger().info(f"[Drive Mirror] Drive {drive_id}: {changed} updated, {removed} removed")
+
+
+def get_known_item_ids(drive_id, item_ids):
+	names = frappe.get_all(
+		MIRROR,
+		filters={"name": ("in", [get_mirror_name(drive_id, item_id) for item_id in item_ids])},
+		pluck="item_id"
+	)
+	return set(names)
+
+
+def update_child_paths(drive_id, parent_id, parent_path):
+	'''
+		Point the mirrored children of a moved folder to its new path
+	'''
+	Item = frappe.qb.DocType(MIRROR)
+	(
+		frappe.qb.update(Item)
+		.set(Item.remote_path, Concat(f"{parent_path.rstrip('/')}/", Item.item_name))
+		.where((Item.drive_id == drive_id) & (Item.parent_id == parent_id))
+	).run()
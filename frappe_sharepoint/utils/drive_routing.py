@@ -0,0 +1,173 @@
+import frappe
+from frappe.utils import cint
+from contextlib import contextmanager
+import hashlib
+import time
+
+'''
+	Routing of documents to SharePoint drives and per-drive concurrency limits
+'''
+
+ROUTE_BY_DOCTYPE = "DocType"
+ROUTE_BY_COMPANY = "Company"
+ROUTE_BY_NAME_HASH = "Name Hash"
+
+# A slot is released by its job; the lease frees slots of jobs that died holding one.
+# Jobs lease their slot for their RQ timeout, anything else for SLOT_LEASE.
+SLOT_LEASE = 30 * 60
+SLOT_LEASE_MARGIN = 60
+SLOT_WAIT = 10 * 60
+SLOT_POLL = 2
+
+
+def get_default_route(settings):
+	return frappe._dict(
+		drive_id=settings.sharepoint_drive_id,
+		site_id=settings.sharepoint_site_id,
+		root_folder_path=settings.root_folder_path,
+		max_concurrency=cint(settings.get("max_concurrent_uploads"))
+	)
+
+
+def get_document_company(doctype, docname):
+	if not (doctype and docname) or not frappe.get_meta(doctype).has_field("company"):
+		return None
+	return frappe.db.get_value(doctype, docname, "company")
+
+
+def get_name_bucket(docname, buckets):
+	return int(hashlib.md5(str(docname).encode()).hexdigest(), 16) % buckets
+
+
+def resolve_drive_route(settings, doctype=None, docname=None, fields_from=None, company=None):
+	'''
+		Pick the drive a document's files go to
+
+		DocType routes win over Company routes, which win over the Name Hash
+		pool. Documents matched by none of them use the drive in the settings.
+		Unless the caller passes the company, it is read from the document,
+		or from the one named fields_from when given.
+
+		Returns:
+			frappe._dict: drive_id, site_id, root_folder_path and max_concurrency
+	'''
+	routes = settings.get("drive_routes") or []
+	if not routes:
+		return get_default_route(settings)
+
+	match = None
+	for route in routes:
+		if route.route_by == ROUTE_BY_DOCTYPE and route.document_type == doctype:
+			match = route
+			break
+
+	if not match and any(r.route_by == ROUTE_BY_COMPANY for r in routes):
+		if company is None:
+			company = get_document_company(doctype, fields_from or docname)
+		if company:
+			match = next((r for r in routes if r.route_by == ROUTE_BY_COMPANY and r.company == company), None)
+
+	if not match and docname:
+		pool = [r for r in routes if r.route_by == ROUTE_BY_NAME_HASH]
+		if pool:
+			match = pool[get_name_bucket(docname, len(pool))]
+
+	if not match:
+		return get_default_route(settings)
+
+	return frappe._dict(
+		drive_id=match.drive_id,
+		site_id=match.site_id,
+		root_folder_path=match.root_folder_path or settings.root_folder_path,
+		max_concurrency=cint(match.max_concurrency)
+	)
+
+
+def get_configured_drives(settings):
+	'''
+		All drives uploads can go to, the default drive first
+	'''
+	drives = [settings.sharepoint_drive_id] if settings.sharepoint_drive_id else []
+	for route in settings.get("drive_routes") or []:
+		if route.drive_id and route.drive_id not in drives:
+			drives.append(route.drive_id)
+	return drives
+
+
+def get_slot_lease():
+	'''
+		Seconds a slot may be held: the timeout of the running job, SLOT_LEASE outside jobs
+	'''
+	try:
+		from rq import get_current_job
+		job = get_current_job()
+		if job and cint(job.timeout) > 0:
+			return cint(job.timeout) + SLOT_LEASE_MARGIN
+	except Exception:
+		pass
+	return SLOT_LEASE
+
+
+def acquire_drive_slot(drive_id, limit, lease=None):
+	'''
+		Take one of the drive's concurrency slots without waiting
+
+		Slots live in a Redis sorted set scored by the end of their lease, so
+		slots of jobs that were killed expire on their own.
+
+		Returns:
+			str: Token to release the slot with, None when all slots are taken
+	'''
+	cache = frappe.cache()
+	key = cache.make_key(f"sharepoint_drive_slots:{drive_id}")
+	token = frappe.generate_hash(length=12)
+	lease = lease or get_slot_lease()
+	now = time.time()
+
+	pipe = cache.pipeline()
+	pipe.zremrangebyscore(key, 0, now)
+	pipe.zadd(key, {token: now + lease})
+	pipe.zcard(key)
+	pipe.ttl(key)
+	taken, ttl = pipe.execute()[2:]
+	if taken <= limit:
+		# Keep the set as long as its longest lease
+		cache.expire(key, int(max(lease, ttl)))
+		return token
+
+	cache.zrem(key, token)
+	return None
+
+
+def release_drive_slot(drive_id, token):
+	if token:
+		frappe.cache().zrem(frappe.cache().make_key(f"sharepoint_drive_slots:{drive_id}"), token)
+
+
+@contextmanager
+def drive_slot(drive_id, limit, lease=None):
+	'''
+		Hold one of the drive's concurrency slots for the duration of a bundle or bulk upload
+
+		A caller that cannot get a slot within SLOT_WAIT goes ahead anyway
+		rather than failing. Single file jobs don't wait here: they are
+		parked until a slot is free, see trigger_sharepoint_upload.
+	'''
+	if not limit or not drive_id:
+		yield
+		return
+
+	deadline = time.monotonic() + SLOT_WAIT
+	while True:
+		token = acquire_drive_slot(drive_id, limit, lease)
+		if token:
+			break
+		if time.monotonic() > deadline:
+			frappe.logger().warning(f"[Drive Routing] No free slot on drive {drive_id} after {SLOT_WAIT}s, continuing")
+			break
+		time.sleep(SLOT_POLL)
+
+	try:
+		yield
+	finally:
+		release_drive_slot(drive_id, token)
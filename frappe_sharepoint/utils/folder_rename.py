@@ -0,0 +1,115 @@
+import frappe
+from frappe_sharepoint.utils.download import LINK_WEB_URL
+from frappe_sharepoint.utils.drive_mirror import get_item, update_child_paths
+from frappe_sharepoint.utils.drive_routing import resolve_drive_route
+from frappe_sharepoint.utils.folder_template import get_folder_path
+from frappe_sharepoint.utils.sync_state import STATUS_SYNCED, SYNC_STATE, get_remote_path, update_file_urls, update_remote_paths
+
+'''
+	Follow document renames in SharePoint
+
+	A renamed document's folder is moved to the path of its new name with
+	one PATCH, so its files are not uploaded again into a new folder and the
+	old one is not left behind.
+'''
+
+SETTINGS = "SharePoint Settings"
+
+
+def move_document_folder(doctype, old, new):
+	'''
+		Move the folder of a document renamed from old to new
+	'''
+	from frappe_sharepoint.utils.sharepoint import SharePoint
+
+	settings = frappe.get_single(SETTINGS)
+	route = resolve_drive_route(settings, doctype, new)
+	old_route = resolve_drive_route(settings, doctype, old, fields_from=new)
+	if (route.drive_id, route.root_folder_path) != (old_route.drive_id, old_route.root_folder_path):
+		# A folder cannot be moved to another drive in one call, new uploads go to the new place
+		frappe.logger().info(f"[Rename] {doctype} {old} -> {new} changes drive or root folder, not moving its folder")
+		return
+
+	sharepoint = SharePoint(doctype=doctype, docname=new)
+	old_path = get_folder_path(sharepoint.folder_template, doctype, old, fields_from=new)
+	new_path = get_folder_path(sharepoint.folder_template, doctype, new)
+	if not new_path or old_path == new_path:
+		return
+
+	old_parent_id, folder_id = find_folder(sharepoint, old_path)
+	if not folder_id:
+		frappe.logger().info(f"[Rename] {doctype} {old} has no folder in SharePoint")
+		return
+
+	new_parent_id = sharepoint.root_folder_id
+	for folder_name in new_path[:-1]:
+		new_parent_id = new_parent_id and sharepoint.get_or_create_folder(new_parent_id, folder_name)
+	if not new_parent_id:
+		return
+
+	old_folder = get_item(sharepoint.drive_id, folder_id)
+	folder = sharepoint.move_item(folder_id, new_parent_id, new_path[-1])
+	if not folder:
+		return
+
+	frappe.cache().delete_value(sharepoint.get_folder_cache_key(old_parent_id, old_path[-1]))
+	sharepoint.set_cached_folder_id(new_parent_id, new_path[-1], folder_id)
+	update_stored_paths(settings, sharepoint.drive_id, doctype, new, folder, old_folder)
+	frappe.logger().info(f"[Rename] Moved folder of {doctype} {old} to {'/'.join(new_path)}")
+
+
+def find_folder(sharepoint, path):
+	'''
+		Resolve an existing folder path below the root folder without creating anything
+
+		Returns:
+			tuple: (parent folder ID, folder ID), the folder ID is None when the path does not exist
+	'''
+	if not sharepoint.root_folder_id:
+		sharepoint.root_folder_id = sharepoint.get_root_folder_id()
+
+	parent_id, folder_id = None, sharepoint.root_folder_id
+	for folder_name in path:
+		if not folder_id:
+			break
+		parent_id = folder_id
+		folder_id = (
+			sharepoint.get_cached_folder_id(parent_id, folder_name)
+			or sharepoint.get_folder_id_by_name(parent_id, folder_name)
+		)
+	return parent_id, folder_id
+
+
+def update_stored_paths(settings, drive_id, doctype, docname, folder, old_folder):
+	'''
+		Point the mirror, the Sync States and web links of the moved files to the folder's new path
+	'''
+	folder_path = get_remote_path(folder)
+	update_child_paths(drive_id, folder["id"], folder_path)
+
+	# Renaming updated attached_to_name of the document's Files and their Sync States
+	states = frappe.get_all(
+		SYNC_STATE,
+		filters={
+			"attached_to_doctype": doctype,
+			"attached_to_name": docname,
+			"drive_id": drive_id,
+			"status": STATUS_SYNCED
+		},
+		fields=["name", "remote_path"]
+	)
+	update_remote_paths({
+		state.name: f"{folder_path}/{state.remote_path.rsplit('/', 1)[-1]}"
+		for state in states if state.remote_path
+	})
+
+	# Web links are path based, download links are not
+	old_url = old_folder and old_folder.web_url
+	if not (states and settings.replace_file_link and settings.get("offloaded_file_link") == LINK_WEB_URL and old_url and folder.get("webUrl")):
+		return
+
+	files = frappe.get_all("File", filters={"name": ["in", [state.name for state in states]]}, fields=["name", "file_url"])
+	update_file_urls({
+		f.name: folder["webUrl"] + f.file_url[len(old_url):]
+		for f in files if (f.file_url or "").startswith(f"{old_url}/")
+	})
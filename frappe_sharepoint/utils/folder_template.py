@@ -0,0 +1,175 @@
+import frappe
+from frappe import _
+from frappe.utils import get_datetime
+from functools import lru_cache
+from string import Formatter
+import datetime
+import hashlib
+import re
+
+'''
+	Folder layout templates, e.g. {module}/{doctype}/{posting_date:%Y}/{name}
+'''
+
+STRUCTURE_TEMPLATES = {
+	"Module/DocType/Document": "{module}/{doctype}/{name}",
+	"Flat": ""
+}
+CUSTOM_STRUCTURE = "Custom"
+
+# Placeholders that do not need the document to be loaded
+BUILTIN_FIELDS = ("module", "doctype", "name", "name_hash")
+DEFAULT_HASH_LENGTH = 2
+
+# Characters SharePoint does not allow in folder names
+INVALID_CHARS = re.compile(r'["*:<>?/\\|]')
+
+
+class Placeholder(object):
+	def __init__(self, field, spec):
+		self.field = field
+		self.spec = spec
+
+
+def get_folder_template(settings):
+	'''
+		Folder template for the configured folder structure
+	'''
+	structure = settings.get("folder_structure") or "Module/DocType/Document"
+	if structure == CUSTOM_STRUCTURE:
+		return (settings.get("folder_template") or "").strip().strip("/")
+	return STRUCTURE_TEMPLATES.get(structure, STRUCTURE_TEMPLATES["Module/DocType/Document"])
+
+
+@lru_cache(maxsize=32)
+def parse_folder_template(template):
+	'''
+		Parse a template into segments of literal text and placeholders
+
+		Returns:
+			tuple: One tuple per folder level, each holding str and Placeholder parts
+	'''
+	segments = []
+	for raw_segment in (template or "").split("/"):
+		if not raw_segment.strip():
+			continue
+
+		parts = []
+		for literal, field, spec, conversion in Formatter().parse(raw_segment):
+			if literal:
+				parts.append(literal)
+			if field is None:
+				continue
+			if not field.isidentifier():
+				raise ValueError(_("Invalid placeholder {{{0}}} in folder template").format(field))
+			if field == "name_hash" and spec and not spec.isdigit():
+				raise ValueError(_("{name_hash} takes a length, e.g. {name_hash:2}"))
+			parts.append(Placeholder(field, spec))
+
+		segments.append(tuple(parts))
+
+	return tuple(segments)
+
+
+def get_template_fields(segments):
+	'''
+		Document fields a parsed template needs, other than the built-in ones
+	'''
+	return sorted({
+		part.field
+		for segment in segments
+		for part in segment
+		if isinstance(part, Placeholder) and part.field not in BUILTIN_FIELDS
+	})
+
+
+def get_document_fields(segments, doctype):
+	'''
+		Template fields to read from a document, fields the DocType does not have evaluate to an empty string
+	'''
+	if not doctype:
+		return []
+	meta = frappe.get_meta(doctype)
+	return [field for field in get_template_fields(segments) if meta.has_field(field)]
+
+
+def uses_field(segments, field):
+	return any(isinstance(part, Placeholder) and part.field == field for segment in segments for part in segment)
+
+
+def get_folder_path(template, doctype, docname, fields_from=None, field_values=None):
+	'''
+		Evaluate a folder template against a document
+
+		Segments that evaluate to an empty string are skipped, so a missing
+		module, document name or date, or a field the DocType does not have,
+		does not create an empty folder.
+		Fields are read from the document named fields_from when given, e.g.
+		to rebuild the path a renamed document had under its old name.
+		Callers that read the module and fields of many documents at once
+		pass them as field_values, and nothing is read from the database.
+
+		Returns:
+			list: Folder names from the root folder down to the target folder
+	'''
+	segments = parse_folder_template(template)
+	if not segments:
+		return []
+
+	values = {
+		"doctype": doctype,
+		"name": docname,
+		"name_hash": docname
+	}
+
+	if field_values is not None:
+		values.update(field_values)
+	else:
+		if doctype and uses_field(segments, "module"):
+			values["module"] = frappe.db.get_value("DocType", doctype, "module")
+
+		fields = get_document_fields(segments, doctype)
+		if fields and docname:
+			values.update(frappe.db.get_value(doctype, fields_from or docname, fields, as_dict=True) or {})
+
+	path = []
+	for segment in segments:
+		folder_name = "".join(
+			format_value(part, values.get(part.field)) if isinstance(part, Placeholder) else part
+			for part in segment
+		)
+		folder_name = INVALID_CHARS.sub("_", folder_name).strip()
+		if folder_name:
+			path.append(folder_name)
+
+	return path
+
+
+def format_value(placeholder, value):
+	if value in (None, ""):
+		return ""
+
+	if placeholder.field == "name_hash":
+		length = int(placeholder.spec or DEFAULT_HASH_LENGTH)
+		return hashlib.md5(str(value).encode()).hexdigest()[:length]
+
+	if isinstance(value, str) and placeholder.spec and "%" in placeholder.spec:
+		value = get_datetime(value)
+
+	if isinstance(value, (datetime.date, datetime.datetime)):
+		return value.strftime(placeholder.spec) if placeholder.spec else str(value)
+
+	return format(value, placeholder.spec) if placeholder.spec else str(value)
+
+
+def validate_folder_template(template):
+	'''
+		Raise if the template cannot be parsed
+	'''
+	try:
+		segments = parse_folder_template(template)
+	except ValueError as e:
+		frappe.throw(str(e), title=_("Invalid Folder Template"))
+
+	if not segments:
+		frappe.throw(_("Folder Template cannot be empty"), title=_("Invalid Folder Template"))
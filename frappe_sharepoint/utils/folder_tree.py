@@ -0,0 +1,172 @@
+import frappe
+from frappe_sharepoint.utils import get_request_header, make_request
+from frappe_sharepoint.utils.drive_mirror import find_children, upsert_items
+from frappe_sharepoint.utils.folder_template import get_folder_path
+from urllib.parse import quote
+
+'''
+	Create the folders of a whole batch of documents before uploading
+
+	Documents of a bulk job share most of their folders (Module, DocType,
+	...). Their paths are collected up front and the tree is materialised
+	breadth-first: each level is looked up in the folder cache and the drive
+	mirror in bulk, and the missing folders are created with Graph $batch
+	requests of up to 20 creates each. A folder is resolved or created once
+	per job, and siblings never race each other for their parent.
+'''
+
+# Graph accepts at most 20 requests per $batch
+GRAPH_BATCH_SIZE = 20
+# Folders looked up in the drive mirror per query
+MIRROR_BATCH_SIZE = 500
+
+
+def plan_document_folders(sharepoint, doctype, names):
+	'''
+		Folder path of each document below the client's root folder
+
+		Returns:
+			dict: document name -> tuple of folder names
+	'''
+	return {name: tuple(get_folder_path(sharepoint.folder_template, doctype, name)) for name in names}
+
+
+def materialize_folders(sharepoint, paths):
+	'''
+		Resolve or create every folder of the given paths, level by level
+
+		Args:
+			sharepoint: SharePoint client of the drive
+			paths: Iterable of folder paths, tuples of folder names
+
+		Returns:
+			dict: folder path -> folder ID, without the paths that could not be created
+	'''
+	if not sharepoint.root_folder_id:
+		sharepoint.root_folder_id = sharepoint.get_root_folder_id()
+	folder_ids = {(): sharepoint.root_folder_id}
+	if not sharepoint.root_folder_id:
+		return {}
+
+	paths = set(paths)
+	depth = max([len(path) for path in paths] or [0])
+	for level in range(1, depth + 1):
+		# Folders of this level whose parent exists
+		level_paths = sorted({path[:level] for path in paths if len(path) >= level and path[:level - 1] in folder_ids})
+		if not level_paths:
+			break
+
+		missing = resolve_known_folders(sharepoint, level_paths, folder_ids)
+		if missing:
+			create_folders(sharepoint, missing, folder_ids)
+
+		frappe.logger().info(f"[Folder Tree] Level {level}: {len(level_paths)} folder(s), {len(missing)} sent to SharePoint")
+
+	return folder_ids
+
+
+def resolve_known_folders(sharepoint, level_paths, folder_ids):
+	'''
+		Fill in the folders known to the folder cache or the drive mirror
+
+		Returns:
+			list: Paths of the folders still unknown
+	'''
+	missing = []
+	for path in level_paths:
+		folder_id = sharepoint.get_cached_folder_id(folder_ids[path[:-1]], path[-1])
+		if folder_id:
+			folder_ids[path] = folder_id
+		else:
+			missing.append(path)
+
+	unknown = []
+	for start in range(0, len(missing), MIRROR_BATCH_SIZE):
+		batch = missing[start:start + MIRROR_BATCH_SIZE]
+		mirrored = find_children(sharepoint.drive_id, [(folder_ids[path[:-1]], path[-1]) for path in batch])
+		for path in batch:
+			parent_id = folder_ids[path[:-1]]
+			folder_id = mirrored.get((parent_id, path[-1]))
+			if folder_id:
+				folder_ids[path] = folder_id
+				sharepoint.set_cached_folder_id(parent_id, path[-1], folder_id)
+			else:
+				unknown.append(path)
+	return unknown
+
+
+def create_folders(sharepoint, missing, folder_ids):
+	'''
+		Create folders of one level with $batch requests
+
+		Folders that already exist in SharePoint answer 409 and are looked up
+		with a second batch. Whatever a batch cannot settle falls back to
+		get_or_create_folder.
+	'''
+	from frappe_sharepoint.utils.sharepoint import FOLDER_SELECT
+
+	drive_path = f"/drives/{sharepoint.drive_id}"
+	creates = [{
+		"method": "POST",
+		"url": f"{drive_path}/items/{folder_ids[path[:-1]]}/children",
+		"body": {"name": path[-1], "folder": {}, "@microsoft.graph.conflictBehavior": "fail"},
+		"headers": {"Content-Type": "application/json"}
+	} for path in missing]
+
+	existing, failed = [], []
+	for path, response in zip(missing, send_batch(sharepoint.settings, creates)):
+		if response and response.get("status") == 201:
+			add_folder(sharepoint, path, response["body"], folder_ids)
+		elif response and response.get("status") == 409:
+			existing.append(path)
+		else:
+			failed.append(path)
+
+	lookups = [{
+		"method": "GET",
+		"url": f"{drive_path}/items/{folder_ids[path[:-1]]}:/{quote(path[-1])}?$select={FOLDER_SELECT}"
+	} for path in existing]
+	for path, response in zip(existing, send_batch(sharepoint.settings, lookups)):
+		if response and response.get("status") == 200 and "folder" in response.get("body", {}):
+			add_folder(sharepoint, path, response["body"], folder_ids)
+		else:
+			failed.append(path)
+
+	for path in failed:
+		folder_id = sharepoint.get_or_create_folder(folder_ids[path[:-1]], path[-1])
+		if folder_id:
+			folder_ids[path] = folder_id
+
+
+def add_folder(sharepoint, path, folder, folder_ids):
+	folder_ids[path] = folder["id"]
+	upsert_items(sharepoint.drive_id, [folder])
+	sharepoint.set_cached_folder_id(folder_ids[path[:-1]], path[-1], folder["id"])
+
+
+def send_batch(settings, requests):
+	'''
+		Send Graph requests in $batch requests of GRAPH_BATCH_SIZE
+
+		Args:
+			requests: List of dicts with method, url relative to the API version, and optional body and headers
+
+		Returns:
+			list: The response of each request, with status, headers and body, or None when its batch failed
+	'''
+	responses = []
+	url = f"{settings.graph_api_url}/$batch"
+	for start in range(0, len(requests), GRAPH_BATCH_SIZE):
+		batch = [dict(request, id=str(index)) for index, request in enumerate(requests[start:start + GRAPH_BATCH_SIZE])]
+		headers = get_request_header(settings)
+		headers.update({"Content-Type": "application/json"})
+
+		response = make_request('POST', url, headers, {"requests": batch})
+		if not response or not response.ok:
+			frappe.log_error("SharePoint Batch Error", response.text if response else "No response")
+			responses.extend([None] * len(batch))
+			continue
+
+		by_id = {entry["id"]: entry for entry in response.json().get("responses", [])}
+		responses.extend(by_id.get(request["id"]) for request in batch)
+	return responses
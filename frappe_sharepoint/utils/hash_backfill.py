@@ -0,0 +1,96 @@
+import frappe
+from frappe_sharepoint.utils.document_upload import get_file_path
+from frappe_sharepoint.utils.file_hash import get_integrity, hash_file
+from frappe_sharepoint.utils.sync_state import STATUS_SYNCED, SYNC_STATE, update_integrity
+from concurrent.futures import ProcessPoolExecutor
+import multiprocessing
+import os
+
+'''
+	Hash Files uploaded before integrity checks existed
+
+	Hashing is CPU bound, so the local copies of a page of Sync States are
+	hashed in a pool of processes. The workers only run hash_file and never
+	touch the database; the job compares their results with the
+	quickXorHash SharePoint reported at upload time and records them.
+'''
+
+# Sync State rows hashed and written per page
+BATCH_SIZE = 200
+
+
+@frappe.whitelist()
+def enqueue_hash_backfill():
+	frappe.only_for("System Manager")
+	frappe.enqueue(
+		"frappe_sharepoint.utils.hash_backfill.backfill_file_hashes",
+		queue="long",
+		timeout=8 * 60 * 60
+	)
+
+
+def backfill_file_hashes(workers=None):
+	'''
+		Hash and verify the local copies of synced Files that have no SHA-256 yet
+
+		Args:
+			workers: Processes in the pool, defaults to the number of CPUs
+	'''
+	workers = workers or os.cpu_count() or 1
+	counts = {}
+
+	# Spawned workers do not inherit the job's database connection
+	with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn")) as pool:
+		for rows in iter_unhashed_files():
+			results = {}
+			for row, local in zip(rows, pool.map(hash_file, [row.path for row in rows])):
+				if not local:
+					continue
+				remote = {"size": row.file_size, "file": {"hashes": {"quickXorHash": row.quick_xor_hash}}}
+				results[row.name] = (local["sha256_hash"], get_integrity(local, remote))
+
+			update_integrity(results)
+			frappe.db.commit()
+			for file_hash, integrity in results.values():
+				counts[integrity] = counts.get(integrity, 0) + 1
+
+	frappe.logger().info(f"[Hash Backfill] Hashed {sum(counts.values())} file(s): {counts}")
+	return counts
+
+
+def iter_unhashed_files():
+	'''
+		Synced Files with a local copy and no SHA-256, in pages
+	'''
+	State = frappe.qb.DocType(SYNC_STATE)
+	File = frappe.qb.DocType("File")
+	after = ""
+
+	while True:
+		rows = (
+			frappe.qb.from_(State)
+			.join(File).on(File.name == State.file)
+			.select(
+				State.name, State.file_size, State.quick_xor_hash,
+				File.file_name, File.file_url, File.is_private
+			)
+			.where(
+				(State.status == STATUS_SYNCED)
+				& (State.is_evicted == 0)
+				& (State.sha256_hash.isnull() | (State.sha256_hash == ""))
+				& (State.archive_entry.isnull() | (State.archive_entry == ""))
+				& (State.name > after)
+			)
+			.orderby(State.name)
+			.limit(BATCH_SIZE)
+		).run(as_dict=True)
+
+		if not rows:
+			return
+
+		after = rows[-1].name
+		for row in rows:
+			row.path = get_file_path(row)
+		rows = [row for row in rows if row.path]
+		if rows:
+			yield rows
@@ -0,0 +1,389 @@
+import frappe
+from frappe.utils import cint, flt
+from frappe_sharepoint.utils.bandwidth import is_upload_window_open
+from frappe_sharepoint.utils.circuit_breaker import STATE_HALF_OPEN, STATE_OPEN, get_drive_state
+from frappe_sharepoint.utils.drive_routing import resolve_drive_route
+import os
+import time
+
+'''
+	Queue routing, job timeouts and stall detection for SharePoint uploads
+'''
+
+SETTINGS = "SharePoint Settings"
+UPLOAD_METHOD = "frappe_sharepoint.utils.sharepoint.trigger_sharepoint_upload"
+
+THROUGHPUT_KEY = "sharepoint_upload_throughput"
+INFLIGHT_KEY = "sharepoint_upload_inflight"
+PARKED_KEY = "sharepoint_upload_parked"
+DEFERRED_KEY = "sharepoint_upload_deferred"
+
+LANE_AUTO = "Auto"
+LANE_FAST = "Fast"
+LANE_STANDARD = "Standard"
+LANE_LARGE = "Large"
+
+DEFAULT_SMALL_FILE_KB = 1024
+DEFAULT_LARGE_FILE_MB = 32
+DEFAULT_THROUGHPUT_KBPS = 256
+DEFAULT_STALL_MINUTES = 15
+
+# Token fetch and folder resolution happen before the first byte is sent
+BASE_JOB_TIMEOUT = 120
+# Expected transfer time is multiplied by this before it becomes a timeout
+TIMEOUT_SAFETY_FACTOR = 3
+MAX_JOB_TIMEOUT = 6 * 60 * 60
+MAX_UPLOAD_ATTEMPTS = 3
+
+# Uploads smaller than this are dominated by latency and say nothing about bandwidth
+MIN_THROUGHPUT_SAMPLE = 256 * 1024
+THROUGHPUT_SMOOTHING = 0.2
+
+
+def get_file_size(filepath):
+	if not filepath:
+		return 0
+	try:
+		return os.path.getsize(filepath)
+	except OSError:
+		return 0
+
+
+def get_small_file_threshold(settings):
+	return cint(settings.get("small_file_threshold") or DEFAULT_SMALL_FILE_KB) * 1024
+
+
+def get_large_file_threshold(settings):
+	return cint(settings.get("large_file_threshold") or DEFAULT_LARGE_FILE_MB) * 1024 * 1024
+
+
+def is_large_file(settings, file_size):
+	'''
+		Large files are uploaded in chunks through an upload session
+	'''
+	return file_size >= get_large_file_threshold(settings)
+
+
+def get_rule_lane(settings, doctype):
+	for rule in settings.get("upload_rules") or []:
+		if rule.document_type == doctype:
+			return rule.upload_lane
+	return None
+
+
+def get_upload_lane(settings, doctype, file_size):
+	'''
+		Pick the upload lane for a file from the upload rules and its size
+	'''
+	lane = get_rule_lane(settings, doctype)
+	if lane and lane != LANE_AUTO:
+		return lane
+
+	if is_large_file(settings, file_size):
+		return LANE_LARGE
+	if file_size <= get_small_file_threshold(settings):
+		return LANE_FAST
+	return LANE_STANDARD
+
+
+def get_lane_queue(settings, lane):
+	if lane == LANE_FAST:
+		return settings.get("fast_queue") or "short"
+	if lane == LANE_LARGE:
+		return settings.get("large_file_queue") or "long"
+	return settings.get("standard_queue") or "default"
+
+
+def get_upload_throughput(settings):
+	'''
+		Measured upload throughput in bytes per second, or the configured assumption
+	'''
+	measured = flt(frappe.cache().get_value(THROUGHPUT_KEY))
+	if measured > 0:
+		return measured
+	return cint(settings.get("default_upload_throughput") or DEFAULT_THROUGHPUT_KBPS) * 1024
+
+
+def record_upload_throughput(file_size, elapsed):
+	'''
+		Fold a completed upload into the moving average used for job timeouts
+	'''
+	if elapsed <= 0 or file_size < MIN_THROUGHPUT_SAMPLE:
+		return
+
+	sample = file_size / elapsed
+	current = flt(frappe.cache().get_value(THROUGHPUT_KEY))
+	if current > 0:
+		sample = (1 - THROUGHPUT_SMOOTHING) * current + THROUGHPUT_SMOOTHING * sample
+
+	frappe.cache().set_value(THROUGHPUT_KEY, sample)
+
+
+def get_job_timeout(settings, file_size):
+	'''
+		Job timeout in seconds derived from the file size and the upload throughput
+	'''
+	expected = file_size / get_upload_throughput(settings)
+	return int(min(BASE_JOB_TIMEOUT + TIMEOUT_SAFETY_FACTOR * expected, MAX_JOB_TIMEOUT))
+
+
+def get_stall_window(settings, file_size):
+	'''
+		Seconds without progress after which an upload counts as stalled
+
+		Chunked uploads report progress after every chunk, single requests
+		only when they finish, so those get their whole job timeout.
+	'''
+	if is_large_file(settings, file_size):
+		return cint(settings.get("stall_timeout") or DEFAULT_STALL_MINUTES) * 60
+	return get_job_timeout(settings, file_size) + BASE_JOB_TIMEOUT
+
+
+def enqueue_file_upload(doctype, docname, filepath, filedoc, settings=None, attempt=1, bulk=False, profile=False):
+	'''
+		Enqueue a file upload on the lane and with the timeout that fit its size
+
+		Bulk uploads, e.g. re-queued by an audit, wait for the next upload
+		window when none is open. Uploads of newly attached files never wait.
+		With profile, the job runs under the profiler.
+	'''
+	settings = settings or frappe.get_single(SETTINGS)
+
+	if bulk and not is_upload_window_open(settings):
+		defer_upload(doctype, docname, filepath, filedoc, attempt)
+		return
+
+	# Don't start jobs that would only wait on timeouts
+	drive_id = resolve_drive_route(settings, doctype, docname).drive_id
+	if get_drive_state(drive_id) == STATE_OPEN:
+		park_upload(doctype, docname, filepath, filedoc, drive_id, attempt, bulk)
+		return
+
+	file_size = get_file_size(filepath)
+	lane = get_upload_lane(settings, doctype, file_size)
+	queue = get_lane_queue(settings, lane)
+	timeout = get_job_timeout(settings, file_size)
+
+	frappe.logger().info(f"[Job Routing] {filedoc} ({file_size} bytes) -> {lane} lane, queue {queue}, timeout {timeout}s")
+
+	frappe.enqueue(
+		UPLOAD_METHOD,
+		queue=queue,
+		timeout=timeout,
+		doctype=doctype,
+		docname=docname,
+		filepath=filepath,
+		filedoc=filedoc,
+		attempt=attempt,
+		bulk=bulk,
+		profile=profile
+	)
+
+
+def park_upload(doctype, docname, filepath, filedoc, drive_id, attempt=1, bulk=False, reason="SharePoint circuit is open"):
+	'''
+		Hold an upload back while SharePoint is unavailable or the drive has no free slot
+
+		Parked uploads are enqueued again by release_parked_uploads once the
+		drive's circuit allows it.
+	'''
+	frappe.logger().info(f"[Job Routing] Parking upload of {filedoc}, {reason}")
+	frappe.cache().hset(PARKED_KEY, filedoc, {
+		"doctype": doctype,
+		"docname": docname,
+		"filepath": filepath,
+		"drive_id": drive_id,
+		"attempt": attempt,
+		"bulk": bulk
+	})
+
+
+def defer_upload(doctype, docname, filepath, filedoc, attempt=1):
+	'''
+		Hold a bulk upload back until the next upload window opens
+	'''
+	frappe.logger().info(f"[Job Routing] Deferring upload of {filedoc} to the next upload window")
+	frappe.cache().hset(DEFERRED_KEY, filedoc, {
+		"doctype": doctype,
+		"docname": docname,
+		"filepath": filepath,
+		"attempt": attempt
+	})
+
+
+def release_deferred_uploads():
+	'''
+		Scheduled job: enqueue deferred bulk uploads once an upload window is open
+	'''
+	deferred = get_hash_entries(DEFERRED_KEY)
+	if not deferred:
+		return
+
+	settings = frappe.get_single(SETTINGS)
+	if not is_upload_window_open(settings):
+		return
+
+	for filedoc, entry in deferred.items():
+		frappe.cache().hdel(DEFERRED_KEY, filedoc)
+		enqueue_file_upload(
+			doctype=entry.get("doctype"),
+			docname=entry.get("docname"),
+			filepath=entry.get("filepath"),
+			filedoc=filedoc,
+			settings=settings,
+			attempt=entry.get("attempt") or 1,
+			bulk=True
+		)
+
+	frappe.logger().info(f"[Job Routing] Released {len(deferred)} deferred upload(s)")
+
+
+def release_parked_uploads():
+	'''
+		Scheduled job: enqueue parked uploads again once their circuit allows it
+
+		A half open circuit gets one upload as its probe, a closed one all of them.
+	'''
+	parked = get_hash_entries(PARKED_KEY)
+	if not parked:
+		return
+
+	settings = frappe.get_single(SETTINGS)
+	states = {}
+	released = 0
+	for filedoc, entry in parked.items():
+		drive_id = entry.get("drive_id")
+		if drive_id not in states:
+			states[drive_id] = get_drive_state(drive_id)
+
+		state = states[drive_id]
+		if state == STATE_OPEN:
+			continue
+		if state == STATE_HALF_OPEN:
+			# Hold the rest back until the probe reports
+			states[drive_id] = STATE_OPEN
+
+		frappe.cache().hdel(PARKED_KEY, filedoc)
+		enqueue_file_upload(
+			doctype=entry.get("doctype"),
+			docname=entry.get("docname"),
+			filepath=entry.get("filepath"),
+			filedoc=filedoc,
+			settings=settings,
+			attempt=entry.get("attempt") or 1,
+			bulk=entry.get("bulk") or False
+		)
+		released += 1
+
+	if released:
+		frappe.logger().info(f"[Job Routing] Released {released} parked upload(s)")
+
+
+def mark_upload_started(doctype, docname, filepath, filedoc, attempt=1, bulk=False):
+	'''
+		Register a running upload so the stall monitor can find it
+	'''
+	settings = frappe.get_single(SETTINGS)
+	now = time.time()
+	frappe.cache().hset(INFLIGHT_KEY, filedoc, {
+		"doctype": doctype,
+		"docname": docname,
+		"filepath": filepath,
+		"attempt": attempt,
+		"bulk": bulk,
+		"job_id": get_current_job_id(),
+		"started": now,
+		"last_progress": now,
+		"stall_window": get_stall_window(settings, get_file_size(filepath))
+	})
+
+
+def touch_upload(filedoc):
+	'''
+		Record progress of a running upload, unless a retry has taken its place
+	'''
+	entry = frappe.cache().hget(INFLIGHT_KEY, filedoc)
+	if entry and entry.get("job_id") == get_current_job_id():
+		entry["last_progress"] = time.time()
+		frappe.cache().hset(INFLIGHT_KEY, filedoc, entry)
+
+
+def get_hash_entries(key):
+	'''
+		Entries of a Redis hash by File name
+
+		hgetall returns the field names as bytes, they are decoded here so
+		they can be passed on as the filedoc of a job.
+	'''
+	return {frappe.safe_decode(name): entry for name, entry in (frappe.cache().hgetall(key) or {}).items()}
+
+
+def mark_upload_finished(filedoc, job_id=None):
+	'''
+		Unregister the upload of a File, only if it is the one job_id runs
+
+		A stopped job finishes after its retry has registered, and must not
+		remove the retry's entry. job_id defaults to the current job.
+	'''
+	job_id = job_id or get_current_job_id()
+	entry = frappe.cache().hget(INFLIGHT_KEY, filedoc)
+	if entry and entry.get("job_id") == job_id:
+		frappe.cache().hdel(INFLIGHT_KEY, filedoc)
+
+
+def get_current_job_id():
+	try:
+		from rq import get_current_job
+		job = get_current_job()
+		return job.id if job else None
+	except Exception:
+		return None
+
+
+def stop_job(job_id):
+	'''
+		Ask the worker running a stalled job to stop it
+	'''
+	if not job_id:
+		return
+	try:
+		from rq.command import send_stop_job_command
+		from frappe.utils.background_jobs import get_redis_conn
+		send_stop_job_command(get_redis_conn(), job_id)
+	except Exception as e:
+		frappe.logger().warning(f"[Job Routing] Could not stop job {job_id}: {str(e)}")
+
+
+def requeue_stalled_uploads():
+	'''
+		Scheduled job: hand uploads that stopped making progress back to the queue
+	'''
+	inflight = get_hash_entries(INFLIGHT_KEY)
+	if not inflight:
+		return
+
+	settings = frappe.get_single(SETTINGS)
+	now = time.time()
+
+	for filedoc, entry in inflight.items():
+		if now - entry.get("last_progress", now) <= entry.get("stall_window", 0):
+			continue
+
+		frappe.logger().warning(f"[Job Routing] Upload of {filedoc} stalled (attempt {entry.get('attempt')})")
+		stop_job(entry.get("job_id"))
+		mark_upload_finished(filedoc, entry.get("job_id"))
+
+		attempt = cint(entry.get("attempt")) + 1
+		if attempt > MAX_UPLOAD_ATTEMPTS:
+			frappe.log_error("SharePoint Upload Stalled", f"File: {filedoc}, gave up after {MAX_UPLOAD_ATTEMPTS} attempts")
+			continue
+
+		enqueue_file_upload(
+			doctype=entry.get("doctype"),
+			docname=entry.get("docname"),
+			filepath=entry.get("filepath"),
+			filedoc=filedoc,
+			settings=settings,
+			attempt=attempt,
+			bulk=entry.get("bulk") or False
+		)
@@ -0,0 +1,296 @@
+import frappe
+from frappe import _
+from frappe.utils import cint, flt, now_datetime
+from contextlib import contextmanager
+import json
+import os
+import random
+import re
+import sys
+import threading
+import time
+
+'''
+	On-demand profiling of upload jobs
+
+	A profiled job runs under a sampling profiler: a thread records the
+	wall-clock stacks of the job's thread and of the threads it starts, e.g.
+	the PDF render, every few milliseconds. Every Graph and Azure AD call
+	made meanwhile is added to a timeline. The result is stored as a
+	SharePoint Profile with the time per phase, and the folded stacks
+	(flame graph input) and the timeline as a JSON attachment.
+
+	Jobs are profiled when asked to (profile=1) or at random, for the
+	share of jobs set in SharePoint Settings.
+'''
+
+SETTINGS = "SharePoint Settings"
+PROFILE = "SharePoint Profile"
+
+JOB_FILE_UPLOAD = "File Upload"
+JOB_DOCUMENT_UPLOAD = "Document Upload"
+
+DEFAULT_INTERVAL_MS = 5
+MAX_STACK_DEPTH = 100
+# Graph calls kept in a profile's timeline
+MAX_GRAPH_CALLS = 5000
+
+PHASE_OTHER = "Other"
+# A sample belongs to the first phase any of whose functions is on its stack
+PHASES = [
+	("PDF", {"generate_document_pdf", "render_pdf_in_site_context", "get_rendered_pdf", "render_pdfs", "get_pdf"}),
+	("DNS/Connect", {"create_connection", "_new_conn", "getaddrinfo"}),
+	("TLS", {"ssl_wrap_socket", "_ssl_wrap_socket_impl", "do_handshake", "wrap_socket"}),
+	("Token", {"get_access_token", "get_request_header"}),
+	("Folders", {"build_folder_structure", "get_or_create_folder", "get_root_folder_id", "materialize_folders"}),
+	("Upload", {"make_request", "upload_file_to_folder", "upload_stream", "upload_archive", "upload_files", "copy_duplicate"}),
+	("Bookkeeping", {"record_sync_results", "record_uploaded_item", "upsert_items", "remove_file"}),
+]
+
+# Item ids and drive ids in Graph URLs, grouped away when comparing calls
+ID_SEGMENT = re.compile(r"(?<=/)[A-Za-z0-9!_\-]{16,}(?=/|:|$)")
+
+# The profiler of the job running in each thread, requests of other threads are not mixed in
+_local = threading.local()
+
+
+def should_profile(settings, requested=False):
+	'''
+		Whether a job runs under the profiler: when asked to, or for the sampled share of jobs
+	'''
+	if cint(requested):
+		return True
+	rate = flt(settings.get("profile_sample_rate"))
+	return rate > 0 and random.random() * 100 < rate
+
+
+def get_phase(functions):
+	for phase, markers in PHASES:
+		if not markers.isdisjoint(functions):
+			return phase
+	return PHASE_OTHER
+
+
+def get_call_name(method, url):
+	'''
+		Method and URL of a Graph call without ids and query, e.g. PUT /drives/{id}/items/{id}:/{path}:/content
+	'''
+	path = re.sub(r"^https?://[^/]+(/v1\.0|/beta)?", "", url.split("?", 1)[0])
+	path = re.sub(r":/.+?(:/|$)", lambda match: ":/{path}" + match.group(1), path)
+	return f"{method} " + ID_SEGMENT.sub("{id}", path)
+
+
+class SamplingProfiler(object):
+	'''
+		Samples the stacks of the starting thread and the threads started after it
+
+		Threads that were already running, such as the worker's own, are
+		left out.
+	'''
+	def __init__(self, interval_ms=DEFAULT_INTERVAL_MS):
+		self.interval = max(cint(interval_ms), 1) / 1000
+		self.stacks = {}
+		self.phases = {}
+		self.samples = 0
+		self.calls = []
+		self.stopped = threading.Event()
+		self.thread = None
+
+	def start(self):
+		self.job_thread = threading.get_ident()
+		self.ignored = {thread.ident for thread in threading.enumerate()} - {self.job_thread}
+		self.started = time.monotonic()
+		self.started_on = now_datetime()
+		self.thread = threading.Thread(target=self.run, name="sharepoint-profiler", daemon=True)
+		self.thread.start()
+
+	def stop(self):
+		self.duration = time.monotonic() - self.started
+		self.stopped.set()
+		self.thread.join()
+
+	def run(self):
+		own = threading.get_ident()
+		while not self.stopped.wait(self.interval):
+			names = {thread.ident: thread.name for thread in threading.enumerate()}
+			for ident, frame in sys._current_frames().items():
+				if ident != own and ident not in self.ignored:
+					self.add_sample(ident, names.get(ident, str(ident)), frame)
+
+	def add_sample(self, ident, thread_name, frame):
+		stack, functions = [], set()
+		while frame and len(stack) < MAX_STACK_DEPTH:
+			code = frame.f_code
+			functions.add(code.co_name)
+			stack.append(f"{frame.f_globals.get('__name__', '?')}.{code.co_name}")
+			frame = frame.f_back
+
+		key = ";".join([thread_name] + stack[::-1])
+		self.stacks[key] = self.stacks.get(key, 0) + 1
+
+		# Phases are wall-clock time of the job's thread, which waits on the others
+		if ident == self.job_thread:
+			self.samples += 1
+			phase = get_phase(functions)
+			self.phases[phase] = self.phases.get(phase, 0) + 1
+
+	def add_call(self, method, url, status_code, started):
+		if len(self.calls) < MAX_GRAPH_CALLS:
+			self.calls.append({
+				"start": round(started - self.started, 4),
+				"duration": round(time.monotonic() - started, 4),
+				"method": method,
+				"call": get_call_name(method, url),
+				"status": status_code
+			})
+
+	def get_summary(self):
+		'''
+			Seconds per phase, scaled from the samples to the measured duration, and Graph calls by kind
+		'''
+		scale = self.duration / self.samples if self.samples else 0
+		graph = {}
+		for call in self.calls:
+			entry = graph.setdefault(call["call"], {"count": 0, "seconds": 0})
+			entry["count"] += 1
+			entry["seconds"] = round(entry["seconds"] + call["duration"], 4)
+
+		return {
+			"phases": {phase: round(count * scale, 4) for phase, count in self.phases.items()},
+			"graph": graph
+		}
+
+
+def record_graph_call(method, url, status_code, started):
+	'''
+		Add a Graph or Azure AD call to the timeline of the job being profiled, if any
+	'''
+	profiler = getattr(_local, "profiler", None)
+	if profiler:
+		profiler.add_call(method, url, status_code, started)
+
+
+@contextmanager
+def profile_job(job_type, reference_doctype=None, reference_name=None, file=None, enabled=False):
+	'''
+		Run the body under the sampling profiler and store a SharePoint Profile
+
+		Usage:
+			with profile_job(JOB_FILE_UPLOAD, doctype, docname, file=filedoc, enabled=should_profile(settings)):
+				...
+	'''
+	if not enabled or getattr(_local, "profiler", None):
+		yield
+		return
+
+	settings = frappe.get_cached_doc(SETTINGS)
+	profiler = SamplingProfiler(settings.get("profile_interval") or DEFAULT_INTERVAL_MS)
+	_local.profiler = profiler
+	profiler.start()
+	error = None
+	try:
+		yield profiler
+	except Exception as e:
+		error = str(e)
+		raise
+	finally:
+		profiler.stop()
+		_local.profiler = None
+		save_profile(profiler, job_type, reference_doctype, reference_name, file, error)
+
+
+def save_profile(profiler, job_type, reference_doctype, reference_name, file, error=None):
+	'''
+		Store a profile with its data as an attachment, without failing the job
+	'''
+	try:
+		if error:
+			# The job's own changes are rolled back anyway
+			frappe.db.rollback()
+
+		summary = profiler.get_summary()
+		profile = frappe.get_doc({
+			"doctype": PROFILE,
+			"job_type": job_type,
+			"status": "Failed" if error else "Completed",
+			"reference_doctype": reference_doctype,
+			"reference_name": reference_name,
+			"file": file if file and frappe.db.exists("File", file) else None,
+			"started_on": profiler.started_on,
+			"duration": round(profiler.duration, 4),
+			"samples": profiler.samples,
+			"graph_calls": len(profiler.calls),
+			"graph_time": round(sum(call["duration"] for call in profiler.calls), 4),
+			"summary": json.dumps(summary, indent=1),
+			"error": error
+		}).insert(ignore_permissions=True)
+
+		data = {
+			"interval_ms": round(profiler.interval * 1000, 3),
+			"duration": profiler.duration,
+			"summary": summary,
+			"folded": [f"{stack} {count}" for stack, count in sorted(profiler.stacks.items())],
+			"graph_calls": profiler.calls
+		}
+		attachment = frappe.get_doc({
+			"doctype": "File",
+			"file_name": f"{profile.name}.json",
+			"attached_to_doctype": PROFILE,
+			"attached_to_name": profile.name,
+			"is_private": 1,
+			"content": json.dumps(data)
+		}).insert(ignore_permissions=True)
+		profile.db_set("profile", attachment.file_url)
+		frappe.db.commit()
+		frappe.logger().info(f"[Profile] {job_type} of {reference_doctype} {reference_name} profiled as {profile.name}")
+	except Exception as e:
+		frappe.log_error("SharePoint Profile Error", str(e))
+
+
+@frappe.whitelist()
+def profile_file_upload(file):
+	'''
+		Upload a File again with its job under the profiler
+	'''
+	from frappe_sharepoint.utils.document_upload import get_file_path
+	from frappe_sharepoint.utils.job_routing import enqueue_file_upload
+
+	frappe.only_for("System Manager")
+	file_doc = frappe.get_doc("File", file)
+	filepath = get_file_path(file_doc)
+	if not filepath or not os.path.exists(filepath):
+		frappe.throw(_("File {0} has no local copy to upload").format(file_doc.file_name))
+	enqueue_file_upload(
+		doctype=file_doc.attached_to_doctype,
+		docname=file_doc.attached_to_name,
+		filepath=filepath,
+		filedoc=file_doc.name,
+		profile=True
+	)
+
+
+def compare_profiles(profile, other):
+	'''
+		Two profiles side by side: duration, seconds per phase and Graph calls by kind
+
+		Returns:
+			dict: duration, phases and graph rows with the values of both profiles
+	'''
+	profiles = [frappe.get_doc(PROFILE, name) for name in (profile, other)]
+	summaries = [json.loads(p.summary or "{}") for p in profiles]
+
+	phases = [phase for phase, markers in PHASES] + [PHASE_OTHER]
+	calls = sorted(set(summaries[0].get("graph", {})) | set(summaries[1].get("graph", {})))
+	return {
+		"profiles": [p.name for p in profiles],
+		"duration": [p.duration for p in profiles],
+		"graph_calls": [p.graph_calls for p in profiles],
+		"phases": [
+			{"phase": phase, "seconds": [s.get("phases", {}).get(phase, 0) for s in summaries]}
+			for phase in phases if any(s.get("phases", {}).get(phase) for s in summaries)
+		],
+		"graph": [
+			{"call": call, "stats": [s.get("graph", {}).get(call, {"count": 0, "seconds": 0}) for s in summaries]}
+			for call in calls
+		]
+	}
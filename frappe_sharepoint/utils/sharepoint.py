@@ -1,8 +1,40 @@
 import frappe
 from frappe import _
-from frappe_sharepoint.utils import get_request_header, make_request
+from frappe.utils import cint
+from frappe_sharepoint.utils import async_transport, get_request_header, make_request
+from frappe_sharepoint.utils.async_transport import TRANSPORT_ASYNC
+from frappe_sharepoint.utils.attachment_archive import get_attachment_archive
+from frappe_sharepoint.utils.bandwidth import is_upload_window_open, throttled_body
+from frappe_sharepoint.utils.circuit_breaker import allow_request
+from frappe_sharepoint.utils.download import cache_download_url, get_offloaded_file_url
+from frappe_sharepoint.utils.file_hash import (
+	INTEGRITY_MISMATCH,
+	INTEGRITY_VERIFIED,
+	LOCAL_HASHES,
+	FileHashes,
+	HashingStream,
+	get_integrity,
+)
+from frappe_sharepoint.utils.drive_mirror import find_child, get_ancestor_ids, get_item, get_root, remove_items, upsert_items
+from frappe_sharepoint.utils.drive_routing import acquire_drive_slot, drive_slot, release_drive_slot, resolve_drive_route
+from frappe_sharepoint.utils.folder_template import get_folder_path, get_folder_template
+from frappe_sharepoint.utils.job_routing import (
+	defer_upload,
+	is_large_file,
+	mark_upload_finished,
+	mark_upload_started,
+	park_upload,
+	record_upload_throughput,
+	touch_upload,
+)
+from frappe_sharepoint.utils.profiler import JOB_FILE_UPLOAD, profile_job, should_profile
+from frappe_sharepoint.utils.sync_state import find_synced_duplicate, make_sync_result, record_sync_results
 
+import base64
 import os
+import time
+from redis.exceptions import LockError
+from urllib.parse import quote
 
 '''
 	SharePoint file synchronization using Direct Drive API
@@ -11,16 +43,61 @@ import os
 SETTINGS = "SharePoint Settings"
 ContentType = {"Content-Type": "application/json"}
 
+# Upload session chunks must be a multiple of 320 KiB
+UPLOAD_CHUNK_SIZE = 320 * 1024 * 16
 
-def trigger_sharepoint_upload(doctype=None, docname=None, filepath=None, filedoc=None):
-	"""Trigger SharePoint file upload"""
+# Folder creation lock: how long it may be held and how long others wait for it
+FOLDER_LOCK_TIMEOUT = 30
+FOLDER_LOCK_WAIT = 15
+# Resolved folder ids are reused for a day before being looked up again
+FOLDER_CACHE_TTL = 24 * 60 * 60
+# Properties the drive mirror keeps for folders
+FOLDER_SELECT = "id,name,folder,root,parentReference,eTag,webUrl,lastModifiedDateTime"
+
+# Server-side copies are polled with a growing interval until they complete
+COPY_POLL_INTERVAL = 1
+COPY_MAX_POLL_INTERVAL = 10
+COPY_TIMEOUT = 2 * 60
+
+
+def trigger_sharepoint_upload(doctype=None, docname=None, filepath=None, filedoc=None, attempt=1, bulk=False, profile=False):
+	"""Trigger SharePoint file upload
+
+	Bulk uploads that start after their upload window closed wait for the next one.
+	Uploads to a drive whose concurrency slots are all taken are parked until one
+	is free, so the job never sleeps away its timeout waiting for a slot.
+	With profile, or for the sampled share of jobs, the upload runs under the profiler.
+	"""
 	sharepoint = SharePoint(
 		doctype=doctype,
 		docname=docname, 
 		filepath=filepath, 
 		filedoc=filedoc
 	)
-	sharepoint.run_sharepoint_upload()
+	
+	if bulk and not is_upload_window_open(sharepoint.settings):
+		defer_upload(doctype, docname, filepath, filedoc, attempt)
+		return
+	
+	# SharePoint went down after the job was queued
+	if not allow_request(sharepoint.drive_id):
+		park_upload(doctype, docname, filepath, filedoc, sharepoint.drive_id, attempt, bulk)
+		return
+	
+	slot = None
+	if sharepoint.max_concurrency and sharepoint.drive_id:
+		slot = acquire_drive_slot(sharepoint.drive_id, sharepoint.max_concurrency)
+		if not slot:
+			park_upload(doctype, docname, filepath, filedoc, sharepoint.drive_id, attempt, bulk, reason="no free drive slot")
+			return
+	
+	mark_upload_started(doctype, docname, filepath, filedoc, attempt, bulk)
+	try:
+		with profile_job(JOB_FILE_UPLOAD, doctype, docname, file=filedoc, enabled=should_profile(sharepoint.settings, profile)):
+			sharepoint.run_sharepoint_upload()
+	finally:
+		mark_upload_finished(filedoc)
+		release_drive_slot(sharepoint.drive_id, slot)
 
 
 def upload_document_bundle(doctype, docname, files):
@@ -30,92 +107,182 @@ def upload_document_bundle(doctype, docname, files):
 	Args:
 		doctype: Document type (e.g., "Expense Claim")
 		docname: Document name (e.g., "HR-EXP-2025-00033")
-		files: List of file dicts with keys: filepath, filename, is_temp
+		files: List or iterable of file dicts with keys: filepath, filename, is_temp.
+			An iterable is consumed after the folder structure is built, so it can
+			yield files that are still being produced.
 		
 	Returns:
 		dict: Upload status with success flag and SharePoint folder URL
 	"""
 	try:
-		frappe.logger().info(f"[SharePoint Bundle] Starting upload for {doctype}: {docname} with {len(files)} files")
+		frappe.logger().info(f"[SharePoint Bundle] Starting upload for {doctype}: {docname}")
 		
 		sharepoint = SharePoint(doctype=doctype, docname=docname, filepath=None, filedoc=None)
 		frappe.logger().info(f"[SharePoint Bundle] SharePoint instance created. Drive ID: {sharepoint.drive_id}")
 		frappe.logger().info(f"[SharePoint Bundle] Root folder: {sharepoint.root_folder}, Folder structure: {sharepoint.folder_structure}")
 		
-		# Build the folder structure first
-		frappe.logger().info(f"[SharePoint Bundle] Building folder structure...")
-		target_folder_id = sharepoint.build_folder_structure()
-		frappe.logger().info(f"[SharePoint Bundle] Target folder ID: {target_folder_id}")
-		
-		if not target_folder_id:
-			frappe.logger().error(f"[SharePoint Bundle] Failed to determine target folder")
+		# Takes the probe when the circuit is half open, so only one upload tests the drive
+		if not allow_request(sharepoint.drive_id):
+			frappe.logger().warning(f"[SharePoint Bundle] SharePoint circuit is open, not uploading")
 			return {
 				'success': False,
-				'message': 'Could not determine target folder in SharePoint'
+				'message': 'SharePoint is currently unavailable, please try again in a few minutes'
 			}
 		
-		# Upload each file
-		uploaded_count = 0
-		failed_files = []
-		
-		for idx, file_info in enumerate(files):
-			filepath = file_info.get('filepath')
-			filename = file_info.get('filename')
-			
-			frappe.logger().info(f"[SharePoint Bundle] File {idx+1}/{len(files)}: {filename}")
-			frappe.logger().info(f"[SharePoint Bundle] File path: {filepath}")
+		with drive_slot(sharepoint.drive_id, sharepoint.max_concurrency):
+			return _upload_document_bundle(sharepoint, doctype, docname, files)
 			
-			if not filepath or not filename:
-				frappe.logger().warning(f"[SharePoint Bundle] Skipping file {idx+1} - missing filepath or filename")
-				continue
-			
-			# Upload file with overwrite behavior
+	except Exception as e:
+		frappe.logger().error(f"[SharePoint Bundle] Exception: {str(e)}")
+		frappe.log_error("Document Bundle Upload Error", str(e))
+		return {
+			'success': False,
+			'message': f'Error: {str(e)}'
+		}
+
+
+def _upload_document_bundle(sharepoint, doctype, docname, files, concurrent=False, target_folder_id=None):
+	"""Upload the bundle's files once the drive slot is held
+
+	With concurrent set, the files are collected first and uploaded together,
+	through the async transport when it is enabled. Otherwise each file is
+	uploaded as the iterable yields it. Archived attachments go up last, in
+	one ZIP, and their Sync States point to it. Batch jobs pass the
+	target_folder_id they created ahead.
+	"""
+	# Build the folder structure first
+	if not target_folder_id:
+		frappe.logger().info(f"[SharePoint Bundle] Building folder structure...")
+		target_folder_id = sharepoint.build_folder_structure(doctype, docname)
+	frappe.logger().info(f"[SharePoint Bundle] Target folder ID: {target_folder_id}")
+	
+	if not target_folder_id:
+		frappe.logger().error(f"[SharePoint Bundle] Failed to determine target folder")
+		return {
+			'success': False,
+			'message': 'Could not determine target folder in SharePoint'
+		}
+	
+	# Upload each file
+	uploaded_count = 0
+	failed_files = []
+	sync_results = []
+	
+	# Small attachments of document types with an archive rule are held back for one ZIP
+	archive = get_attachment_archive(sharepoint.settings, doctype, docname)
+	if archive:
+		files = archive.collect(files)
+	
+	if concurrent:
+		files = [file_info for file_info in files if file_info.get('filepath') and file_info.get('filename')]
+		# Attachments with content already in SharePoint are copied, the rest uploaded together
+		items = [sharepoint.copy_duplicate(target_folder_id, file_info.get('file_doc'), file_info['filename']) for file_info in files]
+		pending = [idx for idx, item in enumerate(items) if not item]
+		uploaded = sharepoint.upload_files(target_folder_id, [(files[idx]['filepath'], files[idx]['filename']) for idx in pending])
+		for idx, item in zip(pending, uploaded):
+			items[idx] = item
+		# The cached folder is gone from SharePoint, resolve it again and retry the failed files once
+		if sharepoint.forget_missing_folder():
+			target_folder_id = sharepoint.build_folder_structure(doctype, docname)
+			pending = [idx for idx in pending if not items[idx]]
+			if target_folder_id and pending:
+				uploaded = sharepoint.upload_files(target_folder_id, [(files[idx]['filepath'], files[idx]['filename']) for idx in pending])
+				for idx, item in zip(pending, uploaded):
+					items[idx] = item
+		uploads = zip(files, items)
+	else:
+		uploads = ((file_info, None) for file_info in files)
+	
+	for idx, (file_info, item) in enumerate(uploads):
+		filepath = file_info.get('filepath')
+		filename = file_info.get('filename')
+		
+		frappe.logger().info(f"[SharePoint Bundle] File {idx+1}: {filename}")
+		frappe.logger().info(f"[SharePoint Bundle] File path: {filepath}")
+		
+		if not filepath or not filename:
+			frappe.logger().warning(f"[SharePoint Bundle] Skipping file {idx+1} - missing filepath or filename")
+			continue
+		
+		# Upload file with overwrite behavior
+		if not concurrent:
 			frappe.logger().info(f"[SharePoint Bundle] Uploading {filename} to folder {target_folder_id}")
-			success = sharepoint.upload_file_to_folder(
+			item = sharepoint.upload_file_to_folder(
 				target_folder_id=target_folder_id,
 				filepath=filepath,
-				filename=filename
+				filename=filename,
+				filedoc=file_info.get('file_doc')
 			)
-			
-			if success:
-				uploaded_count += 1
-				frappe.logger().info(f"[SharePoint Bundle] Successfully uploaded {filename}")
-				# Update File doc if this is an attachment
-				if file_info.get('file_doc'):
-					frappe.db.set_value("File", file_info['file_doc'], "uploaded_to_sharepoint", 1)
-					frappe.logger().info(f"[SharePoint Bundle] Marked File {file_info['file_doc']} as uploaded")
-			else:
-				failed_files.append(filename)
-				frappe.logger().error(f"[SharePoint Bundle] Failed to upload {filename}")
+			# The cached folder is gone from SharePoint, resolve it again and retry once
+			if not item and sharepoint.forget_missing_folder():
+				target_folder_id = sharepoint.build_folder_structure(doctype, docname)
+				if target_folder_id:
+					item = sharepoint.upload_file_to_folder(
+						target_folder_id=target_folder_id,
+						filepath=filepath,
+						filename=filename,
+						filedoc=file_info.get('file_doc')
+					)
 		
-		# Get SharePoint folder URL
-		frappe.logger().info(f"[SharePoint Bundle] Getting folder URL for {target_folder_id}")
-		folder_url = sharepoint.get_folder_url(target_folder_id)
-		frappe.logger().info(f"[SharePoint Bundle] Folder URL: {folder_url}")
+		if item:
+			uploaded_count += 1
+			frappe.logger().info(f"[SharePoint Bundle] Successfully uploaded {filename}")
+		else:
+			failed_files.append(filename)
+			frappe.logger().error(f"[SharePoint Bundle] Failed to upload {filename}")
 		
-		if uploaded_count > 0:
-			frappe.logger().info(f"[SharePoint Bundle] Upload completed: {uploaded_count} succeeded, {len(failed_files)} failed")
-			return {
-				'success': True,
-				'uploaded_count': uploaded_count,
-				'failed_count': len(failed_files),
-				'folder_url': folder_url,
-				'message': f'Successfully uploaded {uploaded_count} file(s) to SharePoint'
-			}
+		# Collect results for attachments, written in bulk once all uploads are done
+		if file_info.get('file_doc'):
+			sync_results.append(make_sync_result(
+				file_info['file_doc'],
+				sharepoint.drive_id,
+				item=item,
+				error=None if item else f"Failed to upload {filename}"
+			))
+	
+	if archive and archive.entries:
+		item = sharepoint.upload_archive(target_folder_id, archive)
+		if not item and sharepoint.forget_missing_folder():
+			target_folder_id = sharepoint.build_folder_structure(doctype, docname)
+			item = sharepoint.upload_archive(target_folder_id, archive) if target_folder_id else None
+		if item:
+			uploaded_count += 1
+			frappe.logger().info(f"[SharePoint Bundle] Successfully uploaded {archive.filename} with {len(archive.entries)} attachment(s)")
 		else:
-			frappe.logger().error(f"[SharePoint Bundle] All uploads failed. Failed files: {failed_files}")
-			return {
-				'success': False,
-				'message': 'Failed to upload files to SharePoint',
-				'failed_files': failed_files
-			}
-			
-	except Exception as e:
-		frappe.logger().error(f"[SharePoint Bundle] Exception: {str(e)}")
-		frappe.log_error("Document Bundle Upload Error", str(e))
+			failed_files.append(archive.filename)
+			frappe.logger().error(f"[SharePoint Bundle] Failed to upload {archive.filename}")
+		
+		sync_results.extend(make_sync_result(
+			file_info['file_doc'],
+			sharepoint.drive_id,
+			item=item,
+			error=None if item else f"Failed to upload {archive.filename}",
+			archive_entry=zinfo.filename
+		) for zinfo, file_info in archive.entries)
+	
+	record_sync_results(sync_results)
+	frappe.logger().info(f"[SharePoint Bundle] Recorded sync state for {len(sync_results)} attachment(s)")
+	
+	# Get SharePoint folder URL
+	frappe.logger().info(f"[SharePoint Bundle] Getting folder URL for {target_folder_id}")
+	folder_url = sharepoint.get_folder_url(target_folder_id)
+	frappe.logger().info(f"[SharePoint Bundle] Folder URL: {folder_url}")
+	
+	if uploaded_count > 0:
+		frappe.logger().info(f"[SharePoint Bundle] Upload completed: {uploaded_count} succeeded, {len(failed_files)} failed")
+		return {
+			'success': True,
+			'uploaded_count': uploaded_count,
+			'failed_count': len(failed_files),
+			'folder_url': folder_url,
+			'message': f'Successfully uploaded {uploaded_count} file(s) to SharePoint'
+		}
+	else:
+		frappe.logger().error(f"[SharePoint Bundle] All uploads failed. Failed files: {failed_files}")
 		return {
 			'success': False,
-			'message': f'Error: {str(e)}'
+			'message': 'Failed to upload files to SharePoint',
+			'failed_files': failed_files
 		}
 
 
@@ -128,14 +295,25 @@ class SharePoint(object):
 		self.filedoc = kwargs.get("filedoc")
 		self.settings = frappe.get_single(SETTINGS)
 		
+		# Route the document to its drive, unless the caller names one
+		route = resolve_drive_route(self.settings, self.doctype, self.docname)
+		if kwargs.get("drive_id"):
+			route.drive_id = kwargs.get("drive_id")
+		
 		# Validate required settings
-		if not self.settings.sharepoint_drive_id:
+		if not route.drive_id:
 			frappe.throw(_("SharePoint Drive ID not configured in SharePoint Settings"))
 		
-		self.drive_id = self.settings.sharepoint_drive_id
-		self.root_folder = self.settings.root_folder_path or ""
+		self.drive_id = route.drive_id
+		self.max_concurrency = route.max_concurrency
+		self.root_folder = (route.root_folder_path or "").strip("/")
 		self.folder_structure = self.settings.folder_structure or "Module/DocType/Document"
+		self.folder_template = get_folder_template(self.settings)
 		self.base_url = f'{self.settings.graph_api_url}/drives/{self.drive_id}'
+		# Resolved once per client, the drive's root does not move during a run
+		self.root_folder_id = None
+		# Target folder SharePoint answered 404 for, it was deleted or moved
+		self.missing_folder = None
 
 	def get_sharepoint_folder_items(self, folder_id):
 		'''
@@ -169,132 +347,217 @@ class SharePoint(object):
 		body = {
 			"name": f'{folder_name}',
 			"folder": {},
-			"@microsoft.graph.conflictBehavior": "rename"
+			"@microsoft.graph.conflictBehavior": "fail"
 		}
 
 		response = make_request('POST', url, headers, body)
 		frappe.logger().info(f"[Create Folder] Response status: {response.status_code if response else 'None'}")
 		
-		if not response.ok:
+		if response.status_code == 409:
+			# Someone else created it first, use theirs instead of a renamed sibling
+			frappe.logger().info(f"[Create Folder] '{folder_name}' already exists, resolving it")
+			return self.get_folder_id_by_name(parent_folder_id, folder_name)
+		elif not response.ok:
 			frappe.logger().error(f"[Create Folder] Failed to create '{folder_name}': {response.text if response else 'No response'}")
 			frappe.log_error("SharePoint folder creation error", response.text)
 			return None
 		else:
-			folder_id = response.json()["id"]
-			frappe.logger().info(f"[Create Folder] Successfully created '{folder_name}' with ID: {folder_id}")
-			return folder_id
+			folder = response.json()
+			upsert_items(self.drive_id, [folder])
+			frappe.logger().info(f"[Create Folder] Successfully created '{folder_name}' with ID: {folder['id']}")
+			return folder["id"]
 
 	def get_folder_id_by_name(self, parent_folder_id, folder_name):
 		'''
 			Get folder ID by name within a parent folder
+
+			Answers from the drive mirror when it knows the folder. Otherwise
+			addresses the folder by path relative to its parent, so the cost
+			does not grow with the number of siblings.
 		'''
-		folder_id = None
-		folder_items = self.get_sharepoint_folder_items(parent_folder_id)
-		for item in folder_items:
-			if folder_name == item['name']:
-				folder_id = item['id']
-				break
-		return folder_id
+		child = find_child(self.drive_id, parent_folder_id, folder_name)
+		if child and child.is_folder:
+			return child.item_id
+
+		headers = get_request_header(self.settings)
+		url = f'{self.base_url}/items/{parent_folder_id}:/{quote(folder_name)}?$select={FOLDER_SELECT}'
+
+		response = make_request('GET', url, headers, None)
+		if response.ok:
+			item = response.json()
+			if 'folder' in item:
+				upsert_items(self.drive_id, [item])
+				return item['id']
+		elif response.status_code != 404:
+			frappe.log_error("SharePoint folder lookup error", response.text)
+		return None
 
 	def get_or_create_folder(self, parent_folder_id, folder_name):
 		'''
 			Get existing folder or create new one
 		'''
 		frappe.logger().info(f"[Get/Create Folder] Looking for '{folder_name}' in parent {parent_folder_id}")
+		folder_id = self.get_cached_folder_id(parent_folder_id, folder_name)
+		if folder_id:
+			frappe.logger().info(f"[Get/Create Folder] Using cached folder '{folder_name}' with ID: {folder_id}")
+			return folder_id
+		
 		folder_id = self.get_folder_id_by_name(parent_folder_id, folder_name)
 		
 		if not folder_id:
 			frappe.logger().info(f"[Get/Create Folder] Folder '{folder_name}' not found, creating...")
-			folder_id = self.create_sharepoint_folder(parent_folder_id, folder_name)
+			folder_id = self.create_folder_once(parent_folder_id, folder_name)
 			frappe.logger().info(f"[Get/Create Folder] Created folder '{folder_name}' with ID: {folder_id}")
 		else:
 			frappe.logger().info(f"[Get/Create Folder] Found existing folder '{folder_name}' with ID: {folder_id}")
 		
+		if folder_id:
+			self.set_cached_folder_id(parent_folder_id, folder_name, folder_id)
 		return folder_id
 
+	def create_folder_once(self, parent_folder_id, folder_name):
+		'''
+			Create a folder while holding a short lock on its parent and name
+
+			Workers that had to wait for the lock look the folder up again,
+			since the holder has most likely created it in the meantime.
+		'''
+		lock = frappe.cache().lock(
+			frappe.cache().make_key(f"sharepoint_folder_lock:{self.drive_id}:{parent_folder_id}:{folder_name}"),
+			timeout=FOLDER_LOCK_TIMEOUT
+		)
+		waited = not lock.acquire(blocking=False)
+		if waited:
+			frappe.logger().info(f"[Create Folder] Waiting for another worker creating '{folder_name}'")
+			if not lock.acquire(blocking=True, blocking_timeout=FOLDER_LOCK_WAIT):
+				frappe.logger().warning(f"[Create Folder] Lock wait for '{folder_name}' timed out")
+		
+		try:
+			folder_id = self.get_folder_id_by_name(parent_folder_id, folder_name) if waited else None
+			return folder_id or self.create_sharepoint_folder(parent_folder_id, folder_name)
+		finally:
+			try:
+				lock.release()
+			except LockError:
+				# Not acquired, or expired while the request was running
+				pass
+
+	def get_folder_cache_key(self, parent_folder_id, folder_name):
+		return f"sharepoint_folder_id:{self.drive_id}:{parent_folder_id}:{folder_name}"
+
+	def clear_folder_cache(self):
+		'''
+			Forget all resolved folder ids of this drive
+		'''
+		frappe.cache().delete_keys(f"sharepoint_folder_id:{self.drive_id}:")
+
+	def get_cached_folder_id(self, parent_folder_id, folder_name):
+		return frappe.cache().get_value(self.get_folder_cache_key(parent_folder_id, folder_name))
+
+	def set_cached_folder_id(self, parent_folder_id, folder_name, folder_id):
+		frappe.cache().set_value(
+			self.get_folder_cache_key(parent_folder_id, folder_name),
+			folder_id,
+			expires_in_sec=FOLDER_CACHE_TTL
+		)
+
+	def note_missing_folder(self, response, folder_id):
+		if response.status_code == 404:
+			self.missing_folder = folder_id
+
+	def forget_missing_folder(self):
+		'''
+			Drop a target folder SharePoint answered 404 for from the cache and the mirror
+
+			Its ancestors go too, since they may have been deleted or moved
+			with it. The next build_folder_structure resolves them again.
+
+			Returns:
+				bool: Whether a folder was missing
+		'''
+		folder_id = self.missing_folder
+		if not folder_id:
+			return False
+
+		frappe.logger().warning(f"[SharePoint] Folder {folder_id} is gone from drive {self.drive_id}, resolving folders again")
+		self.clear_folder_cache()
+		remove_items(self.drive_id, get_ancestor_ids(self.drive_id, folder_id))
+		self.root_folder_id = None
+		self.missing_folder = None
+		return True
+
 	def get_root_folder_id(self):
 		'''
 			Get or create the root folder for uploads
+
+			Walks the root folder path from the drive root, so each segment
+			is resolved from the cache or the mirror and created when missing.
 		'''
 		frappe.logger().info(f"[Get Root Folder] Starting - root_folder: '{self.root_folder}'")
+		folder_id = self.get_drive_root_id()
 		
-		if self.root_folder:
-			# Navigate to root folder path
-			frappe.logger().info(f"[Get Root Folder] Fetching root folder from path: {self.root_folder}")
-			headers = get_request_header(self.settings)
-			url = f'{self.base_url}/root:/{self.root_folder}'
-			frappe.logger().info(f"[Get Root Folder] URL: {url}")
-			
-			response = make_request('GET', url, headers, None)
-			frappe.logger().info(f"[Get Root Folder] Response status: {response.status_code if response else 'None'}")
-			
-			if response.ok:
-				folder_id = response.json()["id"]
-				frappe.logger().info(f"[Get Root Folder] Found existing root folder ID: {folder_id}")
-				return folder_id
-			else:
-				# Create root folder if it doesn't exist
-				frappe.logger().warning(f"[Get Root Folder] Root folder not found, creating: {self.root_folder}")
-				folder_id = self.create_sharepoint_folder("root", self.root_folder)
-				frappe.logger().info(f"[Get Root Folder] Created root folder ID: {folder_id}")
-				return folder_id
-		else:
-			# Use drive root
-			frappe.logger().info(f"[Get Root Folder] No root folder specified, using drive root")
-			headers = get_request_header(self.settings)
-			url = f'{self.base_url}/root'
-			response = make_request('GET', url, headers, None)
-			if response.ok:
-				folder_id = response.json()["id"]
-				frappe.logger().info(f"[Get Root Folder] Drive root ID: {folder_id}")
-				return folder_id
-			frappe.logger().info(f"[Get Root Folder] Using 'root' as folder ID")
-			return "root"
+		for folder_name in (self.root_folder.split("/") if self.root_folder else []):
+			if not folder_id:
+				break
+			folder_id = self.get_or_create_folder(folder_id, folder_name)
+		
+		frappe.logger().info(f"[Get Root Folder] Root folder ID: {folder_id}")
+		return folder_id
 
-	def build_folder_structure(self):
+	def get_drive_root_id(self):
+		'''
+			ID of the drive's root folder, from the mirror when known
+		'''
+		root = get_root(self.drive_id)
+		if root:
+			return root.item_id
+		
+		headers = get_request_header(self.settings)
+		url = f'{self.base_url}/root?$select={FOLDER_SELECT}'
+		response = make_request('GET', url, headers, None)
+		if response.ok:
+			item = response.json()
+			upsert_items(self.drive_id, [item])
+			frappe.logger().info(f"[Get Root Folder] Drive root ID: {item['id']}")
+			return item["id"]
+		frappe.logger().info(f"[Get Root Folder] Using 'root' as folder ID")
+		return "root"
+
+	def build_folder_structure(self, doctype=None, docname=None):
 		'''
 			Build folder structure based on settings
 			Returns the final folder ID where file should be uploaded
+
+			doctype and docname default to the client's document, so one client
+			can build the folders of many documents on the same drive.
 		'''
-		frappe.logger().info(f"[Build Folders] Starting - structure: {self.folder_structure}")
-		current_folder_id = self.get_root_folder_id()
+		doctype = doctype or self.doctype
+		docname = docname or self.docname
+		frappe.logger().info(f"[Build Folders] Starting - structure: {self.folder_structure}, template: '{self.folder_template}'")
+		if not self.root_folder_id:
+			self.root_folder_id = self.get_root_folder_id()
+		current_folder_id = self.root_folder_id
 		frappe.logger().info(f"[Build Folders] Root folder ID: {current_folder_id}")
 
-		if self.folder_structure == "Flat":
-			# No additional folders, upload directly to root
-			frappe.logger().info(f"[Build Folders] Using flat structure - no additional folders")
-			return current_folder_id
-		
-		# Module/DocType/Document structure
-		doctype_module = frappe.db.get_value("DocType", {"name": self.doctype}, "module")
-		frappe.logger().info(f"[Build Folders] DocType module: {doctype_module}")
-		
-		# Create Module folder
-		if doctype_module:
-			frappe.logger().info(f"[Build Folders] Creating/getting module folder: {doctype_module}")
-			module_id = self.get_or_create_folder(current_folder_id, doctype_module)
-			current_folder_id = module_id
-			frappe.logger().info(f"[Build Folders] Module folder ID: {module_id}")
-		
-		# Create DocType folder
-		frappe.logger().info(f"[Build Folders] Creating/getting doctype folder: {self.doctype}")
-		doctype_id = self.get_or_create_folder(current_folder_id, self.doctype)
-		current_folder_id = doctype_id
-		frappe.logger().info(f"[Build Folders] DocType folder ID: {doctype_id}")
-		
-		# Create Document folder (docname)
-		if self.docname:
-			frappe.logger().info(f"[Build Folders] Creating/getting document folder: {self.docname}")
-			document_id = self.get_or_create_folder(current_folder_id, self.docname)
-			current_folder_id = document_id
-			frappe.logger().info(f"[Build Folders] Document folder ID: {document_id}")
+		folder_path = get_folder_path(self.folder_template, doctype, docname)
+		frappe.logger().info(f"[Build Folders] Folder path: {'/'.join(folder_path) or '(root)'}")
+		
+		for folder_name in folder_path:
+			if not current_folder_id:
+				break
+			frappe.logger().info(f"[Build Folders] Creating/getting folder: {folder_name}")
+			current_folder_id = self.get_or_create_folder(current_folder_id, folder_name)
+			frappe.logger().info(f"[Build Folders] Folder '{folder_name}' ID: {current_folder_id}")
 		
 		frappe.logger().info(f"[Build Folders] Final target folder ID: {current_folder_id}")
 		return current_folder_id
 
-	def run_sharepoint_upload(self):
+	def run_sharepoint_upload(self, retry=True):
 		'''
-			Main upload function
+			Main upload function, the caller holds the drive slot
+
+			When the cached target folder is gone from SharePoint, the
+			folders are resolved again and the upload is retried once.
 		'''
 		try:
 			# Build the folder structure
@@ -304,33 +567,63 @@ class SharePoint(object):
 				frappe.log_error("SharePoint Upload Error", "Could not determine target folder")
 				return
 
-			# Get file content and name
-			file_content = self.get_file_content()
 			file_name = self.filepath.split("/")[-1] if self.filepath else None
+			file_size = os.path.getsize(self.filepath) if self.filepath and os.path.exists(self.filepath) else 0
 
-			if not file_content or not file_name:
+			if not file_size or not file_name:
 				frappe.log_error("SharePoint Upload Error", "File content or name is missing")
 				return
 
-			# Upload file
-			headers = get_request_header(self.settings)
-			headers.update({"Content-Type": "application/octet-stream"})
-			url = f'{self.base_url}/items/{target_folder_id}:/{file_name}:/content'
-
-			response = make_request('PUT', url, headers, file_content)
-			
-			if not response.ok:
-				frappe.log_error("SharePoint File Upload Error", response.text)
+			# Content already in SharePoint is copied there instead of uploaded again
+			item = self.copy_duplicate(target_folder_id, self.filedoc, file_name)
+			copied = bool(item)
+			started = time.monotonic()
+			if copied:
+				frappe.logger().info(f"[SharePoint] {file_name} copied from an earlier upload")
+			elif is_large_file(self.settings, file_size):
+				item = self.upload_large_file(
+					target_folder_id,
+					self.filepath,
+					file_name,
+					on_progress=lambda sent: touch_upload(self.filedoc)
+				)
+				if not item and self.forget_missing_folder() and retry:
+					return self.run_sharepoint_upload(retry=False)
 			else:
-				# Mark file as uploaded
-				frappe.db.set_value("File", self.filedoc, "uploaded_to_sharepoint", 1)
-				
-				# Replace file link if configured
-				if self.settings.replace_file_link:
-					web_url = response.json().get('webUrl')
-					if web_url:
-						frappe.db.set_value("File", self.filedoc, "file_url", web_url)
-						self.remove_file()
+				# Upload file
+				headers = get_request_header(self.settings)
+				headers.update({"Content-Type": "application/octet-stream"})
+				url = f'{self.base_url}/items/{target_folder_id}:/{quote(file_name)}:/content'
+
+				# Hashed while it is sent, so the file is read once
+				with self.get_file_content() as file_content:
+					body = HashingStream(file_content, file_size)
+					response = make_request('PUT', url, headers, throttled_body(self.settings, body, file_size))
+
+				if not response.ok:
+					self.note_missing_folder(response, target_folder_id)
+					if self.forget_missing_folder() and retry:
+						return self.run_sharepoint_upload(retry=False)
+					frappe.log_error("SharePoint File Upload Error", response.text)
+					record_sync_results([make_sync_result(self.filedoc, self.drive_id, error=response.text)])
+					return
+				item = response.json()
+				if self.check_integrity(item, body.hashes.as_dict(), file_name) == INTEGRITY_MISMATCH:
+					record_sync_results([make_sync_result(self.filedoc, self.drive_id, error="Uploaded content does not match the local file")])
+					return
+
+			if item:
+				upsert_items(self.drive_id, [item])
+				if not copied:
+					record_upload_throughput(file_size, time.monotonic() - started)
+
+				# Mark file as uploaded and replace file link if configured
+				file_url = get_offloaded_file_url(self.settings, self.filedoc, item) if self.settings.replace_file_link else None
+				record_sync_results([make_sync_result(self.filedoc, self.drive_id, item=item, file_url=file_url)])
+				cache_download_url(self.filedoc, item)
+				# Only drop the local copy once SharePoint's hash confirms the upload
+				if file_url and item[LOCAL_HASHES].get("integrity") == INTEGRITY_VERIFIED:
+					self.remove_file()
 				
 				frappe.msgprint(_("File uploaded to SharePoint successfully"))
 		
@@ -359,7 +652,7 @@ class SharePoint(object):
 		except Exception as e:
 			frappe.log_error("File remove error", str(e))
 	
-	def upload_file_to_folder(self, target_folder_id, filepath, filename):
+	def upload_file_to_folder(self, target_folder_id, filepath, filename, filedoc=None):
 		'''
 			Upload a single file to a specific SharePoint folder
 			
@@ -367,53 +660,429 @@ class SharePoint(object):
 				target_folder_id: SharePoint folder ID
 				filepath: Local file path
 				filename: Name for the file in SharePoint
+				filedoc: Optional File document name, its content is copied
+					server-side when another File with it was uploaded before
 				
 			Returns:
-				bool: True if upload successful, False otherwise
+				dict: The uploaded driveItem, or None if the upload failed
 		'''
 		try:
 			frappe.logger().info(f"[Upload File] Starting upload: {filename}")
 			frappe.logger().info(f"[Upload File] Source path: {filepath}")
 			frappe.logger().info(f"[Upload File] Target folder ID: {target_folder_id}")
 			
+			item = self.copy_duplicate(target_folder_id, filedoc, filename)
+			if item:
+				return item
+			
+			file_size = os.path.getsize(filepath)
+			if is_large_file(self.settings, file_size):
+				frappe.logger().info(f"[Upload File] {filename} is {file_size} bytes, using an upload session")
+				started = time.monotonic()
+				item = self.upload_large_file(target_folder_id, filepath, filename)
+				if item:
+					self.record_uploaded_item(item, file_size, time.monotonic() - started)
+				return item
+			
 			# Read file content
 			frappe.logger().info(f"[Upload File] Reading file content from disk")
 			with open(filepath, 'rb') as f:
 				file_content = f.read()
 			
 			frappe.logger().info(f"[Upload File] File size: {len(file_content)} bytes")
+			hashes = FileHashes()
+			hashes.update(file_content)
 			
 			if not file_content:
 				frappe.logger().error(f"[Upload File] File {filename} is empty")
 				frappe.log_error("SharePoint Upload Error", f"File {filename} is empty")
-				return False
+				return None
 			
 			# Upload file with replace behavior
 			frappe.logger().info(f"[Upload File] Getting authentication headers")
 			headers = get_request_header(self.settings)
 			headers.update({"Content-Type": "application/octet-stream"})
 			
-			url = f'{self.base_url}/items/{target_folder_id}:/{filename}:/content'
+			url = f'{self.base_url}/items/{target_folder_id}:/{quote(filename)}:/content'
 			frappe.logger().info(f"[Upload File] Upload URL: {url}")
 			
 			frappe.logger().info(f"[Upload File] Making PUT request to SharePoint")
-			response = make_request('PUT', url, headers, file_content)
+			started = time.monotonic()
+			response = make_request('PUT', url, headers, throttled_body(self.settings, file_content))
 			
 			frappe.logger().info(f"[Upload File] Response status: {response.status_code if response else 'None'}")
 			
 			if not response.ok:
+				self.note_missing_folder(response, target_folder_id)
 				frappe.logger().error(f"[Upload File] Upload failed for {filename}")
 				frappe.logger().error(f"[Upload File] Response: {response.text if response else 'No response'}")
 				frappe.log_error("SharePoint File Upload Error", f"File: {filename}, Status: {response.status_code}, Error: {response.text}")
-				return False
+				return None
 			
+			item = response.json()
+			if self.check_integrity(item, hashes.as_dict(), filename) == INTEGRITY_MISMATCH:
+				return None
+			self.record_uploaded_item(item, len(file_content), time.monotonic() - started)
 			frappe.logger().info(f"[Upload File] Successfully uploaded {filename}")
-			return True
+			return item
 			
 		except Exception as e:
 			frappe.logger().error(f"[Upload File] Exception while uploading {filename}: {str(e)}")
 			frappe.log_error("File Upload Error", f"File: {filename}, Error: {str(e)}")
+			return None
+	
+	def copy_duplicate(self, target_folder_id, filedoc, filename):
+		'''
+			Place a File in a folder by copying an uploaded File with the same content
+
+			Graph copies the item server-side, so the bytes are not sent again.
+			The copy runs asynchronously and is followed through its monitor URL.
+
+			Args:
+				target_folder_id: SharePoint folder ID
+				filedoc: File document name
+				filename: Name for the file in SharePoint
+
+			Returns:
+				dict: The copied driveItem, or None if the file has to be uploaded
+		'''
+		if not filedoc:
+			return None
+
+		try:
+			source = find_synced_duplicate(filedoc)
+			if not source:
+				return None
+
+			mirrored = get_item(source.drive_id, source.item_id)
+			if (source.drive_id == self.drive_id and mirrored
+					and mirrored.parent_id == target_folder_id and mirrored.item_name == filename):
+				# The same content is already in place under this name
+				item = self.get_drive_item(source.item_id)
+				return item if item and self.check_copy(item, source, filename) else None
+
+			frappe.logger().info(f"[Copy] {filename} has the content of {source.name}, copying item {source.item_id}")
+			headers = get_request_header(self.settings)
+			headers.update(ContentType)
+			url = f'{self.settings.graph_api_url}/drives/{source.drive_id}/items/{source.item_id}/copy?@microsoft.graph.conflictBehavior=replace'
+			body = {
+				"parentReference": {"driveId": self.drive_id, "id": target_folder_id},
+				"name": filename
+			}
+
+			response = make_request('POST', url, headers, body)
+			if response.status_code != 202 or not response.headers.get("Location"):
+				frappe.logger().warning(f"[Copy] Could not copy {source.item_id}: {response.status_code}, uploading {filename} instead")
+				return None
+
+			item_id = self.wait_for_copy(response.headers["Location"], filename)
+			item = self.get_drive_item(item_id) if item_id else None
+			if item:
+				upsert_items(self.drive_id, [item])
+				frappe.logger().info(f"[Copy] Copied {filename} as item {item_id}")
+			return item if item and self.check_copy(item, source, filename) else None
+
+		except Exception as e:
+			frappe.log_error("SharePoint Copy Error", f"File: {filename}, Error: {str(e)}")
+			return None
+
+	def check_copy(self, item, source, filename):
+		'''
+			A copy holds the source's content, so it is checked against the hashes recorded for the source
+		'''
+		local = {
+			"quick_xor_hash": source.quick_xor_hash,
+			"sha256_hash": source.sha256_hash,
+			"size": cint(source.file_size)
+		}
+		return self.check_integrity(item, local, filename) != INTEGRITY_MISMATCH
+
+	def check_integrity(self, item, local, filename):
+		'''
+			Compare an uploaded item with the local hashes and keep the result on the item
+
+			Args:
+				item: driveItem returned by Graph
+				local: quick_xor_hash, sha256_hash and size of the local content
+				filename: Name of the file, for the error log
+
+			Returns:
+				str: Verified, Mismatch or Unverified
+		'''
+		integrity = get_integrity(local, item)
+		item[LOCAL_HASHES] = dict(local, integrity=integrity)
+		if integrity == INTEGRITY_MISMATCH:
+			remote = ((item.get("file") or {}).get("hashes") or {}).get("quickXorHash")
+			frappe.log_error(
+				"SharePoint Integrity Error",
+				f"File: {filename}, Item: {item.get('id')}, Local: {local['quick_xor_hash']} ({local['size']} bytes), Remote: {remote} ({item.get('size')} bytes)"
+			)
+		return integrity
+
+	def wait_for_copy(self, monitor_url, filename):
+		'''
+			Poll a copy's monitor URL until it completes
+
+			Returns:
+				str: ID of the new item, or None if the copy failed or took too long
+		'''
+		deadline = time.monotonic() + COPY_TIMEOUT
+		delay = COPY_POLL_INTERVAL
+
+		while time.monotonic() < deadline:
+			time.sleep(delay)
+			# The monitor URL is pre-authenticated and must not receive the bearer token
+			response = make_request('GET', monitor_url, {}, None)
+			if not response.ok:
+				frappe.logger().warning(f"[Copy] Monitor of {filename} returned {response.status_code}")
+				return None
+
+			status = response.json()
+			if status.get("status") == "completed":
+				return status.get("resourceId")
+			if status.get("status") == "failed":
+				frappe.log_error("SharePoint Copy Error", f"File: {filename}, Status: {status}")
+				return None
+			delay = min(delay * 2, COPY_MAX_POLL_INTERVAL)
+
+		frappe.logger().warning(f"[Copy] Copy of {filename} did not complete within {COPY_TIMEOUT}s")
+		return None
+
+	def move_item(self, item_id, parent_folder_id, name):
+		'''
+			Move and rename a driveItem in one call, whatever its size
+
+			Returns:
+				dict: The moved driveItem, or None if it could not be moved
+		'''
+		headers = get_request_header(self.settings)
+		headers.update(ContentType)
+		url = f'{self.base_url}/items/{item_id}?$select={FOLDER_SELECT}'
+		body = {"name": name, "parentReference": {"id": parent_folder_id}}
+
+		response = make_request('PATCH', url, headers, body)
+		if not response.ok:
+			frappe.log_error("SharePoint Move Error", f"Item: {item_id}, Name: {name}, Status: {response.status_code}, Error: {response.text}")
+			return None
+
+		item = response.json()
+		upsert_items(self.drive_id, [item])
+		return item
+
+	def record_uploaded_item(self, item, file_size, seconds):
+		upsert_items(self.drive_id, [item])
+		record_upload_throughput(file_size, seconds)
+
+	def use_async_transport(self):
+		'''
+			Whether bulk calls go through the asyncio transport
+		'''
+		if self.settings.get("graph_transport") != TRANSPORT_ASYNC:
 			return False
+		if not async_transport.is_available():
+			frappe.logger().warning("[SharePoint] Async transport selected but aiohttp is not installed, sending one request at a time")
+			return False
+		return True
+
+	def upload_files(self, target_folder_id, files):
+		'''
+			Upload several files to a specific SharePoint folder
+
+			With the async transport the uploads run concurrently up to the
+			configured limit, otherwise one after another.
+
+			Args:
+				target_folder_id: SharePoint folder ID
+				files: List of (filepath, filename)
+
+			Returns:
+				list: The uploaded driveItem or None for each file, in order
+		'''
+		if self.use_async_transport():
+			return async_transport.upload_files(self, target_folder_id, files)
+		return [self.upload_file_to_folder(target_folder_id, filepath, filename) for filepath, filename in files]
+
+	def create_upload_session(self, target_folder_id, filename, conflict_behavior="replace"):
+		'''
+			Create a Graph upload session for a file in a folder
+			
+			Args:
+				target_folder_id: SharePoint folder ID
+				filename: Name for the file in SharePoint
+				conflict_behavior: replace, rename or fail
+				
+			Returns:
+				dict: The session with uploadUrl and expirationDateTime, or None
+		'''
+		headers = get_request_header(self.settings)
+		headers.update(ContentType)
+		url = f'{self.base_url}/items/{target_folder_id}:/{quote(filename)}:/createUploadSession'
+		body = {"item": {"@microsoft.graph.conflictBehavior": conflict_behavior}}
+		
+		response = make_request('POST', url, headers, body)
+		if not response.ok:
+			self.note_missing_folder(response, target_folder_id)
+			frappe.log_error("SharePoint Upload Session Error", f"File: {filename}, Status: {response.status_code}, Error: {response.text}")
+			return None
+		return response.json()
+	
+	def upload_large_file(self, target_folder_id, filepath, filename, on_progress=None):
+		'''
+			Upload a file in chunks through a Graph upload session
+			
+			Args:
+				target_folder_id: SharePoint folder ID
+				filepath: Local file path
+				filename: Name for the file in SharePoint
+				on_progress: Optional callback receiving the number of bytes sent so far
+				
+			Returns:
+				dict: The uploaded driveItem, or None if the upload failed
+		'''
+		try:
+			file_size = os.path.getsize(filepath)
+			with open(filepath, 'rb') as f:
+				return self.upload_stream(target_folder_id, f, file_size, filename, on_progress)
+			
+		except Exception as e:
+			frappe.logger().error(f"[Upload Session] Exception while uploading {filename}: {str(e)}")
+			frappe.log_error("File Upload Error", f"File: {filename}, Error: {str(e)}")
+			return None
+	
+	def upload_stream(self, target_folder_id, f, file_size, filename, on_progress=None):
+		'''
+			Upload file_size bytes read from a file object in chunks through a Graph upload session
+			
+			Returns:
+				dict: The uploaded driveItem, or None if the upload failed
+		'''
+		frappe.logger().info(f"[Upload Session] Creating session for {filename} ({file_size} bytes)")
+		
+		session = self.create_upload_session(target_folder_id, filename)
+		if not session:
+			return None
+		
+		# The upload URL is pre-authenticated and must not receive the bearer token
+		upload_url = session["uploadUrl"]
+		sent = 0
+		hashes = FileHashes()
+		
+		while sent < file_size:
+			chunk = f.read(UPLOAD_CHUNK_SIZE)
+			if not chunk:
+				frappe.log_error("SharePoint Upload Session Error", f"File: {filename}, ended after {sent} of {file_size} bytes")
+				make_request('DELETE', upload_url, {}, None)
+				return None
+			
+			hashes.update(chunk)
+			chunk_headers = {
+				"Content-Length": str(len(chunk)),
+				"Content-Range": f"bytes {sent}-{sent + len(chunk) - 1}/{file_size}"
+			}
+			response = make_request('PUT', upload_url, chunk_headers, throttled_body(self.settings, chunk))
+			
+			if not response.ok:
+				frappe.log_error("SharePoint Upload Session Error", f"File: {filename}, Range start: {sent}, Status: {response.status_code}, Error: {response.text}")
+				make_request('DELETE', upload_url, {}, None)
+				return None
+			
+			sent += len(chunk)
+			frappe.logger().info(f"[Upload Session] {filename}: {sent}/{file_size} bytes")
+			if on_progress:
+				on_progress(sent)
+		
+		# The response to the final chunk is the completed driveItem
+		item = response.json()
+		if self.check_integrity(item, hashes.as_dict(), filename) == INTEGRITY_MISMATCH:
+			return None
+		return item
+	
+	def upload_archive(self, target_folder_id, archive):
+		'''
+			Upload an AttachmentArchive while its ZIP is generated
+			
+			Returns:
+				dict: The uploaded driveItem, or None if the upload failed
+		'''
+		filename = archive.filename
+		try:
+			file_size = archive.get_size()
+			frappe.logger().info(f"[Archive] Uploading {len(archive.entries)} attachment(s) as {filename} ({file_size} bytes)")
+			started = time.monotonic()
+			
+			if is_large_file(self.settings, file_size):
+				item = self.upload_stream(target_folder_id, archive.open(), file_size, filename)
+			else:
+				headers = get_request_header(self.settings)
+				headers.update({"Content-Type": "application/zip"})
+				url = f'{self.base_url}/items/{target_folder_id}:/{quote(filename)}:/content'
+				body = HashingStream(archive.open(), file_size)
+				response = make_request('PUT', url, headers, throttled_body(self.settings, body, file_size))
+				if not response.ok:
+					self.note_missing_folder(response, target_folder_id)
+					frappe.log_error("SharePoint File Upload Error", f"File: {filename}, Status: {response.status_code}, Error: {response.text}")
+					return None
+				
+				item = response.json()
+				if self.check_integrity(item, body.hashes.as_dict(), filename) == INTEGRITY_MISMATCH:
+					return None
+			
+			if item:
+				self.record_uploaded_item(item, file_size, time.monotonic() - started)
+			return item
+			
+		except Exception as e:
+			frappe.logger().error(f"[Archive] Exception while uploading {filename}: {str(e)}")
+			frappe.log_error("File Upload Error", f"File: {filename}, Error: {str(e)}")
+			return None
+	
+	def get_drive_item(self, item_id, select=None):
+		'''
+			Fetch a driveItem by ID
+			
+			Args:
+				item_id: SharePoint item ID
+				select: Optional comma separated list of properties to return
+				
+			Returns:
+				dict: The driveItem, or None if it could not be fetched
+		'''
+		headers = get_request_header(self.settings)
+		url = f'{self.base_url}/items/{item_id}'
+		if select:
+			url = f'{url}?$select={select}'
+		
+		response = make_request('GET', url, headers, None)
+		if not response.ok:
+			frappe.log_error("SharePoint Item Fetch Error", f"Item: {item_id}, Status: {response.status_code}, Error: {response.text}")
+			return None
+		return response.json()
+	
+	def get_drive_items(self, item_ids, select=None):
+		'''
+			Fetch several driveItems by ID, concurrently with the async transport
+
+			Returns:
+				dict: driveItem or None by item ID
+		'''
+		if self.use_async_transport():
+			return async_transport.get_drive_items(self, item_ids, select)
+		return {item_id: self.get_drive_item(item_id, select) for item_id in item_ids}
+
+	def get_drive_item_by_url(self, web_url):
+		'''
+			Resolve a SharePoint webUrl to its driveItem through the shares API
+		'''
+		# Sharing URLs are addressed as u! followed by unpadded base64url
+		share_id = "u!" + base64.urlsafe_b64encode(web_url.encode()).decode().rstrip("=")
+		headers = get_request_header(self.settings)
+		url = f'{self.settings.graph_api_url}/shares/{share_id}/driveItem'
+		
+		response = make_request('GET', url, headers, None)
+		if not response.ok:
+			frappe.log_error("SharePoint Item Fetch Error", f"URL: {web_url}, Status: {response.status_code}, Error: {response.text}")
+			return None
+		return response.json()
 	
 	def get_folder_url(self, folder_id):
 		'''
@@ -428,14 +1097,19 @@ class SharePoint(object):
 		try:
 			frappe.logger().info(f"[Get Folder URL] Fetching URL for folder ID: {folder_id}")
 			
+			folder = get_item(self.drive_id, folder_id)
+			if folder and folder.web_url:
+				return folder.web_url
+			
 			headers = get_request_header(self.settings)
-			url = f'{self.base_url}/items/{folder_id}'
+			url = f'{self.base_url}/items/{folder_id}?$select={FOLDER_SELECT}'
 			frappe.logger().info(f"[Get Folder URL] Request URL: {url}")
 			
 			response = make_request('GET', url, headers, None)
 			frappe.logger().info(f"[Get Folder URL] Response status: {response.status_code if response else 'None'}")
 			
 			if response.ok:
+				upsert_items(self.drive_id, [response.json()])
 				web_url = response.json().get('webUrl')
 				frappe.logger().info(f"[Get Folder URL] Retrieved web URL: {web_url}")
 				return web_url
@@ -0,0 +1,364 @@
+import frappe
+from frappe.utils import now_datetime
+from frappe_sharepoint.controllers.file_controller import INTERNAL_DOCTYPES
+from frappe_sharepoint.utils.attachment_archive import ARCHIVE_SUFFIX
+from frappe_sharepoint.utils.document_upload import get_file_path
+from frappe_sharepoint.utils.drive_mirror import MIRROR
+from frappe_sharepoint.utils.job_routing import enqueue_file_upload
+from frappe_sharepoint.utils.sync_state import STATUS_PENDING, STATUS_SYNCED, SYNC_STATE, get_unsynced_files, mark_files_failed
+import csv
+import os
+
+'''
+	Audit of local upload state against the files actually in SharePoint
+
+	Both sides are streamed: Sync State rows in pages and each drive's full
+	delta feed, which lists the drive in pages of many items. Local entries
+	are kept in a dict keyed by item id and matched off as remote items
+	arrive, so the comparison is a set difference and Graph is called once
+	per page, never once per file.
+'''
+
+AUDIT = "SharePoint Sync Audit"
+SETTINGS = "SharePoint Settings"
+
+# Rows read per query
+BATCH_SIZE = 5000
+INVENTORY_SELECT = "id,name,size,file,folder,deleted,parentReference"
+
+MISSING = "Missing"
+MISMATCHED = "Mismatched"
+MOVED = "Moved"
+EXTRA = "Extra"
+NOT_UPLOADED = "Not Uploaded"
+UNTRACKED = "Untracked"
+
+# Categories re-queue uploads again
+REQUEUE_CATEGORIES = (MISSING, MISMATCHED, NOT_UPLOADED, UNTRACKED)
+
+REPORT_COLUMNS = ["category", "file", "drive_id", "item_id", "local_size", "remote_size", "local_hash", "remote_hash", "remote_name"]
+
+
+@frappe.whitelist()
+def start_sync_audit():
+	'''
+		Create an audit and run it in the background
+
+		Returns:
+			str: Name of the SharePoint Sync Audit
+	'''
+	frappe.only_for("System Manager")
+	audit = frappe.get_doc({"doctype": AUDIT, "status": "Queued"}).insert()
+	frappe.enqueue(
+		"frappe_sharepoint.utils.sync_audit.run_sync_audit",
+		queue="long",
+		timeout=4 * 60 * 60,
+		audit=audit.name
+	)
+	return audit.name
+
+
+def run_sync_audit(audit):
+	audit = frappe.get_doc(AUDIT, audit)
+	audit.db_set({"status": "Running", "started_on": now_datetime()})
+	frappe.db.commit()
+
+	path = get_report_path(audit.name)
+	try:
+		with open(path, "w", newline="") as f:
+			writer = csv.writer(f)
+			writer.writerow(REPORT_COLUMNS)
+			counts = audit_files(writer)
+
+		audit.db_set(dict(counts, status="Completed", finished_on=now_datetime(), report=attach_report(audit.name, path)))
+	except Exception as e:
+		frappe.db.rollback()
+		frappe.log_error("SharePoint Sync Audit Error", str(e))
+		audit.db_set({"status": "Failed", "finished_on": now_datetime(), "error": str(e)})
+
+	frappe.db.commit()
+	frappe.publish_realtime("sharepoint_sync", {
+		"message": frappe._("SharePoint sync audit {0} finished").format(audit.name),
+		"indicator": "green" if audit.status == "Completed" else "red"
+	}, user=audit.owner)
+
+
+def audit_files(writer):
+	'''
+		Compare local and remote state and write every finding to the report
+
+		Returns:
+			dict: Counts for the audit's fields
+	'''
+	from frappe_sharepoint.utils.drive_routing import get_configured_drives
+
+	settings = frappe.get_single(SETTINGS)
+	counts = {
+		"local_files": 0,
+		"remote_files": 0,
+		"missing_count": 0,
+		"mismatched_count": 0,
+		"moved_count": 0,
+		"extra_count": 0,
+		"not_uploaded_count": 0,
+		"untracked_count": 0
+	}
+
+	def report(category, file_doc=None, drive_id=None, item_id=None, local=None, remote=None):
+		local = local or (None, None, None)
+		remote = remote or {}
+		writer.writerow([
+			category, file_doc, drive_id, item_id,
+			local[1], remote.get("size"),
+			local[2], ((remote.get("file") or {}).get("hashes") or {}).get("quickXorHash"),
+			remote.get("name")
+		])
+		counts[f"{category.lower().replace(' ', '_')}_count"] += 1
+
+	local, archived = get_local_inventory()
+	counts["local_files"] = sum(len(items) for items in local.values()) + sum(
+		len(names) for archives in archived.values() for names in archives.values()
+	)
+
+	for drive_id in set(get_configured_drives(settings)) | set(local) | set(archived):
+		expected = local.get(drive_id, {})
+		expected_archives = archived.get(drive_id, {})
+		managed_folders = get_managed_folders(drive_id)
+		app_files = get_app_files(drive_id)
+
+		for item in iter_remote_inventory(settings, drive_id):
+			counts["remote_files"] += 1
+			parent_id = (item.get("parentReference") or {}).get("id")
+			entry = expected.pop(item["id"], None)
+
+			# The ZIP of archived attachments, they are only checked for being there
+			if not entry and expected_archives.pop(item["id"], None):
+				continue
+
+			if not entry:
+				if parent_id in managed_folders and not is_app_file(item, managed_folders[parent_id], app_files):
+					report(EXTRA, drive_id=drive_id, item_id=item["id"], remote=item)
+				continue
+
+			remote_hash = ((item.get("file") or {}).get("hashes") or {}).get("quickXorHash")
+			if (entry[1] and item.get("size") != entry[1]) or (entry[2] and remote_hash and remote_hash != entry[2]):
+				report(MISMATCHED, entry[0], drive_id, item["id"], entry, item)
+			elif managed_folders and parent_id not in managed_folders:
+				report(MOVED, entry[0], drive_id, item["id"], entry, item)
+
+		# Whatever was not matched off is gone from SharePoint
+		for item_id, entry in expected.items():
+			report(MISSING, entry[0], drive_id, item_id, entry)
+		for item_id, names in expected_archives.items():
+			for name in names:
+				report(MISSING, name, drive_id, item_id)
+		local.pop(drive_id, None)
+		archived.pop(drive_id, None)
+
+	after = None
+	while True:
+		files = get_unsynced_files(after=after, limit=BATCH_SIZE, fields=["name", "attached_to_doctype"])
+		if not files:
+			break
+		for file_doc in files:
+			if file_doc.attached_to_doctype not in INTERNAL_DOCTYPES:
+				report(NOT_UPLOADED, file_doc.name)
+		after = files[-1].name
+
+	for name in iter_untracked_files():
+		report(UNTRACKED, name)
+
+	frappe.logger().info(f"[Sync Audit] {counts}")
+	return counts
+
+
+def get_local_inventory():
+	'''
+		Synced Files by drive and item id
+
+		Returns:
+			tuple: Files as compact (file, size, hash) tuples by drive and item id,
+				and the names of archived Files by drive and ZIP item id
+	'''
+	inventory, archived = {}, {}
+	after = ""
+	while True:
+		rows = frappe.get_all(
+			SYNC_STATE,
+			filters={"status": STATUS_SYNCED, "item_id": ["is", "set"], "name": [">", after]},
+			fields=["name", "drive_id", "item_id", "file_size", "quick_xor_hash", "archive_entry"],
+			order_by="name asc",
+			limit_page_length=BATCH_SIZE,
+			as_list=True
+		)
+		if not rows:
+			return inventory, archived
+
+		for name, drive_id, item_id, file_size, quick_xor_hash, archive_entry in rows:
+			if archive_entry:
+				archived.setdefault(drive_id, {}).setdefault(item_id, []).append(name)
+			else:
+				inventory.setdefault(drive_id, {})[item_id] = (name, int(file_size or 0), quick_xor_hash)
+		after = rows[-1][0]
+
+
+def get_managed_folders(drive_id):
+	'''
+		Mirrored folders of the drive, item id -> folder name
+	'''
+	return dict(frappe.get_all(MIRROR, filters={"drive_id": drive_id, "is_folder": 1}, fields=["item_id", "item_name"], as_list=True))
+
+
+def get_app_files(drive_id):
+	'''
+		Ids of the files the app wrote to the drive, as recorded in the mirror
+	'''
+	return set(frappe.get_all(MIRROR, filters={"drive_id": drive_id, "is_folder": 0}, pluck="item_id"))
+
+
+def is_app_file(item, folder_name, app_files):
+	'''
+		Whether a file without a Sync State was uploaded by the app itself
+
+		Document PDFs and attachment ZIPs have no File of their own. Those
+		uploaded before the mirror recorded them are recognised by the name
+		of their document folder.
+	'''
+	return item["id"] in app_files or item.get("name") in (f"{folder_name}.pdf", f"{folder_name}{ARCHIVE_SUFFIX}")
+
+
+def iter_remote_inventory(settings, drive_id):
+	'''
+		Every file in the drive, streamed page by page from the full delta feed
+	'''
+	from frappe_sharepoint.utils import get_request_header, make_request
+
+	url = f"{settings.graph_api_url}/drives/{drive_id}/root/delta?$select={INVENTORY_SELECT}"
+	while url:
+		response = make_request('GET', url, get_request_header(settings), None)
+		if not response.ok:
+			raise Exception(f"Could not list drive {drive_id}: {response.status_code} {response.text}")
+
+		data = response.json()
+		for item in data.get("value", []):
+			if "file" in item and "deleted" not in item:
+				yield item
+		url = data.get("@odata.nextLink")
+
+
+def iter_untracked_files():
+	'''
+		Files flagged as uploaded that have no Sync State row
+	'''
+	File = frappe.qb.DocType("File")
+	State = frappe.qb.DocType(SYNC_STATE)
+	after = ""
+	while True:
+		names = (
+			frappe.qb.from_(File)
+			.left_join(State).on(State.name == File.name)
+			.select(File.name)
+			.where((File.uploaded_to_sharepoint == 1) & State.name.isnull() & (File.name > after))
+			.orderby(File.name)
+			.limit(BATCH_SIZE)
+		).run(pluck=True)
+		if not names:
+			return
+		yield from names
+		after = names[-1]
+
+
+def get_report_path(audit):
+	return frappe.get_site_path("private", "files", f"{audit}.csv")
+
+
+def attach_report(audit, path):
+	'''
+		Attach the report written to disk without reading it into memory
+	'''
+	file_doc = frappe.get_doc({
+		"doctype": "File",
+		"file_name": os.path.basename(path),
+		"file_url": f"/private/files/{os.path.basename(path)}",
+		"is_private": 1,
+		"attached_to_doctype": AUDIT,
+		"attached_to_name": audit
+	})
+	file_doc.insert(ignore_permissions=True)
+	return file_doc.file_url
+
+
+def enqueue_requeue(audit):
+	frappe.enqueue(
+		"frappe_sharepoint.utils.sync_audit.requeue_files",
+		queue="long",
+		timeout=2 * 60 * 60,
+		audit=audit
+	)
+
+
+def requeue_files(audit):
+	'''
+		Reset and re-queue the uploads of the Files an audit found missing, mismatched or never uploaded
+
+		Files that cannot be uploaded again, without a local copy or a
+		document, are marked Failed instead of being left Pending.
+	'''
+	audit = frappe.get_doc(AUDIT, audit)
+	settings = frappe.get_single(SETTINGS)
+	requeued = unavailable = 0
+
+	File = frappe.qb.DocType("File")
+	State = frappe.qb.DocType(SYNC_STATE)
+
+	for names in iter_report_files(get_report_path(audit.name)):
+		files = frappe.get_all(
+			"File",
+			filters={"name": ["in", names]},
+			fields=["name", "file_name", "file_url", "is_private", "attached_to_doctype", "attached_to_name"]
+		)
+		uploads, missing = [], []
+		for file_doc in files:
+			filepath = get_file_path(file_doc)
+			if filepath and file_doc.attached_to_doctype:
+				uploads.append((file_doc, filepath))
+			else:
+				missing.append(file_doc.name)
+
+		unavailable += len(missing)
+		mark_files_failed(missing, "No local copy or document to upload")
+		queued = [file_doc.name for file_doc, filepath in uploads]
+		if queued:
+			frappe.qb.update(File).set(File.uploaded_to_sharepoint, 0).where(File.name.isin(queued)).run()
+			frappe.qb.update(State).set(State.status, STATUS_PENDING).where(State.name.isin(queued)).run()
+
+		for file_doc, filepath in uploads:
+			enqueue_file_upload(
+				doctype=file_doc.attached_to_doctype,
+				docname=file_doc.attached_to_name,
+				filepath=filepath,
+				filedoc=file_doc.name,
+				settings=settings,
+				bulk=True
+			)
+			requeued += 1
+		frappe.db.commit()
+
+	audit.db_set({"requeued_on": now_datetime(), "requeued_count": requeued, "unavailable_count": unavailable})
+	frappe.logger().info(f"[Sync Audit] {audit.name}: re-queued {requeued} file(s), {unavailable} without a local copy")
+
+
+def iter_report_files(path):
+	'''
+		File names to re-queue from a report, in batches
+	'''
+	batch = []
+	with open(path, newline="") as f:
+		for row in csv.DictReader(f):
+			if row["category"] in REQUEUE_CATEGORIES and row["file"]:
+				batch.append(row["file"])
+			if len(batch) >= BATCH_SIZE:
+				yield batch
+				batch = []
+	if batch:
+		yield batch
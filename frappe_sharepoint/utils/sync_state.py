@@ -0,0 +1,442 @@
+import frappe
+from frappe.query_builder import Case
+from frappe.utils import get_datetime, now_datetime
+from frappe_sharepoint.utils.file_hash import INTEGRITY_VERIFIED, LOCAL_HASHES
+from pypika.terms import Values
+
+'''
+	Bulk bookkeeping of SharePoint upload results
+'''
+
+SYNC_STATE = "SharePoint Sync State"
+
+STATUS_PENDING = "Pending"
+STATUS_SYNCED = "Synced"
+STATUS_FAILED = "Failed"
+
+# Rows written per statement
+BATCH_SIZE = 500
+
+SYNC_STATE_FIELDS = [
+	"name",
+	"file",
+	"attached_to_doctype",
+	"attached_to_name",
+	"status",
+	"content_hash",
+	"file_size",
+	"uploaded_on",
+	"sha256_hash",
+	"integrity",
+	"verified_on",
+	"drive_id",
+	"item_id",
+	"etag",
+	"remote_path",
+	"quick_xor_hash",
+	"remote_modified_on",
+	"error",
+	"archive_entry",
+	"creation",
+	"modified",
+	"owner",
+	"modified_by",
+	"docstatus",
+	"idx"
+]
+
+
+# Columns an upsert never overwrites on rows that already exist
+INSERT_ONLY_FIELDS = ("name", "creation", "owner", "docstatus", "idx")
+# Columns a failed upload overwrites, the item and hashes of an earlier upload stay
+FAILED_FIELDS = ["status", "error", "modified", "modified_by"]
+
+# Columns of a Pending Sync State held back by full upload queues
+PENDING_FIELDS = [
+	"name",
+	"file",
+	"attached_to_doctype",
+	"attached_to_name",
+	"status",
+	"awaiting_queue",
+	"content_hash",
+	"file_size",
+	"creation",
+	"modified",
+	"owner",
+	"modified_by",
+	"docstatus",
+	"idx"
+]
+
+
+def make_sync_result(file_doc, drive_id, item=None, file_url=None, error=None, archive_entry=None):
+	'''
+		Describe the outcome of one File upload for record_sync_results
+
+		Args:
+			file_doc: File document name
+			drive_id: Drive the file was uploaded to
+			item: driveItem returned by Graph, None if the upload failed
+			file_url: New file_url for the File, when the link is replaced
+			error: Error text for failed uploads
+			archive_entry: Name of the File inside item, when item is an attachment archive
+	'''
+	return frappe._dict(
+		file=file_doc,
+		drive_id=drive_id,
+		item=item,
+		file_url=file_url,
+		error=error,
+		archive_entry=archive_entry
+	)
+
+
+def get_remote_path(item):
+	'''
+		Drive-relative path of a driveItem, e.g. /Frappe Files/HR/Expense Claim/HR-EXP-0001/receipt.pdf
+	'''
+	parent_path = (item.get("parentReference") or {}).get("path") or ""
+	# parentReference.path looks like /drives/{drive-id}/root:/Folder/Sub
+	if ":" in parent_path:
+		parent_path = parent_path.split(":", 1)[1]
+	return f"{parent_path.rstrip('/')}/{item.get('name')}"
+
+
+def get_remote_datetime(value):
+	if not value:
+		return None
+	# Graph timestamps are ISO 8601 in UTC, e.g. 2024-11-19T09:41:07Z
+	return get_datetime(value[:19].replace("T", " "))
+
+
+def record_sync_results(results):
+	'''
+		Write upload results for many Files with a handful of statements
+
+		Upserts the Sync State rows of the given Files and flags the
+		successful ones as uploaded, instead of one set_value per field and File.
+		A failed upload of a File that is already in SharePoint keeps the
+		item and hashes of its earlier upload. Columns written elsewhere,
+		such as eviction and queueing, are left as they are.
+	'''
+	results = [r for r in results if r and r.file]
+	for start in range(0, len(results), BATCH_SIZE):
+		batch = results[start:start + BATCH_SIZE]
+		write_sync_states(batch)
+		mark_files_uploaded(batch)
+
+
+def write_sync_states(results):
+	names = [r.file for r in results]
+	files = {
+		f.name: f for f in frappe.get_all(
+			"File",
+			filters={"name": ["in", names]},
+			fields=["name", "attached_to_doctype", "attached_to_name", "content_hash", "file_size"]
+		)
+	}
+
+	now = now_datetime()
+	user = frappe.session.user
+	synced, failed = {}, {}
+
+	for result in results:
+		file_doc = files.get(result.file)
+		if not file_doc:
+			continue
+
+		item = result.item or {}
+		hashes = (item.get("file") or {}).get("hashes") or {}
+		local = item.get(LOCAL_HASHES) or {}
+		if result.archive_entry:
+			# Size and hashes of the ZIP say nothing about the File inside it
+			hashes = {}
+			local = {"integrity": local.get("integrity")}
+			item = dict(item, size=None)
+		(synced if result.item else failed)[result.file] = (
+			result.file,
+			result.file,
+			file_doc.attached_to_doctype,
+			file_doc.attached_to_name,
+			STATUS_SYNCED if result.item else STATUS_FAILED,
+			file_doc.content_hash,
+			item.get("size") or file_doc.file_size,
+			now if result.item else None,
+			local.get("sha256_hash"),
+			local.get("integrity"),
+			now if local.get("integrity") == INTEGRITY_VERIFIED else None,
+			result.drive_id,
+			item.get("id"),
+			item.get("eTag"),
+			get_remote_path(item) if item else None,
+			hashes.get("quickXorHash"),
+			get_remote_datetime(item.get("lastModifiedDateTime")),
+			result.error,
+			result.archive_entry if result.item else None,
+			now,
+			now,
+			user,
+			user,
+			0,
+			0
+		)
+
+	upsert_rows(SYNC_STATE, SYNC_STATE_FIELDS, list(synced.values()), [f for f in SYNC_STATE_FIELDS if f not in INSERT_ONLY_FIELDS])
+	upsert_rows(SYNC_STATE, SYNC_STATE_FIELDS, list(failed.values()), FAILED_FIELDS)
+
+
+def upsert_rows(doctype, fields, values, updated_fields):
+	'''
+		Insert rows in one statement, only updated_fields change on rows whose name exists
+
+		Rows must have distinct names.
+	'''
+	if not values:
+		return
+
+	Table = frappe.qb.DocType(doctype)
+	query = frappe.qb.into(Table).columns(*fields).insert(*values)
+	if frappe.db.db_type == "postgres":
+		query = query.on_conflict("name")
+		for field in updated_fields:
+			query = query.do_update(field)
+	else:
+		for field in updated_fields:
+			query = query.on_duplicate_key_update(Table[field], Values(Table[field]))
+	query.run()
+
+
+def mark_files_uploaded(results):
+	'''
+		Flag uploaded Files and replace their links in at most two UPDATEs
+	'''
+	File = frappe.qb.DocType("File")
+	flagged = [r.file for r in results if r.item and not r.file_url]
+	relinked = [r for r in results if r.item and r.file_url]
+
+	if flagged:
+		frappe.qb.update(File).set(File.uploaded_to_sharepoint, 1).where(File.name.isin(flagged)).run()
+
+	if relinked:
+		file_url = Case()
+		for result in relinked:
+			file_url = file_url.when(File.name == result.file, result.file_url)
+
+		(
+			frappe.qb.update(File)
+			.set(File.uploaded_to_sharepoint, 1)
+			.set(File.file_url, file_url.else_(File.file_url))
+			.where(File.name.isin([r.file for r in relinked]))
+		).run()
+
+
+def update_file_urls(file_urls):
+	'''
+		Point many Files to new URLs with one UPDATE
+
+		Args:
+			file_urls: dict of File name -> file_url
+	'''
+	if not file_urls:
+		return
+
+	File = frappe.qb.DocType("File")
+	file_url = Case()
+	for name, url in file_urls.items():
+		file_url = file_url.when(File.name == name, url)
+
+	(
+		frappe.qb.update(File)
+		.set(File.file_url, file_url.else_(File.file_url))
+		.where(File.name.isin(list(file_urls)))
+	).run()
+
+
+def get_unsynced_files(after=None, limit=BATCH_SIZE, fields=None):
+	'''
+		Page through attached Files that were never uploaded
+
+		Uses keyset pagination in name order so the
+		(uploaded_to_sharepoint, name) index serves every page.
+
+		Args:
+			after: Last File name of the previous page
+			limit: Page size
+			fields: File fields to return
+	'''
+	filters = {"uploaded_to_sharepoint": 0, "attached_to_doctype": ["is", "set"]}
+	if after:
+		filters["name"] = [">", after]
+
+	return frappe.get_all(
+		"File",
+		filters=filters,
+		fields=fields or ["name", "file_name", "file_url", "is_private", "attached_to_doctype", "attached_to_name"],
+		order_by="name asc",
+		limit_page_length=limit
+	)
+
+
+def delete_sync_states(names):
+	if names:
+		frappe.db.delete(SYNC_STATE, {"name": ("in", names)})
+
+
+def get_sync_state(file_doc):
+	return frappe.db.get_value(SYNC_STATE, file_doc, ["*"], as_dict=True)
+
+
+def find_synced_duplicate(file_doc):
+	'''
+		Sync State of another File with the same content, already in SharePoint
+
+		Returns:
+			frappe._dict: name, drive_id, item_id, size and hashes of the most recent upload, or None
+	'''
+	file = frappe.db.get_value("File", file_doc, ["content_hash", "file_size"], as_dict=True)
+	if not file or not file.content_hash:
+		return None
+
+	filters = {
+		"content_hash": file.content_hash,
+		"status": STATUS_SYNCED,
+		"item_id": ["is", "set"],
+		# The item of an archived File is its document's ZIP
+		"archive_entry": ["is", "not set"],
+		"name": ["!=", file_doc]
+	}
+	if file.file_size:
+		filters["file_size"] = file.file_size
+
+	rows = frappe.get_all(
+		SYNC_STATE,
+		filters=filters,
+		fields=["name", "drive_id", "item_id", "file_size", "quick_xor_hash", "sha256_hash"],
+		order_by="uploaded_on desc",
+		limit_page_length=1
+	)
+	return rows[0] if rows else None
+
+
+def update_remote_paths(remote_paths):
+	'''
+		Set the remote_path of many Sync State rows with one UPDATE
+
+		Args:
+			remote_paths: dict of Sync State name -> remote_path
+	'''
+	if not remote_paths:
+		return
+
+	State = frappe.qb.DocType(SYNC_STATE)
+	remote_path = Case()
+	for name, path in remote_paths.items():
+		remote_path = remote_path.when(State.name == name, path)
+
+	(
+		frappe.qb.update(State)
+		.set(State.remote_path, remote_path.else_(State.remote_path))
+		.where(State.name.isin(list(remote_paths)))
+	).run()
+
+
+def update_integrity(results):
+	'''
+		Record local hashes and integrity checks of many Sync State rows
+
+		Args:
+			results: dict of Sync State name -> (sha256_hash, integrity)
+	'''
+	if not results:
+		return
+
+	State = frappe.qb.DocType(SYNC_STATE)
+	sha256_hash, integrity = Case(), Case()
+	for name, (file_hash, file_integrity) in results.items():
+		sha256_hash = sha256_hash.when(State.name == name, file_hash)
+		integrity = integrity.when(State.name == name, file_integrity)
+
+	(
+		frappe.qb.update(State)
+		.set(State.sha256_hash, sha256_hash.else_(State.sha256_hash))
+		.set(State.integrity, integrity.else_(State.integrity))
+		.where(State.name.isin(list(results)))
+	).run()
+
+	verified = [name for name, (file_hash, file_integrity) in results.items() if file_integrity == INTEGRITY_VERIFIED]
+	if verified:
+		frappe.qb.update(State).set(State.verified_on, now_datetime()).where(State.name.isin(verified)).run()
+
+
+def mark_files_pending(files):
+	'''
+		Record Files whose upload waits for room in the upload queues
+
+		Args:
+			files: File documents
+	'''
+	now = now_datetime()
+	user = frappe.session.user
+	values = {f.name: (
+		f.name,
+		f.name,
+		f.attached_to_doctype,
+		f.attached_to_name,
+		STATUS_PENDING,
+		1,
+		f.content_hash,
+		f.file_size,
+		now,
+		now,
+		user,
+		user,
+		0,
+		0
+	) for f in files}
+	# A File uploaded before keeps its item and hashes while it waits
+	upsert_rows(SYNC_STATE, PENDING_FIELDS, list(values.values()), [f for f in PENDING_FIELDS if f not in INSERT_ONLY_FIELDS])
+
+
+def get_awaiting_files(limit):
+	'''
+		Oldest Files waiting for room in the upload queues, with what their upload needs
+	'''
+	State = frappe.qb.DocType(SYNC_STATE)
+	File = frappe.qb.DocType("File")
+	return (
+		frappe.qb.from_(State)
+		.left_join(File).on(File.name == State.file)
+		.select(
+			State.name, File.name.as_("file"), File.attached_to_doctype, File.attached_to_name,
+			File.file_name, File.file_url, File.is_private, File.uploaded_to_sharepoint
+		)
+		.where((State.awaiting_queue == 1) & (State.status == STATUS_PENDING))
+		.orderby(State.creation)
+		.limit(limit)
+	).run(as_dict=True)
+
+
+def mark_files_queued(names):
+	if not names:
+		return
+
+	State = frappe.qb.DocType(SYNC_STATE)
+	frappe.qb.update(State).set(State.awaiting_queue, 0).where(State.name.isin(names)).run()
+
+
+def mark_files_failed(names, error):
+	'''
+		Give up on held back Files that cannot be queued
+	'''
+	if not names:
+		return
+
+	State = frappe.qb.DocType(SYNC_STATE)
+	(
+		frappe.qb.update(State)
+		.set(State.status, STATUS_FAILED)
+		.set(State.awaiting_queue, 0)
+		.set(State.error, error)
+		.where(State.name.isin(names))
+	).run()
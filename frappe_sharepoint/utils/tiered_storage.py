@@ -0,0 +1,251 @@
+import frappe
+from frappe.utils import cint, now_datetime
+from frappe_sharepoint.utils.document_upload import get_file_path
+from frappe_sharepoint.utils.download import EXPIRED_URL_STATUSES, get_download_link, get_download_url
+from frappe_sharepoint.utils.file_hash import INTEGRITY_VERIFIED
+from frappe_sharepoint.utils.sync_state import STATUS_SYNCED, SYNC_STATE, update_file_urls
+import os
+import requests
+import time
+
+'''
+	Tiered storage: keep hot files local, evict cold ones to SharePoint
+'''
+
+SETTINGS = "SharePoint Settings"
+CACHE_FOLDER = "sharepoint_cache"
+
+# Sync State rows read and Files evicted per statement
+BATCH_SIZE = 500
+DOWNLOAD_CHUNK_SIZE = 1024 * 1024
+
+
+def is_tiered_storage_enabled(settings):
+	return bool(settings.get("enable_tiered_storage")) and not settings.get("replace_file_link")
+
+
+def evict_cold_files():
+	'''
+		Scheduled job: evict least recently used local files until they fit the disk budget
+
+		Access times come from the filesystem. Only files not accessed within
+		Keep Accessed Files For and whose upload was verified are candidates,
+		and only after the remote copy has been checked against the local one.
+	'''
+	settings = frappe.get_single(SETTINGS)
+	if not settings.enable_file_sync or not is_tiered_storage_enabled(settings):
+		return
+
+	budget = cint(settings.local_disk_budget) * 1024 * 1024
+	cold_before = time.time() - cint(settings.keep_local_days) * 24 * 60 * 60
+
+	total, cold = 0, []
+	for row in iter_local_files():
+		try:
+			stat = os.stat(row.path)
+		except OSError:
+			continue
+
+		total += stat.st_size
+		last_access = max(stat.st_atime, stat.st_mtime)
+		# Without a verified upload the remote copy may be the only one that is corrupt
+		if last_access < cold_before and row.integrity == INTEGRITY_VERIFIED:
+			cold.append((last_access, stat.st_size, row))
+
+	excess = total - budget
+	frappe.logger().info(f"[Tiered Storage] {total} bytes local, budget {budget}, {len(cold)} cold files")
+	if excess <= 0:
+		return
+
+	# Least recently used first
+	cold.sort(key=lambda entry: entry[0])
+	selected, freed = [], 0
+	for last_access, size, row in cold:
+		if freed >= excess:
+			break
+		row.size = size
+		selected.append(row)
+		freed += size
+
+	for start in range(0, len(selected), BATCH_SIZE):
+		evict_files(selected[start:start + BATCH_SIZE])
+		frappe.db.commit()
+
+
+def iter_local_files():
+	'''
+		Synced Files that still have their local copy, in pages
+	'''
+	State = frappe.qb.DocType(SYNC_STATE)
+	File = frappe.qb.DocType("File")
+	after = ""
+
+	while True:
+		rows = (
+			frappe.qb.from_(State)
+			.join(File).on(File.name == State.file)
+			.select(
+				State.name, State.drive_id, State.item_id, State.file_size,
+				State.integrity, State.quick_xor_hash,
+				File.file_name, File.file_url, File.is_private
+			)
+			.where(
+				(State.status == STATUS_SYNCED)
+				& (State.is_evicted == 0)
+				# SharePoint holds archived Files only inside their document's ZIP
+				& (State.archive_entry.isnull() | (State.archive_entry == ""))
+				& (State.name > after)
+			)
+			.orderby(State.name)
+			.limit(BATCH_SIZE)
+		).run(as_dict=True)
+
+		if not rows:
+			return
+
+		for row in rows:
+			row.path = get_file_path(row)
+			if row.path and row.item_id:
+				yield row
+
+		after = rows[-1].name
+
+
+def evict_files(rows):
+	'''
+		Remove the local copies of verified Files and link them to the download endpoint
+	'''
+	shared = get_shared_file_urls(rows)
+	rows = [row for row in rows if row.file_url not in shared]
+	verified = verify_remote_copies(rows)
+	if not verified:
+		return
+
+	names = [row.name for row in verified]
+	update_file_urls({name: get_download_link(name) for name in names})
+
+	now = now_datetime()
+	State = frappe.qb.DocType(SYNC_STATE)
+	(
+		frappe.qb.update(State)
+		.set(State.is_evicted, 1)
+		.set(State.evicted_on, now)
+		.set(State.verified_on, now)
+		.where(State.name.isin(names))
+	).run()
+
+	for row in verified:
+		try:
+			os.remove(row.path)
+		except OSError as e:
+			frappe.log_error("Tiered Storage Eviction Error", f"File: {row.name}, Error: {str(e)}")
+
+	frappe.logger().info(f"[Tiered Storage] Evicted {len(verified)} file(s)")
+
+
+def get_shared_file_urls(rows):
+	'''
+		Frappe deduplicates uploads, so several Files can point to one path on disk
+	'''
+	counts = frappe.get_all(
+		"File",
+		filters={"file_url": ["in", list({row.file_url for row in rows})]},
+		fields=["file_url", "count(name) as count"],
+		group_by="file_url"
+	)
+	return {row.file_url for row in counts if row.count > 1}
+
+
+def verify_remote_copies(rows):
+	'''
+		Rows whose file SharePoint still holds at the local size and with the verified hash
+
+		Items are fetched per drive in one batch, concurrently with the async transport.
+	'''
+	from frappe_sharepoint.utils.sharepoint import SharePoint
+
+	by_drive = {}
+	for row in rows:
+		by_drive.setdefault(row.drive_id, []).append(row)
+
+	verified = []
+	for drive_id, drive_rows in by_drive.items():
+		items = SharePoint(drive_id=drive_id).get_drive_items([row.item_id for row in drive_rows], select="id,size,file")
+		for row in drive_rows:
+			item = items.get(row.item_id)
+			remote_hash = (((item or {}).get("file") or {}).get("hashes") or {}).get("quickXorHash")
+			if item and item.get("size") == row.size and row.quick_xor_hash and remote_hash == row.quick_xor_hash:
+				verified.append(row)
+			else:
+				frappe.logger().warning(f"[Tiered Storage] Not evicting {row.name}, remote copy missing or different")
+	return verified
+
+
+def get_cache_path(file_doc):
+	return frappe.get_site_path("private", CACHE_FOLDER, f"{file_doc.name}-{file_doc.file_name}")
+
+
+def get_cached_file(file_doc, settings):
+	'''
+		Path of an evicted File in the local download cache, pulling it from SharePoint on a miss
+
+		Returns None when the download fails, the caller then falls back to SharePoint.
+	'''
+	path = get_cache_path(file_doc)
+	if os.path.exists(path):
+		# Access time drives the cache's LRU order
+		os.utime(path)
+		return path
+
+	os.makedirs(os.path.dirname(path), exist_ok=True)
+	temp_path = f"{path}.{frappe.generate_hash(length=8)}.part"
+	try:
+		for refresh in (False, True):
+			# A stale cached URL is refreshed here, so the fallback does not reuse it
+			download_url = get_download_url(file_doc, refresh=refresh)
+			if not download_url:
+				return None
+			with requests.get(download_url, stream=True, timeout=30) as response:
+				if response.status_code in EXPIRED_URL_STATUSES and not refresh:
+					continue
+				if not response.ok:
+					frappe.log_error("Tiered Storage Download Error", f"File: {file_doc.name}, Status: {response.status_code}")
+					return None
+				with open(temp_path, "wb") as f:
+					for chunk in response.iter_content(DOWNLOAD_CHUNK_SIZE):
+						f.write(chunk)
+			os.replace(temp_path, path)
+			break
+	except (requests.RequestException, OSError) as e:
+		frappe.log_error("Tiered Storage Download Error", f"File: {file_doc.name}, Error: {str(e)}")
+		return None
+	finally:
+		if os.path.exists(temp_path):
+			os.remove(temp_path)
+
+	prune_cache(cint(settings.local_cache_budget) * 1024 * 1024, keep=path)
+	return path
+
+
+def prune_cache(budget, keep=None):
+	'''
+		Drop the least recently used cached files until the cache fits its budget
+	'''
+	folder = frappe.get_site_path("private", CACHE_FOLDER)
+	entries = []
+	for entry in os.scandir(folder):
+		if entry.is_file() and not entry.name.endswith(".part"):
+			stat = entry.stat()
+			entries.append((stat.st_mtime, stat.st_size, entry.path))
+
+	total = sum(entry[1] for entry in entries)
+	for mtime, size, path in sorted(entries):
+		if total <= budget:
+			break
+		if path == keep:
+			continue
+		try:
+			os.remove(path)
+			total -= size
+		except OSError:
+			pass
@@ -0,0 +1,131 @@
+import frappe
+from frappe.utils import cint
+from frappe_sharepoint.utils.document_upload import get_file_path
+from frappe_sharepoint.utils.job_routing import LANE_FAST, LANE_LARGE, LANE_STANDARD, enqueue_file_upload, get_lane_queue
+from frappe_sharepoint.utils.sync_state import SYNC_STATE, get_awaiting_files, mark_files_failed, mark_files_pending, mark_files_queued
+import time
+
+'''
+	Backpressure for uploads of newly attached files
+
+	A data import can attach hundreds of thousands of files within minutes.
+	Enqueueing one job per file would fill Redis and hold up every other
+	queue on the bench. Once the upload queues hold more than the Queue
+	Depth Limit, new files only get a Pending Sync State awaiting the
+	queue, and a scheduled drainer enqueues them in batches as the queues
+	empty. Files keep being held back until the backlog is drained, so they
+	are queued in the order they were attached.
+'''
+
+SETTINGS = "SharePoint Settings"
+# Set while Files are held back, cleared by the drainer once none are left
+BACKLOG_KEY = "sharepoint_upload_backlog"
+
+DEFAULT_MAX_QUEUED_UPLOADS = 10000
+DEFAULT_DRAIN_BATCH_SIZE = 500
+# A worker process reuses the queue depth it read for this many seconds
+QUEUE_DEPTH_TTL = 2
+
+_queue_depth = {}
+
+
+def get_queue_limit(settings):
+	value = settings.get("max_queued_uploads")
+	return DEFAULT_MAX_QUEUED_UPLOADS if value is None else cint(value)
+
+
+def get_queue_depth(settings, max_age=QUEUE_DEPTH_TTL):
+	'''
+		Jobs waiting in the queues of the upload lanes
+	'''
+	if _queue_depth and time.monotonic() - _queue_depth["read_at"] < max_age:
+		return _queue_depth["depth"]
+
+	from frappe.utils.background_jobs import get_queue
+
+	depth = 0
+	for queue in {get_lane_queue(settings, lane) for lane in (LANE_FAST, LANE_STANDARD, LANE_LARGE)}:
+		try:
+			depth += get_queue(queue).count
+		except Exception as e:
+			frappe.logger().warning(f"[Upload Backlog] Could not read the length of queue {queue}: {str(e)}")
+
+	_queue_depth.update(depth=depth, read_at=time.monotonic())
+	return depth
+
+
+def should_hold_upload(settings):
+	'''
+		Whether a newly attached file has to wait instead of being enqueued now
+	'''
+	limit = get_queue_limit(settings)
+	if not limit:
+		return False
+	if frappe.cache().get_value(BACKLOG_KEY):
+		return True
+	if get_queue_depth(settings) < limit:
+		return False
+
+	frappe.logger().info(f"[Upload Backlog] Upload queues hold {limit} or more jobs, holding new uploads back")
+	frappe.cache().set_value(BACKLOG_KEY, 1)
+	return True
+
+
+def hold_upload(file_doc):
+	mark_files_pending([file_doc])
+
+
+def drain_pending_uploads():
+	'''
+		Scheduled job: enqueue held back uploads while the upload queues have room
+	'''
+	if not frappe.cache().get_value(BACKLOG_KEY):
+		return
+
+	settings = frappe.get_single(SETTINGS)
+	if not settings.enable_file_sync:
+		return
+
+	limit = get_queue_limit(settings)
+	batch_size = cint(settings.get("drain_batch_size")) or DEFAULT_DRAIN_BATCH_SIZE
+	room = limit - get_queue_depth(settings, max_age=0) if limit else batch_size
+	queued = 0
+
+	while room > 0:
+		rows = get_awaiting_files(min(room, batch_size))
+		if not rows:
+			frappe.cache().delete_value(BACKLOG_KEY)
+			frappe.logger().info(f"[Upload Backlog] Backlog drained")
+			break
+
+		enqueued, unavailable, dropped = [], [], []
+		for row in rows:
+			# Deleted or uploaded some other way in the meantime
+			if not row.file or row.uploaded_to_sharepoint:
+				dropped.append(row.name)
+				continue
+
+			filepath = get_file_path(row)
+			if not filepath:
+				unavailable.append(row.name)
+				continue
+
+			enqueue_file_upload(
+				doctype=row.attached_to_doctype,
+				docname=row.attached_to_name,
+				filepath=filepath,
+				filedoc=row.file,
+				settings=settings
+			)
+			enqueued.append(row.name)
+
+		mark_files_queued(enqueued)
+		mark_files_failed(unavailable, "No local copy to upload")
+		if dropped:
+			frappe.db.delete(SYNC_STATE, {"name": ("in", dropped)})
+		frappe.db.commit()
+		queued += len(enqueued)
+		room -= len(rows)
+
+	if queued:
+		frappe.logger().info(f"[Upload Backlog] Queued {queued} held back upload(s)")
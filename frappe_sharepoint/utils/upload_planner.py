@@ -0,0 +1,522 @@
+import frappe
+from frappe.query_builder import Case
+from frappe.query_builder.functions import Coalesce, Count, Floor, Length, Sum
+from frappe.utils import cint, flt, get_time
+from frappe_sharepoint.controllers.file_controller import INTERNAL_DOCTYPES
+from frappe_sharepoint.utils.attachment_archive import (
+	DEFAULT_ARCHIVE_THRESHOLD_KB,
+	MIN_ARCHIVE_FILES,
+	get_archive_threshold,
+)
+from frappe_sharepoint.utils.bandwidth import get_bandwidth_limits
+from frappe_sharepoint.utils.drive_routing import ROUTE_BY_COMPANY, resolve_drive_route
+from frappe_sharepoint.utils.folder_template import (
+	get_document_fields,
+	get_folder_path,
+	get_folder_template,
+	parse_folder_template,
+	uses_field,
+)
+from frappe_sharepoint.utils.folder_tree import GRAPH_BATCH_SIZE
+from frappe_sharepoint.utils.job_routing import (
+	LANE_FAST,
+	LANE_LARGE,
+	LANE_STANDARD,
+	get_large_file_threshold,
+	get_small_file_threshold,
+	get_upload_throughput,
+)
+from frappe_sharepoint.utils.sync_state import STATUS_SYNCED, SYNC_STATE
+from pypika.terms import Field
+import hashlib
+import json
+import math
+
+'''
+	Dry-run plans for bulk uploads and backfills
+
+	A plan reads the selected documents and Files from the database only,
+	it sends nothing to SharePoint. Files are summed up by SQL per document
+	type, lane and duplicate status; documents are read in pages to count
+	their folders, so memory stays bounded for tens of millions of them. It reports the folders to create, the files
+	by upload lane, the bytes, the Graph requests each upload strategy
+	would send and how long that would take at the measured throughput:
+
+		bench --site <site> execute frappe_sharepoint.utils.upload_planner.plan_file_backfill
+		bench --site <site> execute frappe_sharepoint.utils.upload_planner.plan_bulk_upload --kwargs "{'doctype': 'Expense Claim'}"
+
+	Folders are counted as existing when the drive mirror knows them.
+	Beyond EXACT_FOLDER_LIMIT folders per drive and level, the counts are
+	HyperLogLog estimates.
+	Request counts follow the code paths of the app; durations are
+	estimates, SharePoint's own throttling varies by tenant.
+'''
+
+SETTINGS = "SharePoint Settings"
+MIRROR = "SharePoint Drive Item"
+
+STRATEGY_PER_FILE = "per_file"
+STRATEGY_BULK = "bulk"
+STRATEGY_BULK_ARCHIVE = "bulk_archive"
+
+# Files and documents read per query
+BATCH_SIZE = 1000
+# Assumed size of a rendered document PDF
+DEFAULT_PDF_SIZE_KB = 100
+# Round trip of a Graph request that carries little data
+REQUEST_LATENCY = 0.25
+# Requests per minute the app is assumed to be allowed, tenants differ
+DEFAULT_REQUEST_BUDGET = 600
+# A server-side copy: the copy, one status poll and reading the new item
+COPY_REQUESTS = 3
+# Overhead of one stored ZIP entry and of the archive itself, without names
+ARCHIVE_ENTRY_OVERHEAD = 30 + 16 + 46 + 64
+ARCHIVE_OVERHEAD = 22 + 1024
+# Distinct folders per drive and level counted exactly, larger counts are estimated
+EXACT_FOLDER_LIMIT = 100000
+# HyperLogLog registers are 2^precision bytes, the estimate is within about 1%
+HLL_PRECISION = 14
+
+
+class DistinctCounter(object):
+	'''
+		Number of distinct values, exact up to EXACT_FOLDER_LIMIT, then a HyperLogLog estimate in fixed memory
+	'''
+	def __init__(self):
+		self.values = set()
+		self.registers = None
+
+	def add(self, value):
+		if self.registers is not None:
+			self.add_hashed(value)
+			return
+
+		self.values.add(value)
+		if len(self.values) > EXACT_FOLDER_LIMIT:
+			self.registers = bytearray(1 << HLL_PRECISION)
+			for known in self.values:
+				self.add_hashed(known)
+			self.values = None
+
+	def add_hashed(self, value):
+		hashed = int.from_bytes(hashlib.blake2b(value.encode("utf-8"), digest_size=8).digest(), "big")
+		rest_bits = 64 - HLL_PRECISION
+		index = hashed >> rest_bits
+		rank = rest_bits - (hashed & ((1 << rest_bits) - 1)).bit_length() + 1
+		if rank > self.registers[index]:
+			self.registers[index] = rank
+
+	def count(self):
+		if self.registers is None:
+			return len(self.values)
+
+		registers = len(self.registers)
+		alpha = 0.7213 / (1 + 1.079 / registers)
+		estimate = alpha * registers * registers / sum(2.0 ** -rank for rank in self.registers)
+		empty = self.registers.count(0)
+		if estimate <= 2.5 * registers and empty:
+			estimate = registers * math.log(registers / empty)
+		return int(round(estimate))
+
+
+class UploadPlan(object):
+	'''
+		Counts collected for a plan, from aggregated File queries and pages of documents
+	'''
+	def __init__(self, settings):
+		self.settings = settings
+		self.small_threshold = get_small_file_threshold(settings)
+		self.large_threshold = get_large_file_threshold(settings)
+		self.chunk_size = get_upload_chunk_size()
+		self.folder_template = get_folder_template(settings)
+		self.segments = parse_folder_template(self.folder_template)
+		self.company_routes = any(route.route_by == ROUTE_BY_COMPANY for route in settings.get("drive_routes") or [])
+		self.documents = 0
+		# (drive ID, level) -> DistinctCounter of all and of mirrored folder paths
+		self.folders = {}
+		self.mirrored_folders = {}
+		self.lanes = {lane: {"files": 0, "bytes": 0} for lane in (LANE_FAST, LANE_STANDARD, LANE_LARGE)}
+		self.duplicates = {"files": 0, "bytes": 0}
+		self.upload_requests = 0
+		self.archive_saved = 0
+		self.archive_bytes = 0
+
+	def add_documents(self, doctype, names):
+		'''
+			Count a page of documents and the folders of their paths
+
+			Reads the fields the folder template and the drive routes need
+			for the whole page in one query, the module once per page.
+		'''
+		if not names:
+			return
+
+		fields = get_document_fields(self.segments, doctype)
+		if self.company_routes and frappe.get_meta(doctype).has_field("company"):
+			fields = list(dict.fromkeys(fields + ["company"]))
+		rows = {
+			row.name: row for row in frappe.get_all(doctype, filters={"name": ["in", names]}, fields=["name"] + fields)
+		} if fields else {}
+		module = frappe.db.get_value("DocType", doctype, "module") if uses_field(self.segments, "module") else None
+
+		paths = {}
+		for name in names:
+			row = rows.get(name) or {}
+			route = resolve_drive_route(self.settings, doctype, name, company=row.get("company") or "")
+			root = [segment for segment in (route.root_folder_path or "").strip("/").split("/") if segment]
+			path = tuple(root + get_folder_path(self.folder_template, doctype, name, field_values=dict(row, module=module)))
+			drive_paths = paths.setdefault(route.drive_id, set())
+			for depth in range(1, len(path) + 1):
+				drive_paths.add(path[:depth])
+
+		for drive_id, drive_paths in paths.items():
+			known = get_mirrored_folder_paths(drive_id, drive_paths)
+			for path in drive_paths:
+				key = (drive_id, len(path))
+				self.folders.setdefault(key, DistinctCounter()).add("/".join(path))
+				if path in known:
+					self.mirrored_folders.setdefault(key, DistinctCounter()).add("/".join(path))
+
+		self.documents += len(names)
+
+	def add_files(self, criterion):
+		'''
+			Add the Files matching criterion, summed up by lane and duplicate status in one query
+		'''
+		File = frappe.qb.DocType("File")
+		file_size = Coalesce(File.file_size, 0)
+		lane = (
+			Case()
+			.when(file_size >= self.large_threshold, LANE_LARGE)
+			.when(file_size <= self.small_threshold, LANE_FAST)
+			.else_(LANE_STANDARD)
+		)
+		duplicate = Case().when(File.content_hash.isin(get_synced_hashes_query()), 1).else_(0)
+		rows = (
+			frappe.qb.from_(File)
+			.select(
+				lane.as_("lane"),
+				duplicate.as_("duplicate"),
+				Count("*").as_("files"),
+				Sum(file_size).as_("bytes"),
+				Sum(self.get_upload_requests_term(file_size)).as_("requests")
+			)
+			.where(criterion)
+			.groupby(Field("lane"), Field("duplicate"))
+		).run(as_dict=True)
+
+		for row in rows:
+			if cint(row.duplicate):
+				self.duplicates["files"] += cint(row.files)
+				self.duplicates["bytes"] += cint(row.bytes)
+				continue
+			self.lanes[row.lane]["files"] += cint(row.files)
+			self.lanes[row.lane]["bytes"] += cint(row.bytes)
+			self.upload_requests += cint(row.requests)
+
+	def add_archive_savings(self, doctype, criterion):
+		'''
+			Requests saved and bytes added when the small attachments of each document go into one ZIP
+
+			Summed up by the database over one row per document with enough
+			small attachments, duplicates left out as they are copied instead.
+		'''
+		File = frappe.qb.DocType("File")
+		file_size = Coalesce(File.file_size, 0)
+		documents = (
+			frappe.qb.from_(File)
+			.select(
+				Count("*").as_("small_files"),
+				Sum(file_size).as_("small_bytes"),
+				Sum(Length(Coalesce(File.file_name, ""))).as_("small_names")
+			)
+			.where(
+				criterion
+				& (file_size < self.get_archive_threshold(doctype))
+				& Coalesce(File.content_hash, "").notin(get_synced_hashes_query())
+			)
+			.groupby(File.attached_to_name)
+			.having(Count("*") >= MIN_ARCHIVE_FILES)
+		)
+		archive_size = (
+			ARCHIVE_OVERHEAD + documents.small_bytes
+			+ documents.small_files * ARCHIVE_ENTRY_OVERHEAD + 2 * documents.small_names
+		)
+		rows = (
+			frappe.qb.from_(documents)
+			.select(
+				Sum(documents.small_files - self.get_upload_requests_term(archive_size)).as_("saved"),
+				Sum(archive_size - documents.small_bytes).as_("added")
+			)
+		).run(as_dict=True)
+
+		if rows:
+			self.archive_saved += cint(rows[0].saved)
+			self.archive_bytes += cint(rows[0].added)
+
+	def get_upload_requests(self, file_size):
+		'''
+			One PUT, or an upload session and a PUT per chunk
+		'''
+		if file_size < self.large_threshold:
+			return 1
+		return 1 + math.ceil(file_size / self.chunk_size)
+
+	def get_upload_requests_term(self, file_size):
+		'''
+			get_upload_requests as an SQL expression
+		'''
+		return (
+			Case()
+			.when(file_size < self.large_threshold, 1)
+			.else_(1 + Floor((file_size + self.chunk_size - 1) / self.chunk_size))
+		)
+
+	def get_archive_threshold(self, doctype):
+		# Document types without an archive rule are planned as if they had the default one
+		return get_archive_threshold(self.settings, doctype) or DEFAULT_ARCHIVE_THRESHOLD_KB * 1024
+
+	def get_folder_counts(self):
+		'''
+			Folders to create per level, the ones in the drive mirror excluded
+		'''
+		total, existing, levels = 0, 0, {}
+		for (drive_id, depth), folders in self.folders.items():
+			mirrored = self.mirrored_folders.get((drive_id, depth))
+			count = folders.count()
+			known = min(mirrored.count(), count) if mirrored else 0
+			total += count
+			existing += known
+			if count > known:
+				levels[depth] = levels.get(depth, 0) + count - known
+		return total, existing, levels
+
+	def get_plan(self, pdf_requests=0, pdf_bytes=0, workers=1, request_budget=DEFAULT_REQUEST_BUDGET):
+		total_folders, existing_folders, levels = self.get_folder_counts()
+		to_create = sum(levels.values())
+		file_bytes = sum(lane["bytes"] for lane in self.lanes.values())
+		upload_requests = self.upload_requests + self.duplicates["files"] * COPY_REQUESTS
+
+		# Per file jobs look each folder up and then create it
+		per_file = self.get_estimate(upload_requests + pdf_requests + 2 * to_create, file_bytes + pdf_bytes, workers, request_budget)
+		batched_folders = sum(math.ceil(count / GRAPH_BATCH_SIZE) for count in levels.values())
+		bulk_requests = upload_requests + pdf_requests + batched_folders
+		bulk = self.get_estimate(bulk_requests, file_bytes + pdf_bytes, workers, request_budget)
+		bulk_archive = self.get_estimate(bulk_requests - self.archive_saved, file_bytes + pdf_bytes + self.archive_bytes, workers, request_budget)
+
+		return {
+			"documents": self.documents,
+			"files": sum(lane["files"] for lane in self.lanes.values()) + self.duplicates["files"],
+			"bytes": file_bytes + self.duplicates["bytes"],
+			"lanes": self.lanes,
+			"duplicates": self.duplicates,
+			"folders": {"total": total_folders, "existing": existing_folders, "to_create": to_create, "levels": len(levels)},
+			"throughput_kbps": round(self.get_throughput(workers) / 1024, 1),
+			"request_budget_per_minute": request_budget,
+			"window_hours_per_day": round(get_window_hours(self.settings), 2),
+			"strategies": {
+				STRATEGY_PER_FILE: per_file,
+				STRATEGY_BULK: bulk,
+				STRATEGY_BULK_ARCHIVE: bulk_archive
+			}
+		}
+
+	def get_throughput(self, workers):
+		'''
+			Bytes per second of the given workers together, within the bandwidth caps
+		'''
+		shared_limit, worker_limit = get_bandwidth_limits(self.settings)
+		per_worker = get_upload_throughput(self.settings)
+		if worker_limit:
+			per_worker = min(per_worker, worker_limit)
+		throughput = per_worker * workers
+		return min(throughput, shared_limit) if shared_limit else throughput
+
+	def get_estimate(self, requests, bytes_sent, workers, request_budget):
+		'''
+			Requests and duration of one strategy
+
+			The duration is the longer of the transfer time, with request
+			latency spread over the workers, and the time the request budget
+			allows for that many requests.
+		'''
+		transfer = bytes_sent / self.get_throughput(workers) + requests * REQUEST_LATENCY / workers
+		throttled = requests * 60 / request_budget
+		hours = max(transfer, throttled) / 3600
+
+		estimate = {
+			"requests": requests,
+			"bytes": bytes_sent,
+			"hours": round(hours, 2),
+			"bound_by": "request budget" if throttled > transfer else "transfer"
+		}
+		window_hours = get_window_hours(self.settings)
+		if window_hours < 24:
+			estimate["days"] = round(hours / window_hours, 1) if window_hours else None
+		return estimate
+
+
+def get_upload_chunk_size():
+	from frappe_sharepoint.utils.sharepoint import UPLOAD_CHUNK_SIZE
+	return UPLOAD_CHUNK_SIZE
+
+
+def get_mirrored_folder_paths(drive_id, paths):
+	'''
+		The folder paths among paths that the drive mirror knows
+	'''
+	by_remote_path = {"/" + "/".join(path): path for path in paths}
+	remote_paths = list(by_remote_path)
+	known = set()
+	for start in range(0, len(remote_paths), BATCH_SIZE):
+		rows = frappe.get_all(
+			MIRROR,
+			filters={"drive_id": drive_id, "is_folder": 1, "remote_path": ["in", remote_paths[start:start + BATCH_SIZE]]},
+			pluck="remote_path"
+		)
+		known.update(by_remote_path[remote_path] for remote_path in rows)
+	return known
+
+
+def get_window_hours(settings):
+	'''
+		Hours per day the upload windows are open, 24 without windows
+	'''
+	windows = settings.get("upload_windows") or []
+	if not windows:
+		return 24
+
+	hours = 0
+	for window in windows:
+		start, end = get_time(window.from_time), get_time(window.to_time)
+		span = (end.hour * 60 + end.minute) - (start.hour * 60 + start.minute)
+		hours += (span if span > 0 else span + 24 * 60) / 60
+	return min(hours, 24)
+
+
+def get_synced_hashes_query():
+	'''
+		Content hashes that a synced File already has, as a subquery
+	'''
+	State = frappe.qb.DocType(SYNC_STATE)
+	return (
+		frappe.qb.from_(State)
+		.select(State.content_hash)
+		.where(
+			(State.status == STATUS_SYNCED)
+			& State.content_hash.notnull()
+			& (State.archive_entry.isnull() | (State.archive_entry == ""))
+		)
+	)
+
+
+def iter_pages(table, column, criterion=None):
+	'''
+		Distinct values of a column in pages of BATCH_SIZE, read with keyset pagination
+	'''
+	after = ""
+	while True:
+		condition = column > after
+		if criterion is not None:
+			condition = criterion & condition
+		values = [
+			row[0] for row in
+			frappe.qb.from_(table).select(column).distinct().where(condition).orderby(column).limit(BATCH_SIZE).run()
+		]
+		if not values:
+			return
+		yield values
+		after = values[-1]
+
+
+@frappe.whitelist()
+def plan_bulk_upload(doctype, names=None, pdf_size_kb=DEFAULT_PDF_SIZE_KB, workers=1, request_budget=DEFAULT_REQUEST_BUDGET):
+	'''
+		Plan the bulk upload of documents with their PDFs and attachments, without uploading
+
+		Args:
+			doctype: Document type
+			names: Documents to plan, all documents of the type when not given
+			pdf_size_kb: Assumed size of each rendered PDF
+			workers: Bulk jobs running side by side
+			request_budget: Graph requests per minute the app may send
+
+		Returns:
+			dict: The plan, see UploadPlan.get_plan
+	'''
+	frappe.only_for("System Manager")
+	if isinstance(names, str):
+		names = json.loads(names)
+
+	plan = UploadPlan(frappe.get_single(SETTINGS))
+	File = frappe.qb.DocType("File")
+	attachments = (File.attached_to_doctype == doctype) & (File.is_folder == 0)
+
+	if names:
+		names = list(dict.fromkeys(names))
+		for start in range(0, len(names), BATCH_SIZE):
+			batch = names[start:start + BATCH_SIZE]
+			plan.add_documents(doctype, batch)
+			plan.add_files(attachments & File.attached_to_name.isin(batch))
+			plan.add_archive_savings(doctype, attachments & File.attached_to_name.isin(batch))
+	else:
+		Document = frappe.qb.DocType(doctype)
+		for batch in iter_pages(Document, Document.name):
+			plan.add_documents(doctype, batch)
+		# Attachments of deleted documents are not uploaded
+		attachments = attachments & File.attached_to_name.isin(frappe.qb.from_(Document).select(Document.name))
+		plan.add_files(attachments)
+		plan.add_archive_savings(doctype, attachments)
+
+	pdf_size = cint(pdf_size_kb) * 1024
+	result = plan.get_plan(
+		pdf_requests=plan.documents * plan.get_upload_requests(pdf_size),
+		pdf_bytes=plan.documents * pdf_size,
+		workers=cint(workers) or 1,
+		request_budget=flt(request_budget) or DEFAULT_REQUEST_BUDGET
+	)
+	return result
+
+
+@frappe.whitelist()
+def plan_file_backfill(doctype=None, workers=1, request_budget=DEFAULT_REQUEST_BUDGET):
+	'''
+		Plan uploading the attachments that are not in SharePoint yet, without uploading
+
+		Files are summed up by the database and their documents read in
+		pages, so the plan also works for tens of millions of them.
+
+		Args:
+			doctype: Only plan the attachments of this document type
+			workers: Upload workers running side by side
+			request_budget: Graph requests per minute the app may send
+
+		Returns:
+			dict: The plan, see UploadPlan.get_plan
+	'''
+	frappe.only_for("System Manager")
+	plan = UploadPlan(frappe.get_single(SETTINGS))
+	File = frappe.qb.DocType("File")
+	pending = (
+		(File.uploaded_to_sharepoint == 0)
+		& (File.is_folder == 0)
+		& File.attached_to_doctype.notnull()
+		& File.attached_to_name.notnull()
+		& File.attached_to_doctype.notin(list(INTERNAL_DOCTYPES))
+	)
+	if doctype:
+		pending = pending & (File.attached_to_doctype == doctype)
+
+	plan.add_files(pending)
+	for doctypes in iter_pages(File, File.attached_to_doctype, pending):
+		for attached_to_doctype in doctypes:
+			attachments = pending & (File.attached_to_doctype == attached_to_doctype)
+			plan.add_archive_savings(attached_to_doctype, attachments)
+			# Files of removed document types have no folder template fields to read
+			if not frappe.db.exists("DocType", attached_to_doctype):
+				continue
+			for names in iter_pages(File, File.attached_to_name, attachments):
+				plan.add_documents(attached_to_doctype, names)
+
+	result = plan.get_plan(workers=cint(workers) or 1, request_budget=flt(request_budget) or DEFAULT_REQUEST_BUDGET)
+	return result
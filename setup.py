@@ -15,5 +15,7 @@ setup(
 	packages=find_packages(),
 	zip_safe=False,
 	include_package_data=True,
-	install_requires=install_requires
+	install_requires=install_requires,
+	# Async bulk transport, see the README
+	extras_require={"async": ["aiohttp"]}
 )